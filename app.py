@@ -2,6 +2,7 @@
 import streamlit as st
 import pandas as pd
 from src.infra.repositorio_dados import carregar_dados_processados_sngpc
+from src.utils.database_utils import versao_dados
 from src.utils.ui_utils import svg_to_data_uri, SVG_ICONS, base64
 
 # --- Ícones SVG Minimalistas (codificados em base64 para incorporar em HTML) ---
@@ -111,7 +112,8 @@ def configurar_pagina_global():
     """, unsafe_allow_html=True)
 
 @st.cache_data(ttl=3600, show_spinner="Carregando dados principais do banco de dados...")
-def carregar_dados_para_sessao():
+def carregar_dados_para_sessao(versao):
+    # `versao` (versao_dados()) só entra na chave do cache: uma nova publicação recarrega os dados
     try:
         df = carregar_dados_processados_sngpc() 
         if df.empty:
@@ -131,7 +133,7 @@ def carregar_dados_para_sessao():
         
     except FileNotFoundError as e:
         st.error(f"ERRO CRÍTICO AO ACESSAR O BANCO DE DADOS: {e}")
-        st.info("Verifique se o arquivo do banco de dados DuckDB ('sngpc_analytics.duckdb') existe na pasta 'dados/' e se o script de ingestão ('ingest_to_duckdb.py') foi executado corretamente.")
+        st.info("Verifique se o ETL ('scripts/etl.py') foi executado corretamente: o dashboard lê a versão publicada em 'dados/versoes/' ou, sem publicação, 'dados/sngpc_analytics.duckdb'.")
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Erro inesperado ao carregar dados da sessão: {type(e).__name__} - {str(e)}")
@@ -141,7 +143,7 @@ def carregar_dados_para_sessao():
 configurar_pagina_global()
 
 if 'df_principal' not in st.session_state:
-    st.session_state.df_principal = carregar_dados_para_sessao()
+    st.session_state.df_principal = carregar_dados_para_sessao(versao_dados())
 
 # --- Conteúdo da Página Principal (Refatorado com Design Clean) ---
 if 'df_principal' not in st.session_state or st.session_state.df_principal.empty:
@@ -1,154 +1,211 @@
 # Pagina para exploraçao de dados
 
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from src.utils.database_utils import (
-    get_duckdb_connection,
     build_where_clause,
     carregar_opcoes_filtro_do_db,
-    TABLE_NAME
+    consultar_df,
+    TABLE_NAME,
+    TABLE_AGREGADO,
+    TAMANHO_POOL_CURSORES
 )
+from src.utils.agregados_utils import consulta_roteada, consulta_multimetricas, separar_conjuntos, consulta_contagem_por_idade, estatisticas_idade
+
+# --- Consultas dos widgets (rodam no pool de threads da página; não chamam st.*) ---
 
-# --- Funções SQL para Métricas e Gráficos ---
+def cubo_disponivel():
+    """
+    Se a versão dos dados em uso tem o cubo agregado. Verificado uma vez por execução da página
+    e repassado às consultas, que então são montadas sem emprestar um cursor; o resultado fica
+    no cache de consultas, então cada versão dos dados vai ao banco uma única vez.
+    """
+    return consultar_df("SELECT COUNT(*) AS n FROM duckdb_tables() WHERE table_name = ?", [TABLE_AGREGADO]).iloc[0, 0] > 0
 
-@st.cache_data(show_spinner="Buscando amostra de dados...")
-def fetch_sample_data_from_duckdb(filtros, tabela=TABLE_NAME, limit=1000):
-    conn = get_duckdb_connection()
-    if conn is None: return pd.DataFrame()
+def consultar_amostra(filtros, tabela=TABLE_NAME, limit=1000):
     where_clause, params = build_where_clause(filtros)
-    query = f"SELECT * FROM {tabela} {where_clause} LIMIT {limit};"
+    return consultar_df(f"SELECT * FROM {tabela} {where_clause} LIMIT {limit};", params)
+
+# Agrupamentos das métricas de visão geral e dos insights, calculados juntos em uma varredura
+CONJUNTOS_RESUMO = {
+    'geral': (),
+    'municipio': ('nome_municipio',),
+    'principio_ano': ('principio_ativo', 'ano'),
+    'faixa_etaria': ('faixa_etaria',),
+    'ano': ('ano',),
+}
+MEDIDAS_RESUMO = {
+    'total': "{registros}",
+    'municipios_unicos': "COUNT(DISTINCT nome_municipio)",
+    'principios_unicos': "COUNT(DISTINCT principio_ativo)",
+}
+
+def consultar_resumo(filtros, agregado, tabela=TABLE_NAME):
+    """
+    Uma consulta GROUPING SETS para as métricas de visão geral e os insights automáticos.
+    Retorna {conjunto: DataFrame} (ver CONJUNTOS_RESUMO).
+    """
+    query, params, _ = consulta_multimetricas(None, CONJUNTOS_RESUMO, MEDIDAS_RESUMO, filtros, tabela=tabela, agregado=agregado)
+    return separar_conjuntos(consultar_df(query, params), CONJUNTOS_RESUMO)
+
+def consultar_top_principios(filtros, agregado, tabela=TABLE_NAME):
+    query, params, _ = consulta_roteada(None, 'SELECT principio_ativo AS "Princípio Ativo", {registros} AS "Total" FROM {tabela} {where} AND principio_ativo IS NOT NULL GROUP BY "Princípio Ativo" ORDER BY "Total" DESC LIMIT 10;', filtros, ['principio_ativo'], tabela=tabela, agregado=agregado)
+    return consultar_df(query, params)
+
+def consultar_evolucao_temporal(filtros, agregado, tabela=TABLE_NAME):
+    query, params, _ = consulta_roteada(None, "SELECT strftime(data, '%Y-%m-01') AS mes_ano, {quantidade} AS total_quantidade_vendida FROM {tabela} {where} AND data IS NOT NULL GROUP BY mes_ano HAVING total_quantidade_vendida IS NOT NULL ORDER BY mes_ano ASC;", filtros, ['data'], tabela=tabela, agregado=agregado)
+    return consultar_df(query, params)
+
+def consultar_distribuicao_idades(filtros, agregado, tabela=TABLE_NAME):
+    # Uma consulta (no cubo, soma dos histogramas por idade); faixas e estatísticas saem da contagem
+    query, params = consulta_contagem_por_idade(None, filtros, tabela, agregado=agregado)
+    return consultar_df(query, params)
+
+def consultar_contagem_faixa_etaria(filtros, agregado, tabela=TABLE_NAME):
+    query, params, _ = consulta_roteada(None, "SELECT faixa_etaria, {registros} AS count FROM {tabela} {where} AND faixa_etaria IS NOT NULL AND faixa_etaria != 'Desconhecida' GROUP BY faixa_etaria ORDER BY faixa_etaria;", filtros, ['faixa_etaria'], tabela=tabela, agregado=agregado)
+    return consultar_df(query, params)
+
+def consultar_comparativo(filtros, agregado, group_by_col, tabela=TABLE_NAME):
+    """Dados do comparativo 2019 x 2020; None quando o comparativo por princípio ativo não tem princípios selecionados."""
+    if group_by_col == 'Total':
+        query, params, _ = consulta_roteada(None, 'SELECT ano, {quantidade} AS "Valor" FROM {tabela} {where} AND ano IN (2019, 2020) GROUP BY ano HAVING "Valor" IS NOT NULL;',
+                                            filtros, ['ano'], exclude_filters=['ano'], tabela=tabela, agregado=agregado)
+    else:
+        if group_by_col == 'principio_ativo' and not filtros.get('principio_ativo'):
+            return None
+        modelo = f'SELECT ano, "{group_by_col}", {{registros}} AS "Valor" FROM {{tabela}} {{where}} AND ano IN (2019, 2020) AND "{group_by_col}" IS NOT NULL GROUP BY ano, "{group_by_col}" ORDER BY "{group_by_col}", ano;'
+        query, params, _ = consulta_roteada(None, modelo, filtros, ['ano', group_by_col], exclude_filters=['ano'], tabela=tabela, agregado=agregado)
+    return consultar_df(query, params)
+
+# --- Execução concorrente das consultas da página ---
+
+def _cronometrar(consulta):
+    inicio = time.perf_counter()
+    resultado = consulta()
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+def submeter_consultas(consultas, max_workers=TAMANHO_POOL_CURSORES):
+    """
+    Submete de uma vez as consultas dos widgets (nome -> função sem argumentos) a um pool de
+    threads desta execução da página e retorna (executor, {nome: Future}); cada Future resulta
+    em (resultado, ms). O DuckDB libera o GIL durante a consulta, então elas rodam em paralelo,
+    cada uma no seu cursor. As threads herdam o contexto da sessão para usar os caches do st.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="consultas_exploracao",
+                                  initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx()))
+    return executor, {nome: executor.submit(_cronometrar, consulta) for nome, consulta in consultas.items()}
+
+@contextmanager
+def medir_widget(nome):
+    """Registra em st.session_state['tempos_widgets'] o tempo (ms) gasto no bloco do widget."""
+    inicio = time.perf_counter()
     try:
-        return conn.execute(query, params).fetchdf()
-    except Exception as e:
-        st.error(f"Erro ao buscar amostra de dados: {e}")
-        return pd.DataFrame()
+        yield
+    finally:
+        st.session_state.setdefault('tempos_widgets', {})[nome] = (time.perf_counter() - inicio) * 1000
 
-@st.cache_data(show_spinner="Calculando métricas...")
-def get_visao_geral_metricas(filtros, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return 0, 0, 0
-    where_clause, params = build_where_clause(filtros)
+def renderizar_widget(nome, futuro, renderizar, mensagem_erro):
+    """Espera a consulta do widget e o desenha; os tempos vão para st.session_state ('tempos_consultas' e 'tempos_widgets')."""
     try:
-        total_registros = conn.execute(f"SELECT COUNT(*) FROM {tabela} {where_clause};", params).fetchone()[0]
-        municipios_unicos = conn.execute(f"SELECT COUNT(DISTINCT nome_municipio) FROM {tabela} {where_clause} AND nome_municipio IS NOT NULL;", params).fetchone()[0]
-        principios_unicos = conn.execute(f"SELECT COUNT(DISTINCT principio_ativo) FROM {tabela} {where_clause} AND principio_ativo IS NOT NULL;", params).fetchone()[0]
+        resultado, ms = futuro.result()
+        st.session_state.setdefault('tempos_consultas', {})[nome] = ms
+        with medir_widget(nome):
+            renderizar(resultado)
     except Exception as e:
-        st.error(f"Erro ao calcular métricas: {e}")
-        return 0, 0, 0
-    return total_registros, municipios_unicos, principios_unicos
-
-@st.cache_data(show_spinner="Gerando gráfico de Top 10...")
-def plot_top_principios_sql(filtros, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return
-    where_clause, params = build_where_clause(filtros)
-    query = f'SELECT principio_ativo AS "Princípio Ativo", COUNT(*) AS "Total" FROM {tabela} {where_clause} AND principio_ativo IS NOT NULL GROUP BY "Princípio Ativo" ORDER BY "Total" DESC LIMIT 10;'
-    try:
-        top_meds_df = conn.execute(query, params).fetchdf()
-        if top_meds_df.empty:
-            st.info("Nenhum dado de princípios ativos encontrado com os filtros selecionados para o top 10.")
-            return
-        fig = px.bar(top_meds_df, x='Total', y='Princípio Ativo', orientation='h', text_auto='.2s')
-        fig.update_layout(
-            title_text='Top 10 Princípios Ativos Mais Prescritos', title_font_size=16, title_x=0.5,
-            yaxis={'categoryorder':'total ascending'}, margin=dict(l=0, r=0, t=40, b=0)
-        )
-        fig.update_traces(hovertemplate="%{y}<br>Total: %{x:,} prescrições", marker_color='#3498db')
-        st.plotly_chart(fig, use_container_width=True)
-    except Exception as e: st.error(f"Erro ao gerar top princípios ativos: {e}")
-
-@st.cache_data(show_spinner="Gerando gráfico de evolução temporal...")
-def plot_evolucao_temporal_sql(filtros, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return
-    where_clause, params = build_where_clause(filtros)
-    query = f"SELECT strftime(data, '%Y-%m-01') AS mes_ano, SUM(quantidade_vendida) AS total_quantidade_vendida FROM {tabela} {where_clause} AND data IS NOT NULL AND quantidade_vendida IS NOT NULL GROUP BY mes_ano ORDER BY mes_ano ASC;"
-    try:
-        df_mensal = conn.execute(query, params).fetchdf()
-        if df_mensal.empty:
-            st.info("Não há dados agregados mensalmente para exibir a evolução temporal.")
-            return
-        df_mensal['mes_ano'] = pd.to_datetime(df_mensal['mes_ano'])
-        fig = px.line(df_mensal, x='mes_ano', y='total_quantidade_vendida', markers=True, labels={'total_quantidade_vendida': 'Total Vendido', 'mes_ano': 'Data'})
-        fig.update_layout(title_text='Evolução Mensal da Quantidade Vendida', title_font_size=18, title_x=0.5)
-        fig.update_traces(line_color='#e74c3c', hovertemplate="Data: %{x|%b/%Y}<br>Quantidade: %{y:,.0f} unidades")
-        st.plotly_chart(fig, use_container_width=True)
-    except Exception as e: st.error(f"Erro ao gerar evolução temporal: {e}")
-
-@st.cache_data(show_spinner="Gerando gráfico de distribuição de idades...")
-def plot_distribuicao_idades_sql(filtros, num_bins=20, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return
-    where_clause, params = build_where_clause(filtros)
-    query_min_max = f"SELECT MIN(idade), MAX(idade) FROM {tabela} {where_clause} AND idade IS NOT NULL;"
-    try:
-        min_max_result = conn.execute(query_min_max, params).fetchone()
-        if min_max_result is None or min_max_result[0] is None:
-            st.info("Não há dados de idade válidos.")
-            return
-        min_age, max_age = min_max_result
-        if min_age == max_age: bin_width = 1
-        else: bin_width = max(1, np.ceil((max_age - min_age) / num_bins))
-        query_hist = f"SELECT CAST(FLOOR((idade - {min_age}) / {bin_width}) * {bin_width} + {min_age} AS INTEGER) AS bin_start, COUNT(*) as \"Contagem\" FROM {tabela} {where_clause} AND idade IS NOT NULL GROUP BY bin_start ORDER BY bin_start;"
-        df_hist_data = conn.execute(query_hist, params).fetchdf()
-        if df_hist_data.empty:
-            st.info("Não há dados para exibir a distribuição de idade.")
-            return
-        df_hist_data["Faixa de Idade"] = df_hist_data["bin_start"].astype(str) + " - " + (df_hist_data["bin_start"] + bin_width - 1).astype(str)
-        fig = px.bar(df_hist_data, x='Faixa de Idade', y='Contagem', labels={'Contagem': 'Nº de Prescrições'})
-        fig.update_layout(title_text='Distribuição de Idades', title_font_size=16, title_x=0.5)
-        st.plotly_chart(fig, use_container_width=True)
-        query_stats_age = f"SELECT AVG(idade), MEDIAN(idade) FROM {tabela} {where_clause} AND idade IS NOT NULL;"
-        avg_age, median_age = conn.execute(query_stats_age, params).fetchone()
-        if avg_age is not None and median_age is not None:
-            st.caption(f"Mediana: {median_age:.1f} anos, Média: {avg_age:.1f} anos.")
-    except Exception as e: st.error(f"Erro ao gerar distribuição de idades: {e}")
-
-@st.cache_data(show_spinner="Gerando gráfico por faixa etária...")
-def plot_contagem_faixa_etaria_sql(filtros, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return
-    where_clause, params = build_where_clause(filtros)
-    query = f"SELECT faixa_etaria, COUNT(*) AS count FROM {tabela} {where_clause} AND faixa_etaria IS NOT NULL AND faixa_etaria != 'Desconhecida' GROUP BY faixa_etaria ORDER BY faixa_etaria;"
-    try:
-        df_faixa_counts = conn.execute(query, params).fetchdf()
-        if df_faixa_counts.empty:
-            st.info("Não há dados de faixa etária para exibir o gráfico.")
-            return
-        fig = px.bar(df_faixa_counts, x='count', y='faixa_etaria', orientation='h', text_auto='.2s', labels={'count': 'Nº de Prescrições', 'faixa_etaria': 'Faixa Etária'})
-        fig.update_layout(title_text='Contagem de Prescrições por Faixa Etária', title_font_size=16, title_x=0.5, yaxis={'categoryorder':'total ascending'})
-        st.plotly_chart(fig, use_container_width=True)
-    except Exception as e: st.error(f"Erro ao gerar contagem por faixa etária: {e}")
-
-@st.cache_data(show_spinner="Gerando comparativo anual...")
-def plot_comparativo_sql(filtros, group_by_col, title, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return
-    where_clause, params = build_where_clause(filtros, exclude_filters=['ano'])
+        st.error(f"{mensagem_erro}: {e}")
+
+# --- Renderização dos widgets (thread do script) ---
+
+def get_visao_geral_metricas(resumo):
+    if resumo is None or resumo['geral'].empty: return 0, 0, 0
+    geral = resumo['geral'].iloc[0]
+    return int(geral['total']), int(geral['municipios_unicos']), int(geral['principios_unicos'])
+
+def plot_top_principios(top_meds_df):
+    if top_meds_df.empty:
+        st.info("Nenhum dado de princípios ativos encontrado com os filtros selecionados para o top 10.")
+        return
+    fig = px.bar(top_meds_df, x='Total', y='Princípio Ativo', orientation='h', text_auto='.2s')
+    fig.update_layout(
+        title_text='Top 10 Princípios Ativos Mais Prescritos', title_font_size=16, title_x=0.5,
+        yaxis={'categoryorder':'total ascending'}, margin=dict(l=0, r=0, t=40, b=0)
+    )
+    fig.update_traces(hovertemplate="%{y}<br>Total: %{x:,} prescrições", marker_color='#3498db')
+    st.plotly_chart(fig, use_container_width=True)
+
+def plot_evolucao_temporal(df_mensal):
+    if df_mensal.empty:
+        st.info("Não há dados agregados mensalmente para exibir a evolução temporal.")
+        return
+    df_mensal['mes_ano'] = pd.to_datetime(df_mensal['mes_ano'])
+    fig = px.line(df_mensal, x='mes_ano', y='total_quantidade_vendida', markers=True, labels={'total_quantidade_vendida': 'Total Vendido', 'mes_ano': 'Data'})
+    fig.update_layout(title_text='Evolução Mensal da Quantidade Vendida', title_font_size=18, title_x=0.5)
+    fig.update_traces(line_color='#e74c3c', hovertemplate="Data: %{x|%b/%Y}<br>Quantidade: %{y:,.0f} unidades")
+    st.plotly_chart(fig, use_container_width=True)
+
+def plot_distribuicao_idades(df_idades, num_bins=20):
+    if df_idades.empty:
+        st.info("Não há dados de idade válidos.")
+        return
+    min_age, max_age = int(df_idades['idade'].min()), int(df_idades['idade'].max())
+    if min_age == max_age: bin_width = 1
+    else: bin_width = int(max(1, np.ceil((max_age - min_age) / num_bins)))
+    df_hist_data = (df_idades.assign(bin_start=(df_idades['idade'] - min_age) // bin_width * bin_width + min_age)
+                    .groupby('bin_start', as_index=False)['contagem'].sum().rename(columns={'contagem': 'Contagem'}))
+    if df_hist_data.empty:
+        st.info("Não há dados para exibir a distribuição de idade.")
+        return
+    df_hist_data["Faixa de Idade"] = df_hist_data["bin_start"].astype(str) + " - " + (df_hist_data["bin_start"] + bin_width - 1).astype(str)
+    fig = px.bar(df_hist_data, x='Faixa de Idade', y='Contagem', labels={'Contagem': 'Nº de Prescrições'})
+    fig.update_layout(title_text='Distribuição de Idades', title_font_size=16, title_x=0.5)
+    st.plotly_chart(fig, use_container_width=True)
+    avg_age, median_age = estatisticas_idade(df_idades)
+    if avg_age is not None and median_age is not None:
+        st.caption(f"Mediana: {median_age:.1f} anos, Média: {avg_age:.1f} anos.")
+
+def plot_contagem_faixa_etaria(df_faixa_counts):
+    if df_faixa_counts.empty:
+        st.info("Não há dados de faixa etária para exibir o gráfico.")
+        return
+    fig = px.bar(df_faixa_counts, x='count', y='faixa_etaria', orientation='h', text_auto='.2s', labels={'count': 'Nº de Prescrições', 'faixa_etaria': 'Faixa Etária'})
+    fig.update_layout(title_text='Contagem de Prescrições por Faixa Etária', title_font_size=16, title_x=0.5, yaxis={'categoryorder':'total ascending'})
+    st.plotly_chart(fig, use_container_width=True)
+
+def plot_comparativo(df_comparativo, group_by_col, title):
+    if df_comparativo is None:
+        st.info("Selecione um ou mais princípios ativos no filtro lateral para ver este comparativo.")
+        return
+    if df_comparativo.empty:
+        st.warning(f"Dados insuficientes para o comparativo por '{group_by_col}'.")
+        return
     if group_by_col == 'Total':
-        query = f'SELECT ano, SUM(quantidade_vendida) AS "Valor" FROM {tabela} {where_clause} AND ano IN (2019, 2020) AND quantidade_vendida IS NOT NULL GROUP BY ano;'
         x_axis, y_axis, color_axis, barmode = 'Ano', 'Valor', None, 'relative'
     else:
-        if group_by_col == 'principio_ativo' and not filtros.get('principio_ativo'):
-            st.info("Selecione um ou mais princípios ativos no filtro lateral para ver este comparativo.")
-            return
-        query = f'SELECT ano, "{group_by_col}", COUNT(*) AS "Valor" FROM {tabela} {where_clause} AND ano IN (2019, 2020) AND "{group_by_col}" IS NOT NULL GROUP BY ano, "{group_by_col}" ORDER BY "{group_by_col}", ano;'
         x_axis, y_axis, color_axis, barmode = group_by_col, 'Valor', 'Ano', 'group'
-    try:
-        df_comparativo = conn.execute(query, params).fetchdf()
-        if df_comparativo.empty:
-            st.warning(f"Dados insuficientes para o comparativo por '{group_by_col}'.")
-            return
-        df_comparativo['Ano'] = df_comparativo['ano'].astype(str)
-        fig = px.bar(df_comparativo, x=x_axis, y=y_axis, color=color_axis, barmode=barmode, title=title, text_auto=True)
-        fig.update_layout(title_font_size=16, title_x=0.5, legend_title_text='Ano')
-        if group_by_col == 'Total':
-            fig.update_traces(marker_color=['#1f77b4', '#ff7f0e'])
-        st.plotly_chart(fig, use_container_width=True)
-    except Exception as e: st.error(f"Erro ao gerar o gráfico comparativo para '{group_by_col}': {e}")
+    df_comparativo['Ano'] = df_comparativo['ano'].astype(str)
+    fig = px.bar(df_comparativo, x=x_axis, y=y_axis, color=color_axis, barmode=barmode, title=title, text_auto=True)
+    fig.update_layout(title_font_size=16, title_x=0.5, legend_title_text='Ano')
+    if group_by_col == 'Total':
+        fig.update_traces(marker_color=['#1f77b4', '#ff7f0e'])
+    st.plotly_chart(fig, use_container_width=True)
+
+def exibir_amostra(df_amostra):
+    if df_amostra.empty:
+        st.info("Nenhuma amostra de dados detalhados para exibir com os filtros selecionados. Por favor, ajuste os filtros na barra lateral.")
+        return
+    st.caption(f"Exibindo uma amostra de até {len(df_amostra):,} registros que correspondem aos seus filtros. Para ver as estatísticas descritivas, expanda a seção abaixo.")
+    with st.expander("Ver Estatísticas Descritivas da Amostra"):
+        st.dataframe(df_amostra.describe(include='all').style.format(precision=2, na_rep="-"))
+    st.dataframe(df_amostra)
 
 def criar_filtros_exploracao(df_anos_para_opcoes):
     st.sidebar.header("Filtros da Exploração")
@@ -194,53 +251,35 @@ def criar_filtros_exploracao(df_anos_para_opcoes):
 
 # --- Função de Insights Automáticos ---
 
-def gerar_insights_automaticos(filtros, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None:
+def gerar_insights_automaticos(resumo):
+    if resumo is None:
         return ["Não foi possível conectar ao banco de dados."]
     insights = []
-    where_clause, params = build_where_clause(filtros)
     # 1. Maior município em prescrições
-    try:
-        q1 = f"SELECT nome_municipio, COUNT(*) as total FROM {tabela} {where_clause} AND nome_municipio IS NOT NULL GROUP BY nome_municipio ORDER BY total DESC LIMIT 1;"
-        r1 = conn.execute(q1, params).fetchone()
-        if r1:
-            insights.append(f"**Município com maior volume de prescrições:** {r1[0]} ({int(r1[1]):,} prescrições).")
-    except: pass
+    df_mun = resumo['municipio'].dropna(subset=['nome_municipio']).sort_values('total', ascending=False)
+    if not df_mun.empty:
+        r1 = df_mun.iloc[0]
+        insights.append(f"**Município com maior volume de prescrições:** {r1['nome_municipio']} ({int(r1['total']):,} prescrições).")
     # 2. Princípio ativo com maior crescimento (2019 vs 2020)
-    try:
-        q2 = f"""
-            SELECT principio_ativo,
-                   SUM(CASE WHEN ano=2019 THEN 1 ELSE 0 END) as total_2019,
-                   SUM(CASE WHEN ano=2020 THEN 1 ELSE 0 END) as total_2020
-            FROM {tabela} {where_clause} AND principio_ativo IS NOT NULL AND ano IN (2019,2020)
-            GROUP BY principio_ativo
-            HAVING total_2019 > 0
-            ORDER BY (CAST(total_2020 AS FLOAT) - total_2019) / total_2019 DESC
-            LIMIT 1;
-        """
-        r2 = conn.execute(q2, params).fetchone()
-        if r2 and r2[1] > 0:
-            crescimento = ((r2[2] - r2[1]) / r2[1]) * 100 if r2[1] else 0
-            insights.append(f"**Maior crescimento relativo de prescrições (2019→2020):** {r2[0]} (+{crescimento:.1f}%).")
-    except: pass
+    df_pa = (resumo['principio_ano'].dropna(subset=['principio_ativo']).query("ano in (2019, 2020)")
+             .pivot_table(index='principio_ativo', columns='ano', values='total', aggfunc='sum', fill_value=0, observed=True)
+             .reindex(columns=[2019, 2020], fill_value=0))
+    df_pa = df_pa[df_pa[2019] > 0]
+    if not df_pa.empty:
+        crescimento = ((df_pa[2020] - df_pa[2019]) / df_pa[2019] * 100).sort_values(ascending=False)
+        insights.append(f"**Maior crescimento relativo de prescrições (2019→2020):** {crescimento.index[0]} (+{crescimento.iloc[0]:.1f}%).")
     # 3. Faixa etária predominante
-    try:
-        q3 = f"SELECT faixa_etaria, COUNT(*) as total FROM {tabela} {where_clause} AND faixa_etaria IS NOT NULL GROUP BY faixa_etaria ORDER BY total DESC LIMIT 1;"
-        r3 = conn.execute(q3, params).fetchone()
-        if r3:
-            insights.append(f"**Faixa etária predominante:** {r3[0]} ({int(r3[1]):,} prescrições).")
-    except: pass
+    df_faixa = resumo['faixa_etaria'].dropna(subset=['faixa_etaria']).sort_values('total', ascending=False)
+    if not df_faixa.empty:
+        r3 = df_faixa.iloc[0]
+        insights.append(f"**Faixa etária predominante:** {r3['faixa_etaria']} ({int(r3['total']):,} prescrições).")
     # 4. Tendência de alta/baixa no último ano disponível
-    try:
-        q4 = f"SELECT ano, COUNT(*) as total FROM {tabela} {where_clause} AND ano IS NOT NULL GROUP BY ano ORDER BY ano DESC LIMIT 2;"
-        df_anos = pd.DataFrame(conn.execute(q4, params).fetchall(), columns=['ano', 'total'])
-        if len(df_anos) == 2:
-            diff = df_anos.iloc[0]['total'] - df_anos.iloc[1]['total']
-            perc = (diff / df_anos.iloc[1]['total'])*100 if df_anos.iloc[1]['total'] else 0
-            tendencia = "aumento" if diff > 0 else "redução"
-            insights.append(f"**Tendência anual:** {tendencia} de {abs(diff):,} prescrições ({perc:.1f}%) de {int(df_anos.iloc[1]['ano'])} para {int(df_anos.iloc[0]['ano'])}.")
-    except: pass
+    df_anos = resumo['ano'].dropna(subset=['ano']).sort_values('ano', ascending=False).head(2)
+    if len(df_anos) == 2:
+        diff = int(df_anos.iloc[0]['total'] - df_anos.iloc[1]['total'])
+        perc = (diff / df_anos.iloc[1]['total'])*100 if df_anos.iloc[1]['total'] else 0
+        tendencia = "aumento" if diff > 0 else "redução"
+        insights.append(f"**Tendência anual:** {tendencia} de {abs(diff):,} prescrições ({perc:.1f}%) de {int(df_anos.iloc[1]['ano'])} para {int(df_anos.iloc[0]['ano'])}.")
     if not insights:
         insights.append("Nenhum insight relevante encontrado para os filtros atuais.")
     return insights
@@ -264,8 +303,40 @@ if 'df_principal' not in st.session_state or st.session_state.df_principal.empty
 # Criar filtros
 filtros = criar_filtros_exploracao(st.session_state.df_principal)
 
-# Métricas de Visão Geral
-total_registros, municipios_unicos, principios_unicos = get_visao_geral_metricas(filtros)
+# Widget -> (consulta, renderização, mensagem de erro). As consultas de todos os widgets (e o
+# resumo das métricas e insights, uma consulta GROUPING SETS) são submetidas juntas ao pool de
+# threads; cada widget é desenhado no seu espaço da página assim que o resultado chega.
+NOME_RESUMO = "Resumo (métricas + insights, consulta única)"
+agregado = cubo_disponivel()
+widgets = {
+    "Evolução mensal": (partial(consultar_evolucao_temporal, filtros, agregado), plot_evolucao_temporal, "Erro ao gerar evolução temporal"),
+    "Top 10 princípios ativos": (partial(consultar_top_principios, filtros, agregado), plot_top_principios, "Erro ao gerar top princípios ativos"),
+    "Distribuição por idade": (partial(consultar_distribuicao_idades, filtros, agregado), plot_distribuicao_idades, "Erro ao gerar distribuição de idades"),
+    "Contagem por faixa etária": (partial(consultar_contagem_faixa_etaria, filtros, agregado), plot_contagem_faixa_etaria, "Erro ao gerar contagem por faixa etária"),
+    "Comparativo: quantidade total": (partial(consultar_comparativo, filtros, agregado, 'Total'),
+                                      partial(plot_comparativo, group_by_col='Total', title='Comparativo da Quantidade Total Vendida'),
+                                      "Erro ao gerar o gráfico comparativo para 'Total'"),
+    "Comparativo: faixa etária": (partial(consultar_comparativo, filtros, agregado, 'faixa_etaria'),
+                                  partial(plot_comparativo, group_by_col='faixa_etaria', title='Comparativo de Prescrições por Faixa Etária'),
+                                  "Erro ao gerar o gráfico comparativo para 'faixa_etaria'"),
+    "Comparativo: princípio ativo": (partial(consultar_comparativo, filtros, agregado, 'principio_ativo'),
+                                     partial(plot_comparativo, group_by_col='principio_ativo', title='Comparativo de Prescrições por Princípio Ativo'),
+                                     "Erro ao gerar o gráfico comparativo para 'principio_ativo'"),
+    "Amostra de dados": (partial(consultar_amostra, filtros, limit=5000), exibir_amostra, "Erro ao buscar amostra de dados"),
+}
+st.session_state['tempos_widgets'] = {}
+st.session_state['tempos_consultas'] = {}
+inicio_consultas = time.perf_counter()
+executor, futuros = submeter_consultas({NOME_RESUMO: partial(consultar_resumo, filtros, agregado), **{nome: w[0] for nome, w in widgets.items()}})
+espacos = {}
+
+try:
+    resumo, st.session_state['tempos_consultas'][NOME_RESUMO] = futuros[NOME_RESUMO].result()
+except Exception as e:
+    st.error(f"Erro ao calcular métricas e insights: {e}")
+    resumo = None
+with medir_widget("Métricas de visão geral"):
+    total_registros, municipios_unicos, principios_unicos = get_visao_geral_metricas(resumo)
 
 st.header("Visão Geral dos Dados Filtrados")
 st.caption("As métricas abaixo são atualizadas dinamicamente de acordo com os filtros selecionados, oferecendo um panorama inicial do volume e diversidade dos dados em análise.")
@@ -277,7 +348,7 @@ cols[2].metric("Princípios Ativos Únicos", f"{principios_unicos:,}", help="Qua
 
 st.markdown("---")
 
-# Abas para organização do conteúdo
+# Abas para organização do conteúdo; o espaço de cada widget é reservado aqui e preenchido depois
 tab_tendencias, tab_distribuicoes, tab_comparativo, tab_detalhes = st.tabs([
     "📈 Tendências Gerais", "📊 Distribuições", "🆚 Comparativo Anual", "📋 Dados Detalhados"
 ])
@@ -289,12 +360,12 @@ with tab_tendencias:
         with st.container(border=True):
             st.markdown("#### Evolução Mensal da Quantidade Vendida")
             st.caption("Acompanhe o volume total de medicamentos vendidos ao longo dos meses, identificando períodos de alta ou baixa demanda.")
-            plot_evolucao_temporal_sql(filtros)
+            espacos["Evolução mensal"] = st.container()
         st.markdown("---")
         with st.container(border=True):
             st.markdown("#### Top 10 Princípios Ativos Mais Prescritos")
             st.caption("Descubra quais princípios ativos são os mais demandados, oferecendo insights sobre as necessidades de tratamento predominantes.")
-            plot_top_principios_sql(filtros)
+            espacos["Top 10 princípios ativos"] = st.container()
     else:
         st.info("Nenhum dado encontrado com os filtros selecionados para exibir tendências. Por favor, ajuste os filtros na barra lateral.")
 
@@ -307,12 +378,12 @@ with tab_distribuicoes:
             with st.container(border=True):
                 st.markdown("#### Distribuição por Idade")
                 st.caption("Histograma mostrando a distribuição das idades dos pacientes, com medidas de tendência central.")
-                plot_distribuicao_idades_sql(filtros)
+                espacos["Distribuição por idade"] = st.container()
         with col2:
             with st.container(border=True):
                 st.markdown("#### Contagem por Faixa Etária")
                 st.caption("Número total de prescrições agrupadas por faixas etárias definidas, para uma visão segmentada.")
-                plot_contagem_faixa_etaria_sql(filtros)
+                espacos["Contagem por faixa etária"] = st.container()
     else:
         st.info("Nenhum dado encontrado com os filtros selecionados para exibir distribuições. Por favor, ajuste os filtros na barra lateral.")
 
@@ -323,38 +394,51 @@ with tab_comparativo:
         with st.container(border=True):
             st.markdown("#### Comparativo da Quantidade Total Vendida")
             st.caption("Comparação do volume total de vendas entre os anos, útil para análises de crescimento ou declínio.")
-            plot_comparativo_sql(filtros, group_by_col='Total', title='Comparativo da Quantidade Total Vendida')
+            espacos["Comparativo: quantidade total"] = st.container()
         st.markdown("---")
         with st.container(border=True):
             st.markdown("#### Comparativo de Prescrições por Faixa Etária")
             st.caption("Variação na distribuição das prescrições entre as faixas etárias nos anos selecionados.")
-            plot_comparativo_sql(filtros, group_by_col='faixa_etaria', title='Comparativo de Prescrições por Faixa Etária')
+            espacos["Comparativo: faixa etária"] = st.container()
         st.markdown("---")
         with st.container(border=True):
             st.markdown("#### Comparativo de Prescrições por Princípio Ativo")
             st.caption("Compare a performance de princípios ativos específicos entre os anos. *Selecione os princípios ativos desejados no filtro lateral.*")
-            plot_comparativo_sql(filtros, group_by_col='principio_ativo', title='Comparativo de Prescrições por Princípio Ativo')
+            espacos["Comparativo: princípio ativo"] = st.container()
     else:
         st.info("Nenhum dado encontrado com os filtros selecionados para exibir comparativos anuais. Por favor, ajuste os filtros na barra lateral.")
 
 with tab_detalhes:
     st.subheader("Amostra dos Dados Filtrados")
     st.markdown("Visualize uma amostra dos registros que correspondem aos seus filtros, permitindo uma inspeção direta dos dados brutos.")
-    df_amostra = fetch_sample_data_from_duckdb(filtros, limit=5000)
-    if not df_amostra.empty:
-        st.caption(f"Exibindo uma amostra de até {len(df_amostra):,} registros que correspondem aos seus filtros. Para ver as estatísticas descritivas, expanda a seção abaixo.")
-        with st.expander("Ver Estatísticas Descritivas da Amostra"):
-            st.dataframe(df_amostra.describe(include='all').style.format(precision=2, na_rep="-"))
-        st.dataframe(df_amostra)
-    else:
-        st.info("Nenhuma amostra de dados detalhados para exibir com os filtros selecionados. Por favor, ajuste os filtros na barra lateral.")
+    espacos["Amostra de dados"] = st.container()
 
-# Painel de Insights e Storytelling Automático
+# Painel de Insights e Storytelling Automático (usa o resumo, já disponível)
 with st.container(border=True):
     st.subheader("Insights Automáticos")
-    insights = gerar_insights_automaticos(filtros)
+    with medir_widget("Insights automáticos"):
+        insights = gerar_insights_automaticos(resumo)
     for i in insights:
         st.markdown(f"- {i}")
 
+# Widgets desenhados na ordem em que as consultas terminam; os que ficaram sem espaço
+# (sem registros para os filtros) têm a consulta cancelada se ainda não começou
+pendentes = {futuros[nome]: nome for nome in espacos}
+for nome in futuros.keys() - espacos.keys() - {NOME_RESUMO}:
+    futuros[nome].cancel()
+for futuro in as_completed(pendentes):
+    nome = pendentes[futuro]
+    with espacos[nome]:
+        renderizar_widget(nome, futuro, *widgets[nome][1:])
+latencia_pagina_ms = (time.perf_counter() - inicio_consultas) * 1000
+executor.shutdown(wait=False)
+
+with st.expander("Tempo de cada widget nesta execução"):
+    tempos_consultas = st.session_state['tempos_consultas']
+    st.caption(f"As consultas rodam em paralelo: a página levou {latencia_pagina_ms:,.0f} ms, contra {sum(tempos_consultas.values()):,.0f} ms somando as consultas. "
+               "Tempos baixos indicam resultados vindos do cache de consultas.")
+    df_tempos = pd.DataFrame({'Consulta (ms)': pd.Series(tempos_consultas, dtype=float), 'Renderização (ms)': pd.Series(st.session_state['tempos_widgets'], dtype=float)})
+    st.dataframe(df_tempos.rename_axis('Widget').reset_index().style.format({'Consulta (ms)': '{:,.1f}', 'Renderização (ms)': '{:,.1f}'}, na_rep="-"), hide_index=True)
+
 st.markdown("---")
 st.caption("Dashboard modelado seguindo padrões internacionais de UX para dashboards analíticos, estratégicos, táticos e operacionais. Utilize os filtros e compartilhe suas visões para apoiar a tomada de decisão em saúde.")
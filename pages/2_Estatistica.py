@@ -6,9 +6,12 @@ import plotly.express as px
 from scipy.stats import ttest_ind, mannwhitneyu, levene
 
 # --- Importações dos Módulos de Utilitários ---
-from src.utils.database_utils import get_duckdb_connection, TABLE_NAME
+from src.utils.database_utils import consultar_df, TABLE_NAME
 from src.utils.stats_utils import realizar_teste_shapiro, realizar_teste_anova
 
+# Tipos do DuckDB (duckdb_columns().data_type) oferecidos na matriz de correlação, além de DECIMAL(p,s)
+TIPOS_NUMERICOS = ['TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT', 'FLOAT', 'DOUBLE']
+
 # --- Início da Página de Análise Estatística ---
 st.title("📊 Análise Estatística Avançada")
 
@@ -16,11 +19,6 @@ if 'df_principal' not in st.session_state or st.session_state.df_principal.empty
     st.error("Os dados principais (2019-2020) não foram carregados. Retorne à página inicial.")
     st.stop()
 
-conn_stats_page = get_duckdb_connection()
-if conn_stats_page is None:
-    st.error("Não foi possível conectar ao banco de dados DuckDB.")
-    st.stop()
-
 # --- Estrutura de Abas ---
 tab_comparativo_anual_stats, tab_geral = st.tabs([
     "🆚 Comparativo Estatístico Detalhado (2019 vs. 2020)",
@@ -57,12 +55,12 @@ with tab_comparativo_anual_stats:
         """
         
         try:
-            df_desc_2019_intermediate = conn_stats_page.execute(query_desc_2019_comp).fetchdf()
+            df_desc_2019_intermediate = consultar_df(query_desc_2019_comp)
             if not df_desc_2019_intermediate.empty:
                 df_desc_2019_col = df_desc_2019_intermediate.set_index("Statistic_Name").T 
                 desc_dfs_list_comparativo.append(df_desc_2019_col)
                 
-            df_desc_2020_intermediate = conn_stats_page.execute(query_desc_2020_comp).fetchdf()
+            df_desc_2020_intermediate = consultar_df(query_desc_2020_comp)
             if not df_desc_2020_intermediate.empty:
                 df_desc_2020_col = df_desc_2020_intermediate.set_index("Statistic_Name").T
                 desc_dfs_list_comparativo.append(df_desc_2020_col)
@@ -84,7 +82,7 @@ with tab_comparativo_anual_stats:
             USING SAMPLE {max_sample_boxplot} ROWS; 
         """
         try:
-            df_plot_box_data_comp = conn_stats_page.execute(query_boxplot).fetchdf()
+            df_plot_box_data_comp = consultar_df(query_boxplot, cache=False)
             if not df_plot_box_data_comp.empty:
                 st.markdown(f"##### Distribuição Comparativa de '{col_plot_desc_comp}' (Amostra)")
                 df_plot_box_data_comp['ano'] = df_plot_box_data_comp['ano'].astype(str)
@@ -101,8 +99,8 @@ with tab_comparativo_anual_stats:
 
     st.subheader("Comparativo de 'Quantidade Vendida' entre 2019 e 2020")
     try:
-        qtd_2019_series = conn_stats_page.execute(f"SELECT quantidade_vendida FROM {TABLE_NAME} WHERE ano = 2019 AND quantidade_vendida IS NOT NULL;").fetchdf()['quantidade_vendida']
-        qtd_2020_series = conn_stats_page.execute(f"SELECT quantidade_vendida FROM {TABLE_NAME} WHERE ano = 2020 AND quantidade_vendida IS NOT NULL;").fetchdf()['quantidade_vendida']
+        qtd_2019_series = consultar_df(f"SELECT quantidade_vendida FROM {TABLE_NAME} WHERE ano = 2019 AND quantidade_vendida IS NOT NULL;")['quantidade_vendida']
+        qtd_2020_series = consultar_df(f"SELECT quantidade_vendida FROM {TABLE_NAME} WHERE ano = 2020 AND quantidade_vendida IS NOT NULL;")['quantidade_vendida']
         if qtd_2019_series.empty or qtd_2020_series.empty or len(qtd_2019_series) < 3 or len(qtd_2020_series) < 3:
             st.warning("Dados insuficientes de 'quantidade_vendida' em 2019 ou 2020 para testes estatísticos.")
         else:
@@ -170,7 +168,7 @@ with tab_geral:
         st.markdown("Análise da 'Quantidade Vendida'.")
         st.markdown("#### Teste de Normalidade (Shapiro-Wilk)")
         try:
-            series_qtd_total = conn_stats_page.execute(f"SELECT quantidade_vendida FROM {TABLE_NAME} WHERE ano IN (2019,2020) AND quantidade_vendida IS NOT NULL;").fetchdf()['quantidade_vendida']
+            series_qtd_total = consultar_df(f"SELECT quantidade_vendida FROM {TABLE_NAME} WHERE ano IN (2019,2020) AND quantidade_vendida IS NOT NULL;")['quantidade_vendida']
             if series_qtd_total.empty:
                 st.warning("Sem dados de 'quantidade_vendida' para teste de normalidade.")
             else:
@@ -188,7 +186,7 @@ with tab_geral:
         opcoes_grupo_anova_validas = []
         for col_anova in opcoes_grupo_anova_orig:
             try:
-                unique_count_df = conn_stats_page.execute(f'SELECT COUNT(DISTINCT "{col_anova}") AS count FROM {TABLE_NAME} WHERE ano IN (2019,2020) AND "{col_anova}" IS NOT NULL;').fetchdf()
+                unique_count_df = consultar_df(f'SELECT COUNT(DISTINCT "{col_anova}") AS count FROM {TABLE_NAME} WHERE ano IN (2019,2020) AND "{col_anova}" IS NOT NULL;')
                 if not unique_count_df.empty:
                     unique_count = unique_count_df['count'].iloc[0]
                     if 2 <= unique_count < 50:
@@ -201,7 +199,7 @@ with tab_geral:
             grupo_anova_selecionado = st.selectbox("Variável de agrupamento para ANOVA:", options=opcoes_grupo_anova_validas, index=default_idx_anova, key="anova_grupo_select_geral")
             if grupo_anova_selecionado:
                 try:
-                    df_anova_data = conn_stats_page.execute(f'SELECT quantidade_vendida, "{grupo_anova_selecionado}" FROM {TABLE_NAME} WHERE ano IN (2019,2020) AND quantidade_vendida IS NOT NULL AND "{grupo_anova_selecionado}" IS NOT NULL;').fetchdf()
+                    df_anova_data = consultar_df(f'SELECT quantidade_vendida, "{grupo_anova_selecionado}" FROM {TABLE_NAME} WHERE ano IN (2019,2020) AND quantidade_vendida IS NOT NULL AND "{grupo_anova_selecionado}" IS NOT NULL;')
                     if df_anova_data.empty or df_anova_data['quantidade_vendida'].isnull().all() or df_anova_data[grupo_anova_selecionado].isnull().all():
                         st.warning(f"Dados insuficientes para ANOVA com grupo '{grupo_anova_selecionado}'.")
                     else:
@@ -215,11 +213,13 @@ with tab_geral:
     with col_correlacao:
         st.subheader("Análise de Correlação (Dados Combinados)")
         try:
-            schema_df = conn_stats_page.execute(f"DESCRIBE {TABLE_NAME};").fetchdf()
-            colunas_numericas_db = schema_df[schema_df['column_type'].str.contains('INT|FLOAT|DOUBLE|DECIMAL', case=False)]['column_name'].tolist()
-            colunas_numericas_db = [c for c in colunas_numericas_db if c not in ['ano', 'mes', 'id_municipio_6dig', 'id_paciente']] 
+            # Pelo tipo da coluna (duckdb_columns), não pelo texto do DESCRIBE: um ENUM lista seus valores no tipo
+            schema_df = consultar_df(
+                "SELECT column_name FROM duckdb_columns() WHERE table_name = ? AND (data_type IN ? OR data_type LIKE 'DECIMAL(%') "
+                "GROUP BY column_name ORDER BY min(column_index);", [TABLE_NAME, TIPOS_NUMERICOS])
+            colunas_numericas_db = [c for c in schema_df['column_name'].tolist() if c not in ['ano', 'mes', 'id_municipio_6dig', 'id_paciente']]
         except Exception:
-            colunas_numericas_db = ['idade', 'quantidade_vendida'] 
+            colunas_numericas_db = ['idade', 'quantidade_vendida']
         if len(colunas_numericas_db) < 2: st.warning("Menos de duas colunas numéricas adequadas encontradas para correlação.")
         else:
             default_corr_cols = [col for col in ['idade', 'quantidade_vendida'] if col in colunas_numericas_db]
@@ -230,7 +230,7 @@ with tab_geral:
                 try:
                     select_cols_corr = ", ".join([f'"{c}"' for c in colunas_para_corr])
                     n_subsample_corr_query = 50000
-                    df_corr_data = conn_stats_page.execute(f"SELECT {select_cols_corr} FROM {TABLE_NAME} WHERE ano IN (2019,2020) USING SAMPLE {n_subsample_corr_query} ROWS;").fetchdf()
+                    df_corr_data = consultar_df(f"SELECT {select_cols_corr} FROM {TABLE_NAME} WHERE ano IN (2019,2020) USING SAMPLE {n_subsample_corr_query} ROWS;", cache=False)
                     st.caption(f"Correlação calculada em uma amostra de até {n_subsample_corr_query:,} linhas.")
                     df_corr_data.dropna(inplace=True)
                     if len(df_corr_data) < 2: st.warning("Dados insuficientes para correlação após remover NaNs da amostra.")
@@ -6,7 +6,7 @@ import plotly.express as px
 from src.aplicacao.clusterizacao import agrupar_prescricoes
 
 # --- Novas Importações dos Módulos de Utilitários ---
-from src.utils.database_utils import get_duckdb_connection, TABLE_NAME
+from src.utils.database_utils import obter_cursor, TABLE_NAME
 
 # --- Funções Auxiliares para a Página de Clusters ---
 def mostrar_resultados_cluster_page(df_clusterizado, features_selecionadas, metodo_usado):
@@ -149,11 +149,6 @@ if not features_selecionadas_cluster_page or len(features_selecionadas_cluster_p
     st.info("Por favor, selecione pelo menos uma feature numérica na barra lateral para a clusterização.")
 else:
     if st.sidebar.button("Executar Clusterização", type="primary", key="cluster_page_run_button", use_container_width=True):
-        conn = get_duckdb_connection()
-        if conn is None:
-            st.error("Não foi possível conectar ao banco de dados para buscar dados para clusterização.")
-            st.stop()
-
         select_features_sql = ", ".join([f'"{f}"' for f in features_selecionadas_cluster_page])
         where_clause_cluster_data = "WHERE ano IN (2019, 2020)"
             
@@ -166,7 +161,8 @@ else:
         
         st.info(f"Buscando {sample_size} amostras com as features: {', '.join(features_selecionadas_cluster_page)} para clusterização...")
         try:
-            df_para_clusterizar = conn.execute(query_cluster_data).fetchdf()
+            with obter_cursor() as conn:
+                df_para_clusterizar = conn.execute(query_cluster_data).fetchdf()
         except Exception as e_query:
             st.error(f"Erro ao buscar dados do DuckDB para clusterização: {e_query}")
             st.stop()
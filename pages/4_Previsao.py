@@ -6,17 +6,13 @@ from statsmodels.tsa.arima.model import ARIMA
 import warnings
 
 # --- Novas Importações dos Módulos de Utilitários ---
-from src.utils.database_utils import get_duckdb_connection, carregar_opcoes_previsao, TABLE_NAME
+from src.utils.database_utils import consultar_df, carregar_opcoes_previsao, TABLE_NAME
 
 # Ignorar avisos comuns do statsmodels sobre convergência, etc.
 warnings.filterwarnings("ignore")
 
 # --- Funções Específicas da Página (Busca de dados e Modelagem) ---
-@st.cache_data(show_spinner="Preparando série temporal a partir do banco de dados...")
 def fetch_timeseries_data(filtro_pa, filtro_mun, tabela=TABLE_NAME):
-    conn = get_duckdb_connection()
-    if conn is None: return pd.DataFrame()
-
     conditions = ["ano IN (2019, 2020)", "data IS NOT NULL", "quantidade_vendida IS NOT NULL"]
     params = []
     
@@ -39,7 +35,7 @@ def fetch_timeseries_data(filtro_pa, filtro_mun, tabela=TABLE_NAME):
         ORDER BY 1;
     """
     try:
-        ts_df = conn.execute(query, params).fetchdf()
+        ts_df = consultar_df(query, params)
         if ts_df.empty:
             return pd.DataFrame()
         
@@ -5,18 +5,14 @@ import pandas as pd
 import plotly.express as px
 import numpy as np
 from sklearn.ensemble import IsolationForest
-from src.utils.database_utils import get_duckdb_connection, carregar_opcoes_previsao, TABLE_NAME
+from src.utils.database_utils import consultar_df, carregar_opcoes_previsao, TABLE_NAME
 
 # --- Funções Específicas da Página (Busca de dados e Modelagem) ---
 
-@st.cache_data(show_spinner="Buscando amostra de dados para análise de anomalias...")
 def fetch_data_for_anomaly(features, filtro_pa, filtro_mun, sample_size, tabela=TABLE_NAME):
     """
     Busca uma amostra de dados do DuckDB com base nos filtros e features selecionados.
     """
-    conn = get_duckdb_connection()
-    if conn is None: return pd.DataFrame()
-
     select_clause = ", ".join([f'"{f}"' for f in features])
     
     conditions = ["ano IN (2019, 2020)"]
@@ -42,7 +38,7 @@ def fetch_data_for_anomaly(features, filtro_pa, filtro_mun, sample_size, tabela=
         USING SAMPLE {sample_size} ROWS;
     """
     try:
-        df_sample = conn.execute(query, params).fetchdf()
+        df_sample = consultar_df(query, params, cache=False)
         return df_sample
     except Exception as e:
         st.error(f"Erro ao buscar dados do DuckDB: {e}")
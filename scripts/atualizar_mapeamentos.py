@@ -0,0 +1,42 @@
+# scripts/atualizar_mapeamentos.py
+# Recarrega as tabelas de mapeamento (controlados, ATC, municípios) a partir dos CSVs de dados/
+# em uma única transação. Só os CSVs alterados desde a última carga são relidos.
+import argparse
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.utils.database_utils import get_db_connection_for_etl
+from src.utils.mapeamentos_utils import atualizar_mapeamentos, MAPEAMENTOS, MAPEAMENTOS_DIR_PATH
+from src.utils.instrumentacao_utils import salvar_relatorio, RELATORIO_DIR_PADRAO
+
+def executar_atualizacao(tabelas=None, pasta=MAPEAMENTOS_DIR_PATH, forcar=False, relatorio_dir=RELATORIO_DIR_PADRAO):
+    """Abre a conexão de ETL, atualiza os mapeamentos e grava a instrumentação. Retorna True em caso de sucesso."""
+    print("--- INICIANDO ATUALIZAÇÃO DAS TABELAS DE MAPEAMENTO ---")
+    conexao = get_db_connection_for_etl()
+    if conexao is None:
+        return False
+    registros_instrumentacao = []
+    try:
+        recarregadas = atualizar_mapeamentos(conexao, pasta, tabelas, forcar, registros_instrumentacao)
+        print(f"--- ATUALIZAÇÃO CONCLUÍDA: {len(recarregadas)} tabela(s) recarregada(s) ---")
+        return True
+    except Exception as e:
+        print(f"ERRO na atualização dos mapeamentos (nenhuma tabela foi alterada): {e}")
+        return False
+    finally:
+        conexao.close()
+        print("Conexão com DuckDB fechada.")
+        if registros_instrumentacao and relatorio_dir is not None:
+            salvar_relatorio(registros_instrumentacao, "mapeamentos", relatorio_dir)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recarrega as tabelas de mapeamento a partir dos CSVs (em uma transação).")
+    parser.add_argument('--tabelas', nargs='+', choices=list(MAPEAMENTOS), default=None, help="Tabelas a atualizar (padrão: todas).")
+    parser.add_argument('--pasta', default=str(MAPEAMENTOS_DIR_PATH), help="Pasta com os CSVs de mapeamento.")
+    parser.add_argument('--forcar', action='store_true', help="Recarrega mesmo os CSVs que não mudaram.")
+    parser.add_argument('--relatorio-dir', default=RELATORIO_DIR_PADRAO, help="Pasta dos relatórios de instrumentação.")
+    args = parser.parse_args()
+    sys.exit(0 if executar_atualizacao(args.tabelas, args.pasta, args.forcar, args.relatorio_dir) else 1)
@@ -21,37 +21,166 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
-def auditar_tabela_final(conexao, tabela):
-    """Realiza uma auditoria detalhada da tabela final (prescricoes)."""
+# Perfil das colunas da tabela final, versionado a cada auditoria (monitor de drift entre cargas)
+TABLE_PERFIL_COLUNAS = "perfil_colunas"
+TOP_K_VALORES = 5
+# Quartis e valores mais frequentes vêm de uma amostra de blocos quando a tabela é grande
+LIMITE_LINHAS_AMOSTRA = 1_000_000
+AMOSTRA_PCT = 1
+TIPOS_NUMERICOS = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT', 'FLOAT', 'DOUBLE')
+# Limites a partir dos quais a variação de uma coluna entre duas versões do perfil é sinalizada
+LIMITE_VARIACAO_PREENCHIMENTO_PP = 5.0
+LIMITE_VARIACAO_DISTINTOS_PCT = 20.0
+LIMITE_VARIACAO_MEDIANA_PCT = 20.0
+
+def perfilar_colunas(conexao, tabela):
+    """
+    Perfil de todas as colunas da tabela em duas varreduras. A primeira, completa, traz
+    preenchimento, distintos (aproximado) e mínimo/máximo. A segunda traz os quartis (colunas
+    numéricas) e os valores mais frequentes; acima de LIMITE_LINHAS_AMOSTRA linhas ela lê só
+    uma amostra de blocos (AMOSTRA_PCT), suficiente para acompanhar drift.
+    Retorna um DataFrame com uma linha por coluna.
+    """
+    colunas = conexao.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position", [tabela]
+    ).fetchall()
+    completos = ["COUNT(*)"]
+    amostrados = []
+    for coluna, tipo in colunas:
+        col = f'"{coluna}"'
+        numerica = tipo in TIPOS_NUMERICOS or tipo.startswith('DECIMAL')
+        completos.append(f"""struct_pack(
+            preenchidos := COUNT({col}),
+            distintos_aprox := approx_count_distinct({col}),
+            minimo := CAST(min({col}) AS VARCHAR),
+            maximo := CAST(max({col}) AS VARCHAR)
+        )""")
+        amostrados.append(f"""struct_pack(
+            quartis := {f"CAST(approx_quantile({col}, [0.25, 0.5, 0.75]) AS DOUBLE[])" if numerica else "CAST(NULL AS DOUBLE[])"},
+            top_valores := approx_top_k(CAST({col} AS VARCHAR), {TOP_K_VALORES})
+        )""")
+    resultado = conexao.execute(f"SELECT {', '.join(completos)} FROM {tabela};").fetchone()
+    linhas = resultado[0]
+    amostra = f" USING SAMPLE {AMOSTRA_PCT}% (system)" if linhas > LIMITE_LINHAS_AMOSTRA else ""
+    resultado_amostra = conexao.execute(f"SELECT {', '.join(amostrados)} FROM {tabela}{amostra};").fetchone()
+    perfil = []
+    for (coluna, tipo), metricas, metricas_amostra in zip(colunas, resultado[1:], resultado_amostra):
+        quartis = metricas_amostra['quartis'] or [None, None, None]
+        perfil.append({
+            'coluna': coluna, 'tipo': tipo, 'linhas': linhas,
+            'preenchidos': metricas['preenchidos'],
+            'pct_preenchido': metricas['preenchidos'] / linhas * 100 if linhas else 0.0,
+            'distintos_aprox': metricas['distintos_aprox'],
+            'minimo': metricas['minimo'], 'maximo': metricas['maximo'],
+            'q25': quartis[0], 'mediana': quartis[1], 'q75': quartis[2],
+            'top_valores': [v for v in (metricas_amostra['top_valores'] or []) if v is not None],
+        })
+    return pd.DataFrame(perfil)
+
+def salvar_perfil(conexao, tabela, perfil):
+    """Grava o perfil como uma nova versão em TABLE_PERFIL_COLUNAS e retorna o número da versão."""
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_PERFIL_COLUNAS} (
+        versao INTEGER, gerado_em TIMESTAMP, run_id INTEGER, tabela VARCHAR, coluna VARCHAR, tipo VARCHAR,
+        linhas BIGINT, preenchidos BIGINT, pct_preenchido DOUBLE, distintos_aprox BIGINT,
+        minimo VARCHAR, maximo VARCHAR, q25 DOUBLE, mediana DOUBLE, q75 DOUBLE, top_valores VARCHAR[]
+    );
+    """)
+    versao = conexao.execute(f"SELECT COALESCE(MAX(versao), 0) + 1 FROM {TABLE_PERFIL_COLUNAS} WHERE tabela = ?", [tabela]).fetchone()[0]
+    existe_registro = conexao.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'etl_runs'").fetchone()[0]
+    run_id = conexao.execute("SELECT MAX(run_id) FROM etl_runs").fetchone()[0] if existe_registro else None
+    perfil_versao = perfil.assign(versao=versao, gerado_em=pd.Timestamp.now(), run_id=run_id, tabela=tabela)
+    conexao.register('perfil_versao', perfil_versao)
+    try:
+        conexao.execute(f"INSERT INTO {TABLE_PERFIL_COLUNAS} BY NAME SELECT * FROM perfil_versao;")
+    finally:
+        conexao.unregister('perfil_versao')
+    return versao
+
+def carregar_perfil(conexao, tabela, versao):
+    """Perfil gravado de uma versão (DataFrame vazio se ela não existir)."""
+    return conexao.execute(f"SELECT * FROM {TABLE_PERFIL_COLUNAS} WHERE tabela = ? AND versao = ? ORDER BY coluna", [tabela, versao]).fetchdf()
+
+def comparar_perfis(anterior, atual):
+    """
+    Compara dois perfis coluna a coluna: variação do preenchimento (pontos percentuais), dos
+    distintos e da mediana (%), e mudanças de tipo e de mínimo/máximo. 'alerta' marca as
+    colunas que passaram dos limites, mudaram de tipo (ex.: ENUM ampliado) ou de faixa
+    (mínimo/máximo), surgiram ou sumiram.
+    """
+    colunas_comparadas = ['coluna', 'tipo', 'pct_preenchido', 'distintos_aprox', 'mediana', 'minimo', 'maximo']
+    diff = anterior[colunas_comparadas].merge(atual[colunas_comparadas], on='coluna', how='outer', suffixes=('_anterior', '_atual'), indicator=True)
+    diff['variacao_preenchimento_pp'] = diff['pct_preenchido_atual'] - diff['pct_preenchido_anterior']
+    for metrica in ('distintos_aprox', 'mediana'):
+        anterior_m = pd.to_numeric(diff[f'{metrica}_anterior'], errors='coerce')
+        diff[f'variacao_{metrica}_pct'] = (pd.to_numeric(diff[f'{metrica}_atual'], errors='coerce') - anterior_m) / anterior_m.where(anterior_m != 0).abs() * 100
+    diff['faixa_alterada'] = (diff['minimo_anterior'] != diff['minimo_atual']) | (diff['maximo_anterior'] != diff['maximo_atual'])
+    diff['tipo_alterado'] = diff['tipo_anterior'] != diff['tipo_atual']
+    diff['situacao'] = diff.pop('_merge').map({'both': 'mantida', 'left_only': 'removida', 'right_only': 'nova'})
+    diff['alerta'] = (
+        (diff['situacao'] != 'mantida')
+        | diff['tipo_alterado']
+        | diff['faixa_alterada']
+        | (diff['variacao_preenchimento_pp'].abs() > LIMITE_VARIACAO_PREENCHIMENTO_PP)
+        | (diff['variacao_distintos_aprox_pct'].abs() > LIMITE_VARIACAO_DISTINTOS_PCT)
+        | (diff['variacao_mediana_pct'].abs() > LIMITE_VARIACAO_MEDIANA_PCT)
+    )
+    return diff
+
+def ultima_versao_perfil(conexao, tabela):
+    """Número da versão mais recente do perfil gravada para a tabela (0 se não há nenhuma)."""
+    existe = conexao.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [TABLE_PERFIL_COLUNAS]).fetchone()[0]
+    if not existe:
+        return 0
+    return conexao.execute(f"SELECT COALESCE(MAX(versao), 0) FROM {TABLE_PERFIL_COLUNAS} WHERE tabela = ?", [tabela]).fetchone()[0]
+
+def auditar_tabela_final(conexao, tabela, relatorio_dir=None, persistir=True):
+    """
+    Realiza uma auditoria detalhada da tabela final (prescricoes): perfil de todas as colunas
+    (perfilar_colunas: uma varredura completa e outra amostrada), comparado com a versão mais
+    recente de perfil_colunas para sinalizar drift entre cargas. Com persistir=True (etapa
+    'perfil' do ETL, antes da publicação) o perfil é gravado como nova versão; com
+    persistir=False (auditoria avulsa, banco só leitura) ele só é comparado.
+    """
     log.info(f"\n--- Iniciando Auditoria Detalhada da Tabela: '{tabela}' ---")
     
     try:
-        total_rows = conexao.execute(f"SELECT COUNT(*) FROM {tabela};").fetchone()[0]
+        perfil = perfilar_colunas(conexao, tabela)
+        total_rows = int(perfil['linhas'].iloc[0]) if not perfil.empty else 0
         print(f"\nTotal de Registros na Tabela '{tabela}': {total_rows:,}")
 
-        print("\nEstrutura da Tabela (Schema):")
-        # CORREÇÃO: Usar PRAGMA table_info para obter uma lista mais robusta e completa de colunas.
-        schema_df = conexao.execute(f"PRAGMA table_info('{tabela}');").fetchdf()
-        # Exibe as colunas mais relevantes do schema
-        print(schema_df[['name', 'type', 'notnull']].to_string(index=False))
-
-        print("\nRelatório de Qualidade (Contagem de Valores Não-Nulos):")
-        # Obtém a lista de colunas do resultado do PRAGMA
-        colunas = schema_df['name'].tolist()
-        summaries = []
-        for col in colunas:
-            # Garante que nomes de colunas com caracteres especiais sejam tratados corretamente
-            non_null_count = conexao.execute(f'SELECT COUNT("{col}") FROM {tabela} WHERE "{col}" IS NOT NULL;').fetchone()[0]
-            summaries.append({
-                "Coluna": col,
-                "Registros Preenchidos": f"{non_null_count:,}",
-                "% Preenchido": f"{(non_null_count / total_rows * 100):.2f}%" if total_rows > 0 else "0.00%"
-            })
-        summary_df = pd.DataFrame(summaries)
-        print(summary_df.to_string(index=False))
+        print("\nPerfil das Colunas (preenchimento, distintos aproximados e faixa de valores):")
+        exibicao = perfil[['coluna', 'tipo', 'pct_preenchido', 'distintos_aprox', 'minimo', 'maximo', 'mediana']].assign(
+            tipo=perfil['tipo'].str.replace(r"^ENUM\(.*\)$", "ENUM", regex=True))
+        print(exibicao.to_string(index=False, float_format='{:,.2f}'.format))
+
+        if relatorio_dir is not None:
+            Path(relatorio_dir).mkdir(parents=True, exist_ok=True)
+            perfil.to_csv(Path(relatorio_dir) / f"{tabela}_perfil_colunas.csv", index=False)
+
+        anterior = ultima_versao_perfil(conexao, tabela)
+        atual = perfil
+        if persistir:
+            versao = salvar_perfil(conexao, tabela, perfil)
+            log.info(f"Perfil gravado em '{TABLE_PERFIL_COLUNAS}' como versão {versao}.")
+            atual = carregar_perfil(conexao, tabela, versao)
+        if anterior >= 1:
+            diff = comparar_perfis(carregar_perfil(conexao, tabela, anterior), atual)
+            alertas = diff[diff['alerta']]
+            if alertas.empty:
+                print(f"\nSem variações relevantes em relação à versão {anterior} do perfil.")
+            else:
+                print(f"\nColunas com variação relevante em relação à versão {anterior} do perfil:")
+                print(alertas[['coluna', 'situacao', 'tipo_alterado', 'pct_preenchido_anterior', 'pct_preenchido_atual', 'variacao_distintos_aprox_pct',
+                               'variacao_mediana_pct', 'faixa_alterada']].to_string(index=False, float_format='{:,.2f}'.format))
+            if relatorio_dir is not None:
+                diff.to_csv(Path(relatorio_dir) / f"{tabela}_perfil_colunas_diff.csv", index=False)
+        return perfil
 
     except Exception as e:
         log.error(f"Falha na auditoria detalhada da tabela '{tabela}': {e}")
+        if persistir:
+            raise
 
 
 def auditar_tabela_mapeamento(conexao, tabela, relatorio_dir, n=5):
@@ -75,10 +204,11 @@ def auditar_tabela_mapeamento(conexao, tabela, relatorio_dir, n=5):
         log.error(f"Falha na auditoria da tabela de mapeamento '{tabela}': {e}")
 
 
-def executar_auditoria_completa(relatorio_dir="dados/relatorios_etl"):
+def executar_auditoria_completa(relatorio_dir="dados/relatorios_etl", perfilar_tabela_final=True):
     """
     Executa a auditoria completa: uma análise detalhada da tabela final e uma
-    análise simples das tabelas de mapeamento.
+    análise simples das tabelas de mapeamento. Depois do ETL use perfilar_tabela_final=False:
+    a etapa 'perfil' já perfilou a tabela final e comparou com a versão anterior.
     """
     log.info("--- INICIANDO AUDITORIA COMPLETA PÓS-ETL NO BANCO DE DADOS ---")
     relatorio_path = Path(relatorio_dir)
@@ -86,11 +216,13 @@ def executar_auditoria_completa(relatorio_dir="dados/relatorios_etl"):
     
     conexao = None
     try:
+        # Só leitura: o perfil de cada carga é gravado pela etapa 'perfil' do ETL, antes da publicação
         conexao = duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=True)
         log.info(f"Conexão de auditoria estabelecida com: {DUCKDB_FILE_PATH}")
         
-        # 1. Auditoria detalhada da tabela principal
-        auditar_tabela_final(conexao, TABLE_NAME)
+        # 1. Auditoria detalhada da tabela principal (perfil + diff com a última versão gravada)
+        if perfilar_tabela_final:
+            auditar_tabela_final(conexao, TABLE_NAME, relatorio_path, persistir=False)
         
         # 2. Auditoria simples das tabelas de mapeamento
         tabelas_mapeamento = [TABLE_MAPEAMENTO, TABLE_ATC, TABLE_MUNICIPIOS]
@@ -0,0 +1,112 @@
+# scripts/benchmark_concorrencia_dashboard.py
+# Teste de carga do acesso do dashboard ao DuckDB: N sessões simultâneas (threads) disparam as
+# consultas das páginas sobre uma única conexão compartilhada (modelo antigo de
+# get_duckdb_connection) e sobre o pool de cursores (PoolCursores). Mede a vazão (consultas/s)
+# e a latência p50/p95 de cada combinação.
+import argparse
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from scripts.benchmark_layout_prescricoes import _consultas_paginas
+from src.utils.database_utils import DUCKDB_FILE_PATH
+from src.utils.pool_cursores_utils import PoolCursores
+
+SESSOES_PADRAO = (1, 2, 4, 8)
+
+class _ConexaoCompartilhada:
+    """Mesma interface de PoolCursores.cursor(), mas todas as sessões usam o mesmo objeto de conexão."""
+
+    def __init__(self, caminho):
+        self._conexao = duckdb.connect(str(caminho), read_only=True)
+
+    @contextmanager
+    def cursor(self):
+        yield self._conexao
+
+    def fechar(self):
+        self._conexao.close()
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def _rodar_carga(acesso, consultas, sessoes, rodadas):
+    """Cada sessão executa `rodadas` vezes todas as consultas; retorna (segundos totais, latências em ms)."""
+    latencias = []
+    lock = threading.Lock()
+
+    def sessao(_):
+        medidas = []
+        for _ in range(rodadas):
+            for consulta in consultas.values():
+                inicio = time.perf_counter()
+                with acesso.cursor() as cursor:
+                    cursor.execute(consulta).fetchall()
+                medidas.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(medidas)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessoes) as executor:
+        list(executor.map(sessao, range(sessoes)))
+    return time.perf_counter() - inicio, latencias
+
+def executar_benchmark(banco=DUCKDB_FILE_PATH, sessoes=SESSOES_PADRAO, rodadas=3):
+    """Retorna um DataFrame com vazão e latência por modo de acesso ('compartilhada'/'pool') e número de sessões."""
+    consultas = _consultas_paginas(banco)
+    linhas = []
+    for n in sessoes:
+        for modo in ('compartilhada', 'pool'):
+            if modo == 'pool':
+                acesso = PoolCursores(lambda: duckdb.connect(str(banco), read_only=True), n)
+            else:
+                acesso = _ConexaoCompartilhada(banco)
+            try:
+                _rodar_carga(acesso, consultas, 1, 1)  # aquecimento (cache de páginas do arquivo, cursores)
+                print(f"Sessões: {n} | acesso: {modo}...")
+                segundos, latencias = _rodar_carga(acesso, consultas, n, rodadas)
+            finally:
+                acesso.fechar()
+            linhas.append({
+                'sessoes': n,
+                'acesso': modo,
+                'consultas': len(latencias),
+                'consultas_por_s': len(latencias) / segundos,
+                'p50_ms': statistics.median(latencias),
+                'p95_ms': _percentil(latencias, 95),
+            })
+    resultado = pd.DataFrame(linhas)
+    base = resultado.set_index(['sessoes', 'acesso'])['consultas_por_s']
+    resultado['ganho_pool'] = resultado.apply(
+        lambda r: base[(r['sessoes'], 'pool')] / base[(r['sessoes'], 'compartilhada')] if r['acesso'] == 'pool' else None, axis=1)
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga: conexão única compartilhada x pool de cursores do dashboard.")
+    parser.add_argument("--banco", default=str(DUCKDB_FILE_PATH), help="Banco DuckDB gerado pelo ETL.")
+    parser.add_argument("--sessoes", type=int, nargs="+", default=list(SESSOES_PADRAO), help="Números de sessões simultâneas a testar.")
+    parser.add_argument("--rodadas", type=int, default=3, help="Vezes que cada sessão executa o conjunto de consultas.")
+    parser.add_argument("--salvar", metavar="CSV", help="Grava o resultado em CSV (ex.: dados/benchmarks/concorrencia.csv).")
+    args = parser.parse_args()
+
+    if not Path(args.banco).exists():
+        print(f"ERRO: banco não encontrado em '{args.banco}'. Execute o ETL primeiro.")
+        sys.exit(1)
+    resultado = executar_benchmark(args.banco, args.sessoes, args.rodadas)
+    with pd.option_context('display.float_format', '{:,.2f}'.format):
+        print(resultado.to_string(index=False))
+    if args.salvar:
+        Path(args.salvar).parent.mkdir(parents=True, exist_ok=True)
+        resultado.to_csv(args.salvar, index=False)
+        print(f"Resultado salvo em {args.salvar}")
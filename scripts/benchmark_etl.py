@@ -0,0 +1,155 @@
+# scripts/benchmark_etl.py
+# Benchmark do ETL sobre dados sintéticos (src/utils/dados_sinteticos_utils.py): para cada tamanho
+# gera (ou reaproveita) os CSVs, executa o pipeline em um banco temporário e mede cada ETAPA
+# (tempo, vazão em linhas/s e pico de memória). Compara com a baseline gravada e sai com código 1
+# se alguma etapa regredir além da tolerância. Roda offline.
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.utils.database_utils import BASE_DIR, PERFIS_RECURSOS_ETL, get_db_connection_for_etl
+from src.utils.dados_sinteticos_utils import (
+    TAMANHOS_SINTETICOS, SEMENTE_PADRAO, gerar_csvs_sngpc, criar_mapeamentos_sinteticos,
+)
+from src.utils.instrumentacao_utils import carregar_relatorio, PREFIXO_RELATORIO
+
+BENCHMARK_DIR = BASE_DIR / "dados" / "benchmarks"
+DADOS_SINTETICOS_DIR = BASE_DIR / "dados" / "sinteticos"
+ARQUIVO_BASELINE = BENCHMARK_DIR / "baseline_etl.json"
+PERFIL_BENCHMARK = 'laptop'
+# Queda de vazão ou alta de memória (em %) acima da qual uma etapa é considerada regredida
+TOLERANCIA_PCT = 20.0
+# Etapas mais curtas que isto (na baseline e na medição) não são avaliadas: o ruído domina
+TEMPO_MINIMO_AVALIADO_S = 1.0
+
+def _executar_tamanho(tamanho, semente, perfil, pasta_dados):
+    """
+    Gera os dados do tamanho e executa o ETL completo em um banco temporário. Roda em um
+    processo próprio, para que o pico de RSS medido seja só deste tamanho.
+    Retorna uma lista de medidas por etapa.
+    """
+    linhas = TAMANHOS_SINTETICOS[tamanho]
+    pasta_csv = Path(pasta_dados) / f"{tamanho}_semente{semente}"
+    gerar_csvs_sngpc(pasta_csv, linhas, semente)
+    with tempfile.TemporaryDirectory() as pasta:
+        conexao = get_db_connection_for_etl(perfil, caminho=Path(pasta) / "benchmark.duckdb", temp_directory=Path(pasta) / "duckdb_tmp")
+        try:
+            criar_mapeamentos_sinteticos(conexao)
+            from scripts.etl import executar_pipeline_etl_sql
+            if not executar_pipeline_etl_sql(conexao, pasta_csv, reprocessar_tudo=True, relatorio_dir=Path(pasta) / "relatorios"):
+                raise RuntimeError(f"O ETL falhou no tamanho {tamanho}.")
+        finally:
+            conexao.close()
+        relatorio = carregar_relatorio(next((Path(pasta) / "relatorios").glob(f"{PREFIXO_RELATORIO}_*.json")))
+
+    medidas = [
+        {'tamanho': tamanho, 'linhas': linhas, 'etapa': registro['etapa'], 'tempo_parede_s': registro['tempo_parede_s'],
+         'tempo_cpu_s': registro['tempo_cpu_s'], 'pico_rss_mb': registro['pico_rss_mb']}
+        for registro in relatorio.to_dict('records')
+    ]
+    medidas.append({
+        'tamanho': tamanho, 'linhas': linhas, 'etapa': 'total',
+        'tempo_parede_s': float(relatorio['tempo_parede_s'].sum()), 'tempo_cpu_s': float(relatorio['tempo_cpu_s'].sum()),
+        'pico_rss_mb': relatorio['pico_rss_mb'].max(),
+    })
+    for medida in medidas:
+        medida['linhas_por_s'] = linhas / medida['tempo_parede_s'] if medida['tempo_parede_s'] else None
+    return medidas
+
+def executar_benchmark(tamanhos, semente=SEMENTE_PADRAO, perfil=PERFIL_BENCHMARK, pasta_dados=DADOS_SINTETICOS_DIR):
+    """Executa o benchmark de cada tamanho (um processo por tamanho) e retorna as medidas como DataFrame."""
+    medidas = []
+    for tamanho in tamanhos:
+        print(f"\n=== Benchmark do ETL: {tamanho} ({TAMANHOS_SINTETICOS[tamanho]:,} linhas, perfil '{perfil}') ===")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            medidas += executor.submit(_executar_tamanho, tamanho, semente, perfil, str(pasta_dados)).result()
+    return pd.DataFrame(medidas)
+
+def _ambiente(perfil, semente):
+    return {'maquina': platform.node(), 'plataforma': platform.platform(), 'python': platform.python_version(),
+            'duckdb': duckdb.__version__, 'nucleos': multiprocessing.cpu_count(), 'perfil_recursos': perfil, 'semente': semente}
+
+def carregar_baseline(caminho=ARQUIVO_BASELINE):
+    """Baseline gravada ({'ambiente': ..., 'medidas': [...]}) ou None."""
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def salvar_baseline(resultado, ambiente, caminho=ARQUIVO_BASELINE):
+    """Grava o resultado como baseline, substituindo só os tamanhos medidos agora."""
+    anterior = carregar_baseline(caminho)
+    medidas = pd.DataFrame(anterior['medidas']) if anterior else pd.DataFrame(columns=resultado.columns)
+    medidas = pd.concat([medidas[~medidas['tamanho'].isin(resultado['tamanho'])], resultado], ignore_index=True)
+    Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump({'ambiente': ambiente, 'gravada_em': datetime.now().isoformat(timespec='seconds'),
+                   'medidas': medidas.to_dict('records')}, f, ensure_ascii=False, indent=2, default=str)
+
+def comparar_com_baseline(resultado, baseline, tolerancia_pct=TOLERANCIA_PCT):
+    """
+    Junta as medidas com as da baseline (mesmo tamanho e etapa) e marca como regressão a
+    queda de vazão ou a alta do pico de memória acima de tolerancia_pct. Etapas com menos
+    de TEMPO_MINIMO_AVALIADO_S só têm a memória avaliada.
+    """
+    base = pd.DataFrame(baseline['medidas'])[['tamanho', 'etapa', 'linhas_por_s', 'pico_rss_mb', 'tempo_parede_s']]
+    comparacao = resultado.merge(base, on=['tamanho', 'etapa'], how='left', suffixes=('', '_baseline'))
+    comparacao['vazao_var_pct'] = (comparacao['linhas_por_s'] - comparacao['linhas_por_s_baseline']) / comparacao['linhas_por_s_baseline'] * 100
+    comparacao['memoria_var_pct'] = (comparacao['pico_rss_mb'] - comparacao['pico_rss_mb_baseline']) / comparacao['pico_rss_mb_baseline'] * 100
+    avaliavel = comparacao[['tempo_parede_s', 'tempo_parede_s_baseline']].max(axis=1) >= TEMPO_MINIMO_AVALIADO_S
+    comparacao['regressao'] = (avaliavel & (comparacao['vazao_var_pct'] < -tolerancia_pct)) | (comparacao['memoria_var_pct'] > tolerancia_pct)
+    return comparacao
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do ETL sobre dados sintéticos do SNGPC, com comparação contra a baseline.")
+    parser.add_argument("--tamanhos", nargs='+', choices=list(TAMANHOS_SINTETICOS), default=['100k'], help="Tamanhos a medir.")
+    parser.add_argument("--semente", type=int, default=SEMENTE_PADRAO, help="Semente do gerador de dados.")
+    parser.add_argument("--perfil-recursos", choices=list(PERFIS_RECURSOS_ETL), default=PERFIL_BENCHMARK, help="Perfil de memória/threads do DuckDB.")
+    parser.add_argument("--dados", default=str(DADOS_SINTETICOS_DIR), help="Pasta dos CSVs sintéticos (reaproveitados entre execuções).")
+    parser.add_argument("--baseline", default=str(ARQUIVO_BASELINE), help="Arquivo JSON da baseline.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PCT, help="Variação tolerada, em %%, antes de acusar regressão.")
+    parser.add_argument("--salvar-baseline", action='store_true', help="Grava o resultado desta execução como a nova baseline.")
+    args = parser.parse_args()
+
+    resultado = executar_benchmark(args.tamanhos, args.semente, args.perfil_recursos, args.dados)
+    ambiente = _ambiente(args.perfil_recursos, args.semente)
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    caminho_resultado = BENCHMARK_DIR / f"benchmark_etl_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(caminho_resultado, 'w', encoding='utf-8') as f:
+        json.dump({'ambiente': ambiente, 'medidas': resultado.to_dict('records')}, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nResultado gravado em: {caminho_resultado}")
+
+    colunas = ['tamanho', 'etapa', 'tempo_parede_s', 'linhas_por_s', 'pico_rss_mb']
+    baseline = carregar_baseline(args.baseline)
+    regrediu = False
+    if baseline is None:
+        print("Nenhuma baseline encontrada; use --salvar-baseline para gravar esta execução como referência.")
+        tabela = resultado[colunas]
+    else:
+        if baseline['ambiente'] != ambiente:
+            print(f"AVISO: baseline gravada em outro ambiente ({baseline['ambiente']}); a comparação pode não ser justa.")
+        comparacao = comparar_com_baseline(resultado, baseline, args.tolerancia)
+        tabela = comparacao[colunas + ['vazao_var_pct', 'memoria_var_pct', 'regressao']]
+        regrediu = bool(comparacao['regressao'].any())
+    with pd.option_context('display.float_format', '{:,.2f}'.format, 'display.width', 200):
+        print(tabela.to_string(index=False))
+
+    if args.salvar_baseline:
+        salvar_baseline(resultado, ambiente, args.baseline)
+        print(f"Baseline atualizada em: {args.baseline}")
+    elif regrediu:
+        print(f"\nREGRESSÃO: etapa(s) com vazão ou memória pior que a baseline além de {args.tolerancia:.0f}%.")
+        sys.exit(1)
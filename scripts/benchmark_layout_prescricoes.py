@@ -0,0 +1,100 @@
+# scripts/benchmark_layout_prescricoes.py
+# Compara os layouts físicos de 'prescricoes': tabela na ordem de carga com os índices ART
+# por coluna (layout antigo) x tabela ordenada por ORDEM_FISICA_PRESCRICOES, com e sem índices.
+# Mede o tempo de gravação (tabela + índices), o tamanho do arquivo e a latência das
+# consultas das páginas.
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from scripts.etl import COLUNAS_INDICES, ORDEM_FISICA_PRESCRICOES
+from src.utils.benchmark_utils import cronometrar_consultas, tamanho_arquivo_mb
+from src.utils.database_utils import DUCKDB_FILE_PATH, TABLE_NAME
+
+# Variante -> (ordenar pela chave física?, criar os índices ART?)
+VARIANTES = {
+    'indices': (False, True),
+    'ordenado': (True, False),
+    'ordenado_indices': (True, True),
+}
+
+def _consultas_paginas(origem):
+    """
+    Consultas no formato das páginas (WHERE de build_where_clause + agregação), com os
+    valores mais frequentes da tabela de origem nos filtros.
+    """
+    conexao = duckdb.connect(str(origem), read_only=True)
+    try:
+        def mais_frequente(coluna):
+            return conexao.execute(
+                f"SELECT {coluna} FROM {TABLE_NAME} WHERE {coluna} IS NOT NULL GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1"
+            ).fetchone()[0].replace("'", "''")
+        uf, municipio, principio = (mais_frequente(c) for c in ('sigla_uf', 'nome_municipio', 'principio_ativo'))
+        ano, mes = conexao.execute(f"SELECT max(ano), max(mes) FROM {TABLE_NAME} WHERE ano = (SELECT max(ano) FROM {TABLE_NAME})").fetchone()
+    finally:
+        conexao.close()
+    base = f"FROM {TABLE_NAME} WHERE ano IN (2019, 2020)"
+    return {
+        'metricas_visao_geral': f"SELECT COUNT(*), COUNT(DISTINCT nome_municipio), COUNT(DISTINCT principio_ativo) {base}",
+        'top10_principios_uf': f"SELECT principio_ativo, COUNT(*) AS total {base} AND sigla_uf = '{uf}' GROUP BY 1 ORDER BY total DESC LIMIT 10",
+        'evolucao_municipio': f"SELECT data, SUM(quantidade_vendida) {base} AND nome_municipio = '{municipio}' GROUP BY 1 ORDER BY 1",
+        'faixa_etaria_principio': f"SELECT faixa_etaria, COUNT(*) {base} AND principio_ativo = '{principio}' GROUP BY 1",
+        'amostra_mes': f"SELECT * {base} AND ano = {ano} AND mes = {mes} LIMIT 1000",
+        'ponto_uf_municipio_mes': f"SELECT SUM(quantidade_vendida) {base} AND ano = {ano} AND mes = {mes} AND sigla_uf = '{uf}' AND nome_municipio = '{municipio}'",
+        'por_classe_ano': f"SELECT ano, classe_terapeutica, SUM(quantidade_vendida) {base} GROUP BY ALL",
+    }
+
+def _gravar_variante(origem, destino, ordenar, indexar):
+    """Grava a variante em um banco novo e retorna o tempo de gravação em segundos."""
+    conexao = duckdb.connect(str(destino))
+    try:
+        conexao.execute(f"ATTACH '{origem}' AS origem (READ_ONLY);")
+        inicio = time.perf_counter()
+        ordem = f" ORDER BY {', '.join(ORDEM_FISICA_PRESCRICOES)}" if ordenar else ""
+        conexao.execute(f"CREATE TABLE {TABLE_NAME} AS SELECT * FROM origem.{TABLE_NAME}{ordem};")
+        if indexar:
+            for coluna in COLUNAS_INDICES:
+                conexao.execute(f"CREATE INDEX idx_{coluna} ON {TABLE_NAME} ({coluna});")
+        conexao.execute("CHECKPOINT;")
+        segundos = time.perf_counter() - inicio
+        conexao.execute("DETACH origem;")
+    finally:
+        conexao.close()
+    return segundos
+
+def executar_benchmark(origem=DUCKDB_FILE_PATH, repeticoes=5):
+    """Grava as variantes em uma pasta temporária e retorna a comparação como DataFrame (uma coluna por variante)."""
+    consultas = _consultas_paginas(origem)
+    resultado = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        for variante, (ordenar, indexar) in VARIANTES.items():
+            destino = Path(pasta) / f"{variante}.duckdb"
+            print(f"Gravando a variante '{variante}'...")
+            medidas = {'gravacao_s': _gravar_variante(origem, destino, ordenar, indexar), 'tamanho_arquivo_mb': tamanho_arquivo_mb(destino)}
+            print(f"Cronometrando {len(consultas)} consultas ({repeticoes} repetições)...")
+            medidas.update({f'{nome}_ms': ms for nome, ms in cronometrar_consultas(destino, consultas, repeticoes).items()})
+            resultado[variante] = medidas
+    comparacao = pd.DataFrame(resultado)
+    comparacao.index.name = 'medida'
+    comparacao['ordenado_var_pct'] = (comparacao['ordenado'] - comparacao['indices']) / comparacao['indices'] * 100
+    return comparacao.reset_index()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos layouts físicos de 'prescricoes' (índices ART x tabela ordenada).")
+    parser.add_argument("--banco", default=str(DUCKDB_FILE_PATH), help="Banco DuckDB gerado pelo ETL.")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Execuções cronometradas por consulta.")
+    args = parser.parse_args()
+
+    if not Path(args.banco).exists():
+        print(f"ERRO: banco não encontrado em '{args.banco}'. Execute o ETL primeiro.")
+        sys.exit(1)
+    with pd.option_context('display.float_format', '{:,.2f}'.format):
+        print(executar_benchmark(args.banco, args.repeticoes).to_string(index=False))
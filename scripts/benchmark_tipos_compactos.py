@@ -0,0 +1,80 @@
+# scripts/benchmark_tipos_compactos.py
+# Compara o esquema compacto de 'prescricoes' (ENUMs, SMALLINT/TINYINT/REAL) com o esquema
+# largo anterior (VARCHAR/INTEGER/DOUBLE): tamanho em disco e tempo das consultas do dashboard.
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.utils.benchmark_utils import cronometrar_consultas
+from src.utils.database_utils import DUCKDB_FILE_PATH, TABLE_NAME
+
+# Tipos que a tabela tinha antes do esquema compacto
+TIPOS_LARGOS = {
+    'ano': 'INTEGER', 'mes': 'INTEGER', 'idade': 'INTEGER', 'quantidade_vendida': 'DOUBLE',
+    'sigla_uf': 'VARCHAR', 'sexo': 'VARCHAR', 'conselho_prescritor': 'VARCHAR', 'classe_terapeutica': 'VARCHAR',
+    'forma_farmaceutica': 'VARCHAR', 'anvisa_lista': 'VARCHAR', 'faixa_etaria': 'VARCHAR',
+}
+
+# Agregações no formato dos widgets das páginas de exploração e estatística
+CONSULTAS = {
+    'total_por_ano': f"SELECT ano, SUM(quantidade_vendida) FROM {TABLE_NAME} WHERE ano IN (2019, 2020) GROUP BY ano",
+    'contagem_por_uf_ano': f"SELECT ano, sigla_uf, COUNT(*) FROM {TABLE_NAME} WHERE ano IN (2019, 2020) GROUP BY ano, sigla_uf",
+    'contagem_por_sexo_faixa': f"SELECT sexo, faixa_etaria, COUNT(*) FROM {TABLE_NAME} GROUP BY sexo, faixa_etaria",
+    'qtd_por_classe': f"SELECT classe_terapeutica, SUM(quantidade_vendida) FROM {TABLE_NAME} GROUP BY classe_terapeutica",
+    'qtd_por_lista_forma': f"SELECT anvisa_lista, forma_farmaceutica, AVG(quantidade_vendida) FROM {TABLE_NAME} GROUP BY ALL",
+    'evolucao_mensal': f"SELECT ano, mes, SUM(quantidade_vendida) FROM {TABLE_NAME} WHERE conselho_prescritor = 'CRM' GROUP BY ano, mes",
+    'media_idade_por_uf': f"SELECT sigla_uf, AVG(idade) FROM {TABLE_NAME} GROUP BY sigla_uf",
+}
+
+def _criar_copia(origem, destino, largo):
+    """Copia 'prescricoes' para um banco novo, no esquema largo ou como está (compacto)."""
+    conexao = duckdb.connect(str(destino))
+    try:
+        conexao.execute(f"ATTACH '{origem}' AS origem (READ_ONLY);")
+        colunas = [c[0] for c in conexao.execute(f"DESCRIBE origem.{TABLE_NAME}").fetchall()]
+        selecao = ", ".join(
+            f'CAST("{c}" AS {TIPOS_LARGOS[c]}) AS "{c}"' if largo and c in TIPOS_LARGOS else f'"{c}"'
+            for c in colunas
+        )
+        conexao.execute(f"CREATE TABLE {TABLE_NAME} AS SELECT {selecao} FROM origem.{TABLE_NAME};")
+        conexao.execute("DETACH origem;")
+        conexao.execute("CHECKPOINT;")
+    finally:
+        conexao.close()
+    return Path(destino).stat().st_size
+
+def executar_benchmark(origem=DUCKDB_FILE_PATH, repeticoes=5):
+    """Monta as duas cópias em uma pasta temporária e retorna a comparação como DataFrame."""
+    with tempfile.TemporaryDirectory() as pasta:
+        print("Criando cópia no esquema largo...")
+        bytes_largo = _criar_copia(origem, Path(pasta) / "largo.duckdb", largo=True)
+        print("Criando cópia no esquema compacto...")
+        bytes_compacto = _criar_copia(origem, Path(pasta) / "compacto.duckdb", largo=False)
+        print(f"Cronometrando {len(CONSULTAS)} consultas ({repeticoes} repetições)...")
+        tempos_largo = cronometrar_consultas(Path(pasta) / "largo.duckdb", CONSULTAS, repeticoes)
+        tempos_compacto = cronometrar_consultas(Path(pasta) / "compacto.duckdb", CONSULTAS, repeticoes)
+
+    linhas = [{'medida': 'tamanho_arquivo_mb', 'largo': bytes_largo / 1024 ** 2, 'compacto': bytes_compacto / 1024 ** 2}]
+    linhas += [{'medida': f'{nome}_ms', 'largo': tempos_largo[nome], 'compacto': tempos_compacto[nome]} for nome in CONSULTAS]
+    resultado = pd.DataFrame(linhas)
+    resultado['var_pct'] = (resultado['compacto'] - resultado['largo']) / resultado['largo'] * 100
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do esquema compacto de 'prescricoes' (antes/depois).")
+    parser.add_argument("--banco", default=str(DUCKDB_FILE_PATH), help="Banco DuckDB gerado pelo ETL.")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Execuções cronometradas por consulta.")
+    args = parser.parse_args()
+
+    if not Path(args.banco).exists():
+        print(f"ERRO: banco não encontrado em '{args.banco}'. Execute o ETL primeiro.")
+        sys.exit(1)
+    with pd.option_context('display.float_format', '{:,.2f}'.format):
+        print(executar_benchmark(args.banco, args.repeticoes).to_string(index=False))
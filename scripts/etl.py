@@ -3,15 +3,27 @@ from pathlib import Path
 import duckdb
 import pandas as pd
 import sys
-from unidecode import unidecode
 import logging
 import time
+import hashlib
+import json
+import shutil
+import argparse
+from datetime import datetime
 
 # Adiciona a pasta raiz ao caminho do Python
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
-from src.utils.database_utils import get_db_connection_for_etl, DUCKDB_FILE_PATH, TABLE_NAME, TABLE_MAPEAMENTO, TABLE_ATC, TABLE_MUNICIPIOS
+from src.utils.database_utils import get_db_connection_for_etl, PERFIS_RECURSOS_ETL, PERFIL_RECURSOS_PADRAO, DUCKDB_FILE_PATH, TABLE_NAME, TABLE_MAPEAMENTO, TABLE_ATC, TABLE_MUNICIPIOS, TABLE_DICIONARIO_PA, TABLE_APRESENTACOES, TABLE_AGREGADO, PARQUET_DIR_PATH, COLUNAS_PARTICAO_PARQUET, VERSOES_DIR_PATH
+from src.utils.normalizacao_utils import atualizar_dicionario_principios, aplicar_join_key, aplicar_datas_vigencia, VERSAO_NORMALIZACAO
+from src.utils.normalizacao_utils import atualizar_apresentacoes, REGRAS_FORMA_FARMACEUTICA, FORMA_NAO_ESPECIFICADA, VERSAO_APRESENTACOES
+from src.utils.config_utils import carregar_config
+from src.utils.mapeamentos_utils import atualizar_mapeamentos, hash_arquivo
+from src.utils.agregados_utils import materializar_agregado
+from src.utils.publicacao_utils import publicar_versao, remover_versoes_antigas
+from src.utils.instrumentacao_utils import medir_etapa, salvar_relatorio, comparar_relatorios, RELATORIO_DIR_PADRAO
+from scripts.auditoria_etl_bd import auditar_tabela_final, TABLE_PERFIL_COLUNAS
 
 # Configuração básica do logging
 logging.basicConfig(
@@ -21,324 +33,1125 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
-def validar_dataframe(df):
-    # Exemplo: checar colunas obrigatórias
-    colunas_obrigatorias = ['ano', 'mes', 'principio_ativo'] # ...adicione outras se necessário
-    for col in colunas_obrigatorias:
-        if col not in df.columns:
-            log.error(f"Coluna obrigatória ausente: {col}")
-            raise ValueError(f"Coluna obrigatória ausente: {col}")
-    # Outras validações podem ser adicionadas aqui
+# Schema explícito da tabela de staging, na ordem das colunas dos CSVs brutos do SNGPC
+SCHEMA_PRESCRICOES_RAW = {
+    'ano': 'VARCHAR', 'mes': 'VARCHAR', 'sigla_uf': 'VARCHAR', 'id_municipio': 'VARCHAR',
+    'principio_ativo': 'VARCHAR', 'descricao_apresentacao': 'VARCHAR', 'quantidade_vendida': 'VARCHAR',
+    'unidade_medida': 'VARCHAR', 'conselho_prescritor': 'VARCHAR', 'sigla_uf_conselho_prescritor': 'VARCHAR',
+    'tipo_receituario': 'VARCHAR', 'cid10': 'VARCHAR', 'sexo': 'VARCHAR', 'idade': 'VARCHAR', 'unidade_idade': 'VARCHAR',
+}
 
-def executar_pipeline_etl_sql(conexao, caminho_pasta_entrada):
+# 'duckdb' usa o leitor de CSV paralelo do DuckDB; 'pandas' mantém a leitura antiga em lotes
+MODO_INGESTAO_PADRAO = "duckdb"
+
+# Tabelas de controle da carga incremental
+TABLE_MANIFESTO = "etl_manifesto"
+TABLE_PERIODOS_AFETADOS = "etl_periodos_afetados"
+TABLE_PARAMETROS = "etl_parametros"
+
+# Registro das execuções e das etapas do pipeline (permite retomar uma execução interrompida)
+TABLE_ETL_RUNS = "etl_runs"
+TABLE_ETL_STAGES = "etl_stages"
+
+# Tabela de staging com os CSVs brutos
+TABELA_RAW = "prescricoes_raw"
+# Tabelas cuja assinatura de entrada é só a contagem de linhas (hash do conteúdo seria caro demais)
+TABELAS_VOLUMOSAS = (TABELA_RAW, TABLE_NAME)
+COLUNAS_DERIVADAS = ('join_key', 'data_inclusao', 'data_exclusao')
+
+# Colunas de baixa cardinalidade da tabela final gravadas como ENUM (coluna -> tipo). Os domínios
+# definidos pelo próprio ETL têm valores fixos, na ordem natural; os demais vêm dos mapeamentos
+# e dos valores distintos da staging (ver _valores_enum).
+TIPOS_ENUM = {
+    'sigla_uf': 'enum_sigla_uf',
+    'sexo': 'enum_sexo',
+    'conselho_prescritor': 'enum_conselho_prescritor',
+    'classe_terapeutica': 'enum_classe_terapeutica',
+    'forma_farmaceutica': 'enum_forma_farmaceutica',
+    'anvisa_lista': 'enum_anvisa_lista',
+    'faixa_etaria': 'enum_faixa_etaria',
+}
+SEXOS = ['Masculino', 'Feminino', 'Não Informado']
+FORMAS_FARMACEUTICAS = [forma for _, forma in REGRAS_FORMA_FARMACEUTICA] + [FORMA_NAO_ESPECIFICADA]
+FAIXAS_ETARIAS = ['Criança (0-14)', 'Jovem Adulto (15-24)', 'Adulto (25-59)', 'Idoso (60-64)', 'Idoso (65+)', 'Desconhecida']
+
+# Schema da tabela final, na ordem das colunas produzidas por _etapa_tabela_final. As colunas
+# de TIPOS_ENUM aparecem como VARCHAR (é como chegam em exportações CSV); o ENUM é aplicado
+# depois da carga. Usado por scripts/migrar_csv_DB.py para ler os CSVs processados sem inferência.
+SCHEMA_PRESCRICOES = {
+    'ano': 'SMALLINT', 'mes': 'TINYINT', 'data': 'DATE', 'sigla_uf': 'VARCHAR', 'id_municipio': 'VARCHAR',
+    'principio_ativo': 'VARCHAR', 'join_key': 'VARCHAR', 'descricao_apresentacao': 'VARCHAR', 'dosagem': 'VARCHAR',
+    'quantidade_vendida': 'REAL', 'cid10': 'VARCHAR', 'sexo': 'VARCHAR', 'idade': 'TINYINT',
+    'conselho_prescritor': 'VARCHAR', 'nome_municipio': 'VARCHAR', 'codigo_atc': 'VARCHAR',
+    'classe_terapeutica': 'VARCHAR', 'forma_farmaceutica': 'VARCHAR', 'anvisa_lista': 'VARCHAR',
+    'idade_modificada_flag': 'TINYINT', 'quantidade_modificada_flag': 'TINYINT', 'faixa_etaria': 'VARCHAR',
+    'periodo_valido_controlado': 'BOOLEAN',
+}
+
+# Layout físico da tabela final. 'ordenado' grava as linhas na ORDEM_FISICA_PRESCRICOES para que
+# os zone maps (min/max por row group) descartem row groups nos filtros das páginas; 'indices'
+# mantém a ordem de carga com um índice ART por coluna de COLUNAS_INDICES (layout antigo).
+LAYOUTS = ('ordenado', 'indices')
+LAYOUT_PADRAO = 'ordenado'
+ORDEM_FISICA_PRESCRICOES = ('ano', 'mes', 'sigla_uf', 'nome_municipio', 'principio_ativo')
+COLUNAS_INDICES = ['ano', 'nome_municipio', 'principio_ativo', 'data', 'faixa_etaria', 'anvisa_lista', 'sigla_uf', 'codigo_atc', 'classe_terapeutica']
+# Índices mantidos no layout ordenado: só os que scripts/benchmark_layout_prescricoes.py mostrar
+# que aceleram as consultas das páginas sobre a tabela ordenada (até agora, nenhum).
+INDICES_LAYOUT_ORDENADO = []
+
+# Validação por linha da staging. Cada regra é uma condição SQL vetorizada sobre as colunas
+# brutas, avaliada no próprio INSERT da carga (mesma passada da leitura dos CSVs); as linhas que
+# falham ficam fora da tabela final e são copiadas para TABLE_REJEITADAS com o motivo e a
+# posição no arquivo de origem. Valores ausentes não são rejeitados (idade ausente é imputada).
+TABLE_REJEITADAS = "prescricoes_rejeitadas"
+UFS_VALIDAS = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+               'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
+REGRAS_VALIDACAO = {
+    # Ano/mês ausentes ou não numéricos, ou mês fora de 1-12
+    'periodo_invalido': "try_cast(ano AS INTEGER) IS NULL OR COALESCE(try_cast(mes AS INTEGER) NOT BETWEEN 1 AND 12, TRUE)",
+    'quantidade_nao_numerica': "quantidade_vendida IS NOT NULL AND try_cast(replace(quantidade_vendida, ',', '.') AS DOUBLE) IS NULL",
+    # UF ausente (NULL ou vazia) não é rejeitada, só uma UF preenchida fora da lista
+    'uf_desconhecida': f"NULLIF(trim(sigla_uf), '') IS NOT NULL AND upper(trim(sigla_uf)) NOT IN ({', '.join(repr(uf) for uf in UFS_VALIDAS)})",
+    'idade_invalida': "idade IS NOT NULL AND try_cast(idade AS INTEGER) IS NULL",
+}
+
+def expressao_sql_motivo_rejeicao():
+    """Expressão SQL com as regras violadas pela linha separadas por '; ' (NULL se a linha é válida)."""
+    casos = ", ".join(f"CASE WHEN {condicao} THEN '{regra}' END" for regra, condicao in REGRAS_VALIDACAO.items())
+    return f"NULLIF(concat_ws('; ', {casos}), '')"
+
+def _normalizar_nome_coluna(col):
+    return col.lower().strip().replace(' ', '_')
+
+def _inspecionar_cabecalho(arquivo):
     """
-    Executa o pipeline completo de ETL usando uma abordagem híbrida robusta.
+    Lê a primeira linha do CSV e retorna (compatível, terminador de linha). Um arquivo é
+    compatível quando o cabeçalho segue a ordem do SCHEMA_PRESCRICOES_RAW.
     """
-    print("--- INICIANDO PIPELINE ETL (VERSÃO COM PADRONIZAÇÃO AVANÇADA) ---")
-    tabela_raw = "prescricoes_raw"
+    with open(arquivo, 'rb') as f:
+        primeira_linha = f.readline()
+    terminador = '\r\n' if primeira_linha.endswith(b'\r\n') else '\n'
+    cabecalho = primeira_linha.decode('latin1').strip().replace('"', '')
+    colunas = [_normalizar_nome_coluna(c) for c in cabecalho.split(',')]
+    return colunas == list(SCHEMA_PRESCRICOES_RAW), terminador
+
+def _carregar_raw_pandas(conexao, tabela_raw, arquivos_csv, tamanho_lote=500000):
+    """Carga em lotes via pandas (caminho antigo, mantido como fallback)."""
+    for arquivo in arquivos_csv:
+        print(f"--- Lendo arquivo (pandas): {arquivo.name} ---")
+        with pd.read_csv(arquivo, sep=',', low_memory=False, encoding='latin1', chunksize=tamanho_lote, dtype=str) as leitor:
+            for i, lote_df in enumerate(leitor):
+                print(f" - Processando lote {i+1} ({len(lote_df):,} linhas)...")
+                lote_df.columns = [_normalizar_nome_coluna(col) for col in lote_df.columns]
+                lote_df['arquivo_origem'] = str(arquivo)
+                conexao.execute(f"INSERT INTO {tabela_raw} BY NAME SELECT *, {expressao_sql_motivo_rejeicao()} AS motivo_rejeicao FROM lote_df;")
+
+def _lista_sql_arquivos(arquivos_csv):
+    return ", ".join("'" + str(a).replace("'", "''") + "'" for a in arquivos_csv)
+
+def _carregar_raw_duckdb(conexao, tabela_raw, arquivos_csv, terminador='\n'):
+    """
+    Carga de todos os CSVs em um único read_csv paralelo do DuckDB, com schema explícito.
+    As regras de REGRAS_VALIDACAO são avaliadas na mesma passada (coluna motivo_rejeicao).
+    """
+    colunas = ", ".join(f"'{nome}': '{tipo}'" for nome, tipo in SCHEMA_PRESCRICOES_RAW.items())
+    print(f"--- Lendo {len(arquivos_csv)} arquivo(s) com o leitor paralelo do DuckDB ---")
+    # O terminador de linha é informado explicitamente: com vários arquivos o DuckDB aplica o
+    # dialeto detectado no primeiro a todos, e um arquivo com outro terminador seria lido vazio.
+    conexao.execute(f"""
+        INSERT INTO {tabela_raw} BY NAME
+        SELECT *, {expressao_sql_motivo_rejeicao()} AS motivo_rejeicao FROM read_csv([{_lista_sql_arquivos(arquivos_csv)}],
+            header = true, delim = ',', quote = '"', encoding = 'latin-1', new_line = '{terminador.encode('unicode_escape').decode()}',
+            columns = {{{colunas}}}, parallel = true, filename = 'arquivo_origem');
+    """)
+
+def carregar_dados_brutos(conexao, tabela_raw, arquivos_csv, modo=MODO_INGESTAO_PADRAO):
+    """
+    Carrega os CSVs brutos na tabela de staging. No modo 'duckdb', arquivos com
+    cabeçalho fora do padrão (ou uma falha do leitor nativo) caem no caminho pandas.
+    """
+    if modo not in ("duckdb", "pandas"):
+        raise ValueError(f"Modo de ingestão inválido: {modo}")
+    # A ordem de inserção é preservada durante a carga: as linhas de cada arquivo ficam contíguas
+    # e na ordem do CSV, o que permite obter a linha de origem das rejeitadas pelo rowid.
+    preservar_ordem = conexao.execute("SELECT current_setting('preserve_insertion_order')").fetchone()[0]
+    conexao.execute("SET preserve_insertion_order = true;")
     try:
-        # ETAPA 0: Instalar extensões
-        print("\n[ETAPA 0/9] Instalando extensões do DuckDB (icu)...")
-        conexao.execute("INSTALL icu; LOAD icu;")
-        print("-> Extensão 'icu' carregada.")
-
-        # ETAPA 1: Carregar dados brutos em lotes para uma tabela de Staging
-        print(f"\n[ETAPA 1/9] Carregando dados brutos para a tabela '{tabela_raw}'...")
-        conexao.execute(f"DROP TABLE IF EXISTS {tabela_raw};")
-        pasta_dados_brutos = Path(caminho_pasta_entrada)
-        arquivos_csv = list(pasta_dados_brutos.glob('*.csv'))
-        if not arquivos_csv:
-            raise FileNotFoundError(f"Nenhum arquivo .csv encontrado em: {pasta_dados_brutos}")
-        
-        print(f"Encontrados {len(arquivos_csv)} arquivos para processar...")
-        # Define o schema explicitamente para garantir consistência
-        conexao.execute(f"CREATE TABLE {tabela_raw} (ano VARCHAR, mes VARCHAR, sigla_uf VARCHAR, id_municipio VARCHAR, principio_ativo VARCHAR, descricao_apresentacao VARCHAR, quantidade_vendida VARCHAR, unidade_medida VARCHAR, conselho_prescritor VARCHAR, sigla_uf_conselho_prescritor VARCHAR, tipo_receituario VARCHAR, cid10 VARCHAR, sexo VARCHAR, idade VARCHAR, unidade_idade VARCHAR);")
-        
-        tamanho_lote = 500000
-        for arquivo in arquivos_csv:
-            print(f"--- Lendo arquivo: {arquivo.name} ---")
-            with pd.read_csv(arquivo, sep=',', low_memory=False, encoding='latin1', chunksize=tamanho_lote, dtype=str) as leitor:
-                for i, lote_df in enumerate(leitor):
-                    print(f" - Processando lote {i+1} ({len(lote_df):,} linhas)...")
-                    lote_df.columns = [col.lower().strip().replace(' ', '_') for col in lote_df.columns]
-                    conexao.execute(f"INSERT INTO {tabela_raw} BY NAME SELECT * FROM lote_df;")
-        
-        total_bruto = conexao.execute(f"SELECT COUNT(*) FROM {tabela_raw}").fetchone()[0]
-        print(f"-> {total_bruto:,} registros brutos carregados com sucesso.")
-
-        # ETAPA 2: Padronização Avançada de Princípios Ativos (direto na tabela raw)
-        print("\n[ETAPA 2/9] Padronizando nomes de princípios ativos com Regex e Unaccent...")
-        conexao.execute(f"UPDATE {tabela_raw} SET principio_ativo = upper(strip_accents(trim(principio_ativo)));")
-        
-        # CORREÇÃO DE SINTAXE: Adicionado o ']' para fechar a lista
-        termos = [
-            'CLORIDRATO DE', 'BROMIDRATO DE', 'FOSFATO DE', 'ACETATO DE', 'DECANOATO DE', 'NITRATO DE',
-            'HEMISSULFATO DE', 'SUCCINATO DE', 'MALEATO DE', 'MESILATO DE', 'VALERATO DE', 'ESILATO DE',
-            'CIPIONATO DE', 'TRI-HIDRATADO', 'TRIHIDRATADA', 'MONOIDRATADO', 'DI-HIDRATADO', 'ANIDRO', 'OXALATO DE',
-            'SULFATO DE', 'CLORIDRATO', 'BROMIDRATO', 'FOSFATO', 'ACETATO', 'DECANOATO', 'NITRATO', 'SESQUI-HIDRATADO',
-            'UNDECILATO DE', 'DIPROPIONATO DE BETAMETASONA','CLORETO DE BENZALCONIO',
+        arquivos_pandas = list(arquivos_csv)
+        if modo == "duckdb":
+            arquivos_pandas, grupos_nativos = [], {}
+            for arquivo in arquivos_csv:
+                compativel, terminador = _inspecionar_cabecalho(arquivo)
+                if compativel:
+                    grupos_nativos.setdefault(terminador, []).append(arquivo)
+                else:
+                    log.warning(f"Cabeçalho fora do padrão em '{arquivo.name}'. Usando leitura via pandas.")
+                    arquivos_pandas.append(arquivo)
+            for terminador, arquivos_nativos in grupos_nativos.items():
+                try:
+                    _carregar_raw_duckdb(conexao, tabela_raw, arquivos_nativos, terminador)
+                except Exception as e:
+                    log.warning(f"Falha no leitor nativo do DuckDB ({e}). Recarregando esses arquivos via pandas.")
+                    conexao.execute(f"DELETE FROM {tabela_raw} WHERE arquivo_origem IN ({_lista_sql_arquivos(arquivos_nativos)});")
+                    arquivos_pandas.extend(arquivos_nativos)
+        if arquivos_pandas:
+            _carregar_raw_pandas(conexao, tabela_raw, arquivos_pandas)
+    finally:
+        conexao.execute(f"SET preserve_insertion_order = {str(preservar_ordem).lower()};")
+
+# --- Manifesto de arquivos (carga incremental) ---
+
+def _tabela_existe(conexao, tabela):
+    return conexao.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [tabela]).fetchone()[0] > 0
+
+def _expandir_periodos(inicio, fim):
+    """Lista os períodos AAAAMM entre inicio e fim (inclusive)."""
+    if inicio is None or fim is None:
+        return []
+    periodos, ano, mes = [], inicio // 100, inicio % 100
+    while ano * 100 + mes <= fim:
+        periodos.append(ano * 100 + mes)
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return periodos
+
+def garantir_manifesto(conexao):
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_MANIFESTO} (
+        caminho VARCHAR PRIMARY KEY,
+        tamanho_bytes BIGINT,
+        modificado_em_ns BIGINT,
+        hash_conteudo VARCHAR,
+        total_linhas BIGINT,
+        ano_mes_inicio INTEGER, -- AAAAMM
+        ano_mes_fim INTEGER,    -- AAAAMM
+        processado_em TIMESTAMP
+    );
+    """)
+
+def comparar_com_manifesto(conexao, arquivos_csv):
+    """
+    Classifica os arquivos em novos, alterados e inalterados em relação ao manifesto,
+    e identifica os arquivos do manifesto que não existem mais. O hash só é
+    recalculado quando tamanho ou data de modificação mudaram.
+    """
+    garantir_manifesto(conexao)
+    registrados = {
+        linha[0]: linha[1:]
+        for linha in conexao.execute(f"SELECT caminho, tamanho_bytes, modificado_em_ns, hash_conteudo, ano_mes_inicio, ano_mes_fim FROM {TABLE_MANIFESTO}").fetchall()
+    }
+    resultado = {'novos': [], 'alterados': [], 'inalterados': [], 'removidos': [], 'assinaturas': {}, 'registrados': registrados}
+    for arquivo in arquivos_csv:
+        info = arquivo.stat()
+        anterior = registrados.get(str(arquivo))
+        if anterior and anterior[0] == info.st_size and anterior[1] == info.st_mtime_ns:
+            hash_conteudo = anterior[2]
+        else:
+            hash_conteudo = hash_arquivo(arquivo)
+        resultado['assinaturas'][str(arquivo)] = (info.st_size, info.st_mtime_ns, hash_conteudo)
+        if anterior is None:
+            resultado['novos'].append(arquivo)
+        elif anterior[2] != hash_conteudo:
+            resultado['alterados'].append(arquivo)
+        else:
+            resultado['inalterados'].append(arquivo)
+    caminhos_atuais = {str(a) for a in arquivos_csv}
+    resultado['removidos'] = [c for c in registrados if c not in caminhos_atuais]
+    return resultado
+
+def _estatisticas_por_arquivo(conexao, tabela_raw):
+    """Linhas e intervalo (AAAAMM, só das linhas válidas) produzidos por cada arquivo presente na staging."""
+    return conexao.execute(f"""
+        SELECT arquivo_origem, COUNT(*),
+               MIN(try_cast(ano AS INTEGER) * 100 + try_cast(mes AS INTEGER)) FILTER (WHERE motivo_rejeicao IS NULL),
+               MAX(try_cast(ano AS INTEGER) * 100 + try_cast(mes AS INTEGER)) FILTER (WHERE motivo_rejeicao IS NULL)
+        FROM {tabela_raw} GROUP BY arquivo_origem
+    """).fetchall()
+
+def atualizar_manifesto(conexao, estatisticas, assinaturas, removidos, substituir_tudo=False):
+    """Grava no manifesto os arquivos processados nesta execução."""
+    if substituir_tudo:
+        conexao.execute(f"DELETE FROM {TABLE_MANIFESTO};")
+    for caminho in removidos:
+        conexao.execute(f"DELETE FROM {TABLE_MANIFESTO} WHERE caminho = ?", [caminho])
+    for caminho, total_linhas, inicio, fim in estatisticas:
+        tamanho, modificado_em_ns, hash_conteudo = assinaturas[caminho]
+        conexao.execute(f"INSERT OR REPLACE INTO {TABLE_MANIFESTO} VALUES (?, ?, ?, ?, ?, ?, ?, current_timestamp)",
+                        [caminho, tamanho, modificado_em_ns, hash_conteudo, total_linhas, inicio, fim])
+
+def garantir_tabela_rejeitadas(conexao):
+    colunas_raw = ", ".join(f"{nome} {tipo}" for nome, tipo in SCHEMA_PRESCRICOES_RAW.items())
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_REJEITADAS} (
+        arquivo_origem VARCHAR,
+        registro BIGINT, -- ordinal do registro no arquivo (1 = primeiro após o cabeçalho); não é a linha física
+        motivo VARCHAR, -- regras de REGRAS_VALIDACAO violadas, separadas por '; '
+        {colunas_raw},
+        run_id INTEGER,
+        registrado_em TIMESTAMP
+    );
+    """)
+    # Bancos anteriores guardavam 'linha' (ordinal + 1, supondo um registro por linha física)
+    if conexao.execute("SELECT COUNT(*) FROM duckdb_columns() WHERE table_name = ? AND column_name = 'linha'", [TABLE_REJEITADAS]).fetchone()[0]:
+        conexao.execute(f"ALTER TABLE {TABLE_REJEITADAS} RENAME COLUMN linha TO registro;")
+        conexao.execute(f"UPDATE {TABLE_REJEITADAS} SET registro = registro - 1;")
+
+def registrar_rejeitadas(conexao, tabela_raw, carregados, removidos, substituir_tudo=False, run_id=None):
+    """
+    Copia para TABLE_REJEITADAS as linhas da staging marcadas na carga (motivo_rejeicao), com o
+    arquivo e o ordinal do registro nele, substituindo as rejeitadas anteriores dos arquivos recarregados
+    ou removidos. Só a coluna de motivo é varrida por inteiro; as demais são lidas apenas para as
+    linhas rejeitadas. Retorna (linhas rejeitadas nesta carga, {regra: linhas que a violaram}).
+    """
+    garantir_tabela_rejeitadas(conexao)
+    if substituir_tudo:
+        conexao.execute(f"DELETE FROM {TABLE_REJEITADAS};")
+    elif carregados or removidos:
+        conexao.execute(f"DELETE FROM {TABLE_REJEITADAS} WHERE arquivo_origem IN ({_lista_sql_arquivos(list(carregados) + list(removidos))});")
+    colunas = ", ".join(f"r.{nome}" for nome in SCHEMA_PRESCRICOES_RAW)
+    # As linhas de cada arquivo foram inseridas contíguas e em ordem (ver carregar_dados_brutos), então
+    # a posição na staging é o ordinal do registro. O leitor não informa a linha física, que difere
+    # do ordinal quando um campo entre aspas tem quebras de linha
+    conexao.execute(f"""
+        INSERT INTO {TABLE_REJEITADAS}
+        SELECT r.arquivo_origem, r.rowid - i.primeiro_rowid + 1, r.motivo_rejeicao, {colunas}, ?, current_timestamp
+        FROM {tabela_raw} r
+        JOIN (SELECT arquivo_origem, MIN(rowid) AS primeiro_rowid FROM {tabela_raw} GROUP BY arquivo_origem) i
+          ON r.arquivo_origem = i.arquivo_origem
+        WHERE r.motivo_rejeicao IS NOT NULL
+    """, [run_id])
+    contagens = dict(conexao.execute(f"""
+        SELECT regra, COUNT(*) FROM (
+            SELECT unnest(string_split(motivo, '; ')) AS regra FROM {TABLE_REJEITADAS} WHERE run_id IS NOT DISTINCT FROM ?
+        ) GROUP BY regra
+    """, [run_id]).fetchall())
+    total = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_REJEITADAS} WHERE run_id IS NOT DISTINCT FROM ?", [run_id]).fetchone()[0]
+    return total, {regra: contagens.get(regra, 0) for regra in REGRAS_VALIDACAO}
+
+def _parametro_salvo(conexao, nome):
+    if not _tabela_existe(conexao, TABLE_PARAMETROS):
+        return None
+    linha = conexao.execute(f"SELECT valor FROM {TABLE_PARAMETROS} WHERE nome = ?", [nome]).fetchone()
+    return linha[0] if linha else None
+
+def _salvar_parametro(conexao, nome, valor):
+    conexao.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_PARAMETROS} (nome VARCHAR PRIMARY KEY, valor DOUBLE, atualizado_em TIMESTAMP);")
+    conexao.execute(f"INSERT OR REPLACE INTO {TABLE_PARAMETROS} VALUES (?, ?, current_timestamp)", [nome, valor])
+
+# --- Etapas do pipeline e registro de execuções (etl_runs / etl_stages) ---
+
+def garantir_registro_execucoes(conexao):
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_ETL_RUNS} (
+        run_id INTEGER,
+        iniciado_em TIMESTAMP,
+        finalizado_em TIMESTAMP,
+        status VARCHAR,     -- em_execucao | concluida | falhou
+        parametros VARCHAR, -- JSON com os argumentos da execução
+        contexto VARCHAR    -- JSON com o estado passado entre as etapas
+    );
+    """)
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_ETL_STAGES} (
+        run_id INTEGER,
+        ordem INTEGER,
+        etapa VARCHAR,
+        status VARCHAR,     -- em_execucao | concluida | falhou | pulada | reaproveitada
+        iniciado_em TIMESTAMP,
+        finalizado_em TIMESTAMP,
+        duracao_s DOUBLE,
+        fingerprint_entrada VARCHAR, -- SHA-256 das entradas abaixo
+        entradas VARCHAR,            -- JSON: assinaturas das tabelas lidas, parâmetros e arquivos
+        tabelas_saida VARCHAR,
+        erro VARCHAR
+    );
+    """)
+
+def _assinatura_tabela(conexao, tabela):
+    """
+    Assinatura barata de uma tabela de entrada: contagem de linhas para as tabelas volumosas
+    e contagem + hash do conteúdo para as demais. As colunas derivadas pelas próprias etapas
+    (join_key e datas de vigência) ficam de fora, para a assinatura não mudar ao rodar a etapa.
+    """
+    if not _tabela_existe(conexao, tabela):
+        return None
+    if tabela in TABELAS_VOLUMOSAS:
+        return conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    colunas_derivadas = ", ".join(f"'{c}'" for c in COLUNAS_DERIVADAS)
+    total, soma_hash = conexao.execute(f"""
+        SELECT COUNT(*), sum(hash(t)) FROM (SELECT COLUMNS(c -> c NOT IN ({colunas_derivadas})) FROM {tabela}) t
+    """).fetchone()
+    return [total, str(soma_hash)]
+
+def _entradas_etapa(conexao, etapa, contexto):
+    """Entradas de uma etapa: tabelas lidas, parâmetros do contexto e, na carga, os CSVs da pasta."""
+    entradas = {
+        'etapa': etapa['nome'],
+        'versao_normalizacao': VERSAO_NORMALIZACAO,
+        'versao_apresentacoes': VERSAO_APRESENTACOES,
+        'parametros': {chave: contexto.get(chave) for chave in etapa['parametros']},
+        'tabelas': {tabela: _assinatura_tabela(conexao, tabela) for tabela in etapa['entradas']},
+    }
+    if etapa['nome'] == 'carga_raw':
+        arquivos = sorted(Path(contexto['caminho_pasta_entrada']).glob('*.csv'))
+        entradas['arquivos'] = [[str(a.resolve()), a.stat().st_size, a.stat().st_mtime_ns] for a in arquivos]
+    # Ida e volta pelo JSON para comparar com o que foi gravado no registro
+    return json.loads(json.dumps(entradas, sort_keys=True, default=str))
+
+def _fingerprint(entradas):
+    return hashlib.sha256(json.dumps(entradas, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _entradas_compativeis(registradas, atuais):
+    """
+    Compara as entradas gravadas de uma etapa com as atuais. Uma tabela que não existe mais
+    (a staging, removida por uma etapa posterior já concluída) não invalida a comparação.
+    """
+    if registradas is None:
+        return False
+    if any(registradas.get(chave) != atuais.get(chave) for chave in ('etapa', 'versao_normalizacao', 'versao_apresentacoes', 'parametros', 'arquivos')):
+        return False
+    return all(atual is None or registradas['tabelas'].get(tabela) == atual for tabela, atual in atuais['tabelas'].items())
+
+def _ultima_execucao(conexao):
+    """Retorna (run_id, status, contexto, {etapa: (status, entradas)}) da execução mais recente."""
+    linha = conexao.execute(f"SELECT run_id, status, contexto FROM {TABLE_ETL_RUNS} ORDER BY run_id DESC LIMIT 1").fetchone()
+    if linha is None:
+        return None
+    etapas = {
+        etapa: (status, json.loads(entradas) if entradas else None)
+        for etapa, status, entradas in conexao.execute(
+            f"SELECT etapa, status, entradas FROM {TABLE_ETL_STAGES} WHERE run_id = ?", [linha[0]]
+        ).fetchall()
+    }
+    return linha[0], linha[1], json.loads(linha[2]) if linha[2] else {}, etapas
+
+def _registrar_etapa(conexao, run_id, ordem, etapa, status, entradas, inicio=None, erro=None):
+    """
+    Grava (ou substitui) a linha da etapa em etl_stages. Ao abrir a etapa ('em_execucao')
+    retorna o instante de início, a ser repassado quando ela for concluída ou falhar.
+    """
+    agora = (datetime.now(), time.perf_counter())
+    inicio = inicio or agora
+    finalizada = status != 'em_execucao'
+    conexao.execute(f"DELETE FROM {TABLE_ETL_STAGES} WHERE run_id = ? AND etapa = ?", [run_id, etapa['nome']])
+    conexao.execute(f"INSERT INTO {TABLE_ETL_STAGES} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        run_id, ordem, etapa['nome'], status, inicio[0], agora[0] if finalizada else None,
+        agora[1] - inicio[1] if finalizada else None, _fingerprint(entradas), json.dumps(entradas),
+        ", ".join(etapa['saidas']), erro,
+    ])
+    return inicio
+
+def _etapa_extensoes(conexao, contexto):
+    conexao.execute("INSTALL icu; LOAD icu;")
+    print("-> Extensão 'icu' carregada.")
+
+def _etapa_carga_raw(conexao, contexto):
+    tabela_raw = contexto['tabela_raw']
+    conexao.execute(f"DROP TABLE IF EXISTS {tabela_raw};")
+    pasta_dados_brutos = Path(contexto['caminho_pasta_entrada'])
+    modo_ingestao = contexto['modo_ingestao']
+    arquivos_csv = sorted(a.resolve() for a in pasta_dados_brutos.glob('*.csv'))
+    if not arquivos_csv:
+        raise FileNotFoundError(f"Nenhum arquivo .csv encontrado em: {pasta_dados_brutos}")
+
+    situacao = comparar_com_manifesto(conexao, arquivos_csv)
+    incremental = not contexto['reprocessar_tudo'] and bool(situacao['registrados']) and _tabela_existe(conexao, TABLE_NAME)
+    if incremental:
+        arquivos_para_carregar = situacao['novos'] + situacao['alterados']
+        print(f"Carga incremental: {len(situacao['novos'])} novo(s), {len(situacao['alterados'])} alterado(s), "
+              f"{len(situacao['removidos'])} removido(s), {len(situacao['inalterados'])} inalterado(s).")
+        if not arquivos_para_carregar and not situacao['removidos']:
+            print("-> Nenhum arquivo novo ou alterado. Nada a processar.")
+            contexto['nada_a_processar'] = True
+            return
+    else:
+        arquivos_para_carregar = arquivos_csv
+        print(f"Encontrados {len(arquivos_csv)} arquivos para processar (carga completa)...")
+    print(f"Modo de ingestão: {modo_ingestao}")
+
+    # Define o schema explicitamente para garantir consistência
+    colunas_raw = ", ".join(f"{nome} {tipo}" for nome, tipo in SCHEMA_PRESCRICOES_RAW.items())
+    conexao.execute(f"CREATE TABLE {tabela_raw} ({colunas_raw}, arquivo_origem VARCHAR, motivo_rejeicao VARCHAR);")
+
+    inicio_carga = time.perf_counter()
+    if arquivos_para_carregar:
+        carregar_dados_brutos(conexao, tabela_raw, arquivos_para_carregar, modo=modo_ingestao)
+    estatisticas_arquivos = _estatisticas_por_arquivo(conexao, tabela_raw)
+    total_rejeitadas, rejeitadas_por_regra = registrar_rejeitadas(conexao, tabela_raw, [str(a) for a in arquivos_para_carregar], situacao['removidos'],
+                                                substituir_tudo=not incremental, run_id=contexto.get('run_id'))
+
+    filtro_periodo = ""
+    if incremental:
+        # Meses afetados: os produzidos pelos arquivos novos/alterados e os que
+        # os arquivos alterados/removidos produziam antes.
+        periodos_afetados = {p for _, _, inicio, fim in estatisticas_arquivos for p in _expandir_periodos(inicio, fim)}
+        for caminho in [str(a) for a in situacao['alterados']] + situacao['removidos']:
+            _, _, _, inicio, fim = situacao['registrados'][caminho]
+            periodos_afetados.update(_expandir_periodos(inicio, fim))
+        conexao.execute(f"CREATE OR REPLACE TABLE {TABLE_PERIODOS_AFETADOS} (ano_mes INTEGER);")
+        conexao.executemany(f"INSERT INTO {TABLE_PERIODOS_AFETADOS} VALUES (?)", [[p] for p in sorted(periodos_afetados)])
+        filtro_periodo = f" AND CAST(ano AS INTEGER) * 100 + mes IN (SELECT ano_mes FROM {TABLE_PERIODOS_AFETADOS})"
+
+        # Arquivos inalterados que também contribuem para os meses afetados precisam ser
+        # relidos, já que esses meses serão apagados e reconstruídos por inteiro.
+        complementares = [
+            a for a in situacao['inalterados']
+            if periodos_afetados.intersection(_expandir_periodos(*situacao['registrados'][str(a)][3:5]))
         ]
+        if complementares:
+            print(f"Relendo {len(complementares)} arquivo(s) inalterado(s) que cobrem os meses afetados...")
+            carregar_dados_brutos(conexao, tabela_raw, complementares, modo=modo_ingestao)
+            conexao.execute(f"""
+                DELETE FROM {tabela_raw}
+                WHERE try_cast(ano AS INTEGER) * 100 + try_cast(mes AS INTEGER) NOT IN (SELECT ano_mes FROM {TABLE_PERIODOS_AFETADOS})
+                   OR motivo_rejeicao IS NOT NULL;
+            """)
+        print(f"Meses afetados nesta execução: {len(periodos_afetados)}")
+    duracao_carga = time.perf_counter() - inicio_carga
 
-        for termo in termos:
-            conexao.execute(f"UPDATE {tabela_raw} SET principio_ativo = trim(replace(principio_ativo, '{termo}', ''));")
-        
-        # Padroniza múltiplos espaços e o sinal de '+'
-        conexao.execute(f"UPDATE {tabela_raw} SET principio_ativo = regexp_replace(principio_ativo, '\\s*\\+\\s*', ' + ', 'g');")
-        conexao.execute(f"UPDATE {tabela_raw} SET principio_ativo = trim(regexp_replace(principio_ativo, '\\s+', ' ', 'g'));")
-        
-        print(" - Criando a coluna 'join_key' na tabela raw...")
-        conexao.execute(f"ALTER TABLE {tabela_raw} ADD COLUMN IF NOT EXISTS join_key VARCHAR;")
-        conexao.execute(f"UPDATE {tabela_raw} SET join_key = principio_ativo;")
-        print("-> Princípios ativos padronizados.")
-
-        # ETAPA 2.5: Preparar tabela de mapeamento ATC para o JOIN (Lógica movida da ETAPA 6)
-        print("\n[ETAPA 2.5/9] Preparando a tabela de mapeamento ATC para consistência...")
-        conexao.execute(f"ALTER TABLE {TABLE_ATC} ADD COLUMN IF NOT EXISTS join_key VARCHAR;")
-        
-        # Aplica a mesma lógica de padronização da ETAPA 2 à tabela ATC
-        conexao.execute(f"UPDATE {TABLE_ATC} SET principio_ativo = upper(strip_accents(trim(principio_ativo)));")
-        
-        for termo in termos:
-            conexao.execute(f"UPDATE {TABLE_ATC} SET principio_ativo = trim(replace(principio_ativo, '{termo}', ''));")
-        
-        conexao.execute(f"UPDATE {TABLE_ATC} SET principio_ativo = regexp_replace(principio_ativo, '\\s*\\+\\s*', ' + ', 'g');")
-        conexao.execute(f"UPDATE {TABLE_ATC} SET principio_ativo = trim(regexp_replace(principio_ativo, '\\s+', ' ', 'g'));")
-        
-        # Cria a join_key final na tabela de mapeamento
-        conexao.execute(f"UPDATE {TABLE_ATC} SET join_key = principio_ativo;")
-        print("-> Tabela de mapeamento ATC padronizada e com join_key criada.")
-
-        # ETAPA 3: Criar tabela final com transformações, tipos corretos e junção
-        print(f"\n[ETAPA 3/9] Criando tabela final '{TABLE_NAME}' com transformações e enriquecimento...")
-        conexao.execute(f"DROP TABLE IF EXISTS {TABLE_NAME};")
-        regex_dosagem = r'(\d+\.?\d*\s?(?:MG/ML|MG/G|MG|MCG|UI|G|ML))'
-        
-        # CORREÇÃO DA DUPLICIDADE: Os joins com as tabelas de mapeamento agora usam subconsultas
-        # com ROW_NUMBER() para garantir que apenas uma correspondência seja retornada por join_key.
-        conexao.execute(f"""
-        CREATE TABLE {TABLE_NAME} AS
+    total_bruto = conexao.execute(f"SELECT COUNT(*) FROM {tabela_raw}").fetchone()[0]
+    print(f"-> {total_bruto:,} registros brutos carregados com sucesso em {duracao_carga:.1f}s ({total_bruto / max(duracao_carga, 1e-9):,.0f} linhas/s).")
+    if total_rejeitadas:
+        detalhes = ", ".join(f"{regra}: {total:,}" for regra, total in rejeitadas_por_regra.items() if total)
+        print(f"-> {total_rejeitadas:,} linhas rejeitadas pela validação (em '{TABLE_REJEITADAS}'): {detalhes}.")
+    # Contagens por regra para o relatório de instrumentação da etapa
+    contexto['metricas_etapa'] = {'linhas_rejeitadas': total_rejeitadas,
+                                  **{f"rejeitadas_{regra}": total for regra, total in rejeitadas_por_regra.items()}}
+
+    # Estado usado pelas etapas seguintes (e gravado no registro, para permitir retomar a execução)
+    caminhos_carregados = {str(a) for a in arquivos_para_carregar}
+    contexto.update({
+        'incremental': incremental,
+        'filtro_periodo': filtro_periodo,
+        'estatisticas_carregados': [list(e) for e in estatisticas_arquivos if e[0] in caminhos_carregados],
+        'assinaturas': situacao['assinaturas'],
+        'removidos': situacao['removidos'],
+    })
+
+def _etapa_dicionario(conexao, contexto):
+    # A normalização roda uma única vez por nome distinto e fica persistida em
+    # TABLE_DICIONARIO_PA; a staging não é reescrita, o resultado entra por JOIN na tabela final.
+    novos_nomes = atualizar_dicionario_principios(conexao, f"SELECT principio_ativo FROM {contexto['tabela_raw']}")
+    total_nomes = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_DICIONARIO_PA}").fetchone()[0]
+    print(f"-> Dicionário '{TABLE_DICIONARIO_PA}' com {total_nomes:,} nomes ({novos_nomes:,} novos nesta execução).")
+
+def _etapa_apresentacoes(conexao, contexto):
+    # Forma farmacêutica e dosagem são extraídas uma vez por descrição distinta e ficam
+    # persistidas em TABLE_APRESENTACOES; a tabela final as recebe por JOIN.
+    novas = atualizar_apresentacoes(conexao, f"SELECT descricao_apresentacao FROM {contexto['tabela_raw']}")
+    total = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_APRESENTACOES}").fetchone()[0]
+    print(f"-> Dimensão '{TABLE_APRESENTACOES}' com {total:,} apresentações ({novas:,} novas nesta execução).")
+
+def _etapa_mapeamentos(conexao, contexto):
+    # Usa o mesmo dicionário da etapa anterior, garantindo a mesma join_key dos dois lados
+    aplicar_join_key(conexao, TABLE_ATC)
+    aplicar_join_key(conexao, TABLE_MAPEAMENTO)
+    aplicar_datas_vigencia(conexao, TABLE_MAPEAMENTO)
+    print("-> Tabelas de mapeamento com join_key (dicionário) e datas de vigência tipadas.")
+
+def _etapa_parametros(conexao, contexto):
+    # Na carga incremental os parâmetros da última carga completa são reutilizados,
+    # para que os meses novos recebam o mesmo tratamento do restante da tabela.
+    incremental = contexto.get('incremental', False)
+    media_idade = _parametro_salvo(conexao, 'media_idade') if incremental else None
+    limite_superior_qtd = _parametro_salvo(conexao, 'limite_superior_qtd') if incremental else None
+    if media_idade is None or limite_superior_qtd is None:
+        # Os dois quartis saem de uma única agregação (quantile_cont com lista): os valores de
+        # quantidade ficam em memória uma vez só, e não uma vez por quartil.
+        media_idade, limite_superior_qtd = conexao.execute(f"""
+        SELECT idade_media, q[2] + 1.5 * (q[2] - q[1])
+        FROM (
+            SELECT AVG(idade) FILTER (WHERE idade BETWEEN 0 AND 110) AS idade_media, quantile_cont(quantidade, [0.25, 0.75]) AS q
+            FROM (
+                SELECT try_cast(idade AS INTEGER) AS idade, try_cast(replace(quantidade_vendida, ',', '.') AS DOUBLE) AS quantidade
+                FROM {contexto['tabela_raw']} WHERE motivo_rejeicao IS NULL
+            )
+        );
+        """).fetchone()
+        if media_idade is not None:
+            _salvar_parametro(conexao, 'media_idade', media_idade)
+        if limite_superior_qtd is not None:
+            _salvar_parametro(conexao, 'limite_superior_qtd', limite_superior_qtd)
+    contexto['media_idade'], contexto['limite_superior_qtd'] = media_idade, limite_superior_qtd
+    print(f"-> Idade média (0-110): {media_idade}. Limite superior de quantidade (Q3 + 1.5*IQR): {limite_superior_qtd}.")
+
+def _valores_distintos(conexao, consulta):
+    return [v for (v,) in conexao.execute(f"SELECT * FROM ({consulta}) ORDER BY 1").fetchall() if v is not None]
+
+def _valores_enum(conexao, contexto):
+    """Valores de cada ENUM da tabela final para esta execução."""
+    tabela_raw = contexto['tabela_raw']
+    valores = {
+        'sigla_uf': _valores_distintos(conexao, f"SELECT DISTINCT NULLIF(upper(trim(sigla_uf)), '') FROM {tabela_raw} WHERE motivo_rejeicao IS NULL"),
+        'sexo': SEXOS,
+        'conselho_prescritor': _valores_distintos(conexao, f"SELECT DISTINCT conselho_prescritor FROM {tabela_raw} WHERE motivo_rejeicao IS NULL"),
+        'classe_terapeutica': ['Não Classificada'] + _valores_distintos(conexao, f"SELECT DISTINCT CAST(classe_terapeutica AS VARCHAR) FROM {TABLE_ATC}"),
+        'forma_farmaceutica': FORMAS_FARMACEUTICAS,
+        'anvisa_lista': _valores_distintos(conexao, f"SELECT DISTINCT CAST(lista AS VARCHAR) FROM {TABLE_MAPEAMENTO}"),
+        'faixa_etaria': FAIXAS_ETARIAS,
+    }
+    # Tabela final ainda em VARCHAR (gerada antes dos ENUMs): os valores dela também entram no domínio
+    if contexto.get('incremental') and _tabela_existe(conexao, TABLE_NAME):
+        for coluna, tipo_atual in conexao.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ?", [TABLE_NAME]
+        ).fetchall():
+            if coluna in valores and tipo_atual == 'VARCHAR':
+                valores[coluna] = valores[coluna] + _valores_distintos(conexao, f"SELECT DISTINCT {coluna} FROM {TABLE_NAME}")
+    return valores
+
+def garantir_tipo_enum(conexao, tipo, valores):
+    """
+    Cria o tipo ENUM com os valores informados ou, se ele já existe, o amplia com os
+    valores novos (os existentes mantêm a posição). Retorna True se o tipo mudou.
+    """
+    existe = conexao.execute("SELECT COUNT(*) FROM duckdb_types() WHERE type_name = ? AND NOT internal", [tipo]).fetchone()[0] > 0
+    atuais = [v for (v,) in conexao.execute(f"SELECT unnest(enum_range(NULL::{tipo}))").fetchall()] if existe else []
+    novos = [v for v in dict.fromkeys(valores) if v is not None and v not in atuais]
+    if existe and not novos:
+        return False
+    literais = ", ".join("'" + str(v).replace("'", "''") + "'" for v in atuais + novos)
+    if existe:
+        conexao.execute(f"DROP TYPE {tipo};")
+    conexao.execute(f"CREATE TYPE {tipo} AS ENUM ({literais});")
+    return True
+
+def _ajustar_colunas_enum(conexao):
+    """
+    Leva as colunas da tabela final para a versão atual de cada ENUM. No DuckDB a coluna
+    guarda o ENUM estruturalmente, então um tipo ampliado precisa de ALTER TABLE, que não é
+    permitido com índices na tabela: eles são removidos aqui e recriados na etapa de índices.
+    """
+    tipos_colunas = dict(conexao.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ?", [TABLE_NAME]
+    ).fetchall())
+    colunas_alterar = [
+        (coluna, tipo) for coluna, tipo in TIPOS_ENUM.items()
+        if coluna in tipos_colunas and tipos_colunas[coluna] != conexao.execute(f"SELECT typeof(NULL::{tipo})").fetchone()[0]
+    ]
+    if not colunas_alterar:
+        return
+    for (indice,) in conexao.execute("SELECT index_name FROM duckdb_indexes() WHERE table_name = ?", [TABLE_NAME]).fetchall():
+        conexao.execute(f"DROP INDEX IF EXISTS {indice};")
+    for coluna, tipo in colunas_alterar:
+        print(f" - Convertendo a coluna '{coluna}' para o tipo {tipo}...")
+        conexao.execute(f"ALTER TABLE {TABLE_NAME} ALTER {coluna} TYPE {tipo};")
+
+def _etapa_tabela_final(conexao, contexto):
+    tabela_raw = contexto['tabela_raw']
+    incremental = contexto.get('incremental', False)
+    media_idade = contexto.get('media_idade', _parametro_salvo(conexao, 'media_idade'))
+    limite_superior_qtd = contexto.get('limite_superior_qtd', _parametro_salvo(conexao, 'limite_superior_qtd'))
+
+    # Idade fora de 0-110 (ou ausente) é imputada pela média; quantidades negativas viram
+    # absolutas e as acima do limite IQR são limitadas a ele. Tudo marcado nas flags.
+    if media_idade is not None:
+        expr_idade_invalida = "(idade IS NULL OR idade < 0 OR idade > 110)"
+        expr_idade = f"CASE WHEN {expr_idade_invalida} THEN {round(media_idade)} ELSE idade END"
+        expr_idade_flag = f"CAST(CASE WHEN {expr_idade_invalida} THEN 1 ELSE 0 END AS TINYINT)"
+    else:
+        # Sem nenhuma idade válida não há média para imputar; idades fora de 0-110 ficam nulas
+        expr_idade, expr_idade_flag = "CASE WHEN idade BETWEEN 0 AND 110 THEN idade END", "CAST(0 AS TINYINT)"
+    if limite_superior_qtd is not None:
+        expr_qtd = f"CASE WHEN abs(quantidade_vendida) > {limite_superior_qtd} THEN {limite_superior_qtd} ELSE abs(quantidade_vendida) END"
+        expr_qtd_flag = f"CAST(CASE WHEN quantidade_vendida < 0 OR abs(quantidade_vendida) > {limite_superior_qtd} THEN 1 ELSE 0 END AS TINYINT)"
+    else:
+        expr_qtd, expr_qtd_flag = "quantidade_vendida", "CAST(0 AS TINYINT)"
+
+    # Schema físico compacto: ENUM nas colunas de baixa cardinalidade e inteiros/REAL estreitos
+    # (ano SMALLINT, mes e idade TINYINT, quantidade REAL). Atenção: ano * 100 estoura SMALLINT,
+    # converta para INTEGER antes de aritmética desse tipo.
+    for coluna, valores in _valores_enum(conexao, contexto).items():
+        if garantir_tipo_enum(conexao, TIPOS_ENUM[coluna], valores):
+            print(f" - Tipo {TIPOS_ENUM[coluna]} com {len(conexao.execute(f'SELECT enum_range(NULL::{TIPOS_ENUM[coluna]})').fetchone()[0])} valores.")
+    if incremental:
+        _ajustar_colunas_enum(conexao)
+
+    # CORREÇÃO DA DUPLICIDADE: Os joins com as tabelas de mapeamento agora usam subconsultas
+    # com ROW_NUMBER() para garantir que apenas uma correspondência seja retornada por join_key.
+    consulta_final = f"""
+    WITH t1 AS (
         SELECT
-            t1.*,
-            COALESCE(mun.nome_municipio, 'Desconhecido') as nome_municipio,
-            COALESCE(atc.codigo_atc, 'Não Classificado') as codigo_atc,
-            COALESCE(atc.classe_terapeutica, 'Não Classificada') as classe_terapeutica,
-            CASE
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'COM REV|COMP REV') THEN 'Comprimido Revestido'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'COMP') THEN 'Comprimido'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'CAPS|CAP') THEN 'Cápsula'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'SOL OR|SOL') THEN 'Solução Oral'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'GTS') THEN 'Gotas'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'XPE') THEN 'Xarope'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'CREM') THEN 'Creme'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'POM') THEN 'Pomada'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'SUSP') THEN 'Suspensão'
-                WHEN regexp_matches(upper(t1.descricao_apresentacao), 'INJ') THEN 'Injetável'
-                ELSE 'Não Especificada'
-            END as forma_farmaceutica,
-            m.lista AS anvisa_lista,
-            CAST(0 AS TINYINT) AS idade_modificada_flag,
-            CAST(0 AS TINYINT) AS quantidade_modificada_flag,
-            CAST(NULL AS VARCHAR) as faixa_etaria,
-            CAST(NULL AS BOOLEAN) AS periodo_valido_controlado
+            CAST(ano AS SMALLINT) AS ano, CAST(mes AS TINYINT) AS mes, data,
+            CAST(sigla_uf AS {TIPOS_ENUM['sigla_uf']}) AS sigla_uf,
+            id_municipio, principio_ativo, join_key, descricao_apresentacao, dosagem,
+            CAST({expr_qtd} AS REAL) AS quantidade_vendida,
+            cid10, CAST(sexo AS {TIPOS_ENUM['sexo']}) AS sexo,
+            CAST({expr_idade} AS TINYINT) AS idade,
+            CAST(conselho_prescritor AS {TIPOS_ENUM['conselho_prescritor']}) AS conselho_prescritor,
+            forma_farmaceutica,
+            {expr_idade_flag} AS idade_modificada_flag,
+            {expr_qtd_flag} AS quantidade_modificada_flag
         FROM (
             SELECT
                 CAST(ano AS INTEGER) AS ano, CAST(mes AS INTEGER) AS mes,
                 make_date(CAST(ano AS INTEGER), CAST(mes AS INTEGER), 1) AS data,
-                upper(trim(sigla_uf)) as sigla_uf,
+                NULLIF(upper(trim(sigla_uf)), '') as sigla_uf,
                 id_municipio,
-                principio_ativo,
-                join_key,
-                descricao_apresentacao,
-                regexp_extract(descricao_apresentacao, '{regex_dosagem}', 1) as dosagem,
+                d.join_key AS principio_ativo,
+                d.join_key,
+                r.descricao_apresentacao,
+                ap.dosagem,
                 CAST(try_cast(replace(quantidade_vendida, ',', '.') as DOUBLE) as DOUBLE) as quantidade_vendida,
                 COALESCE(cid10, 'Não Informado') as cid10,
                 CASE WHEN sexo IN ('1', '1.0') THEN 'Masculino' WHEN sexo IN ('2', '2.0') THEN 'Feminino' ELSE 'Não Informado' END as sexo,
                 CAST(try_cast(idade as INTEGER) as INTEGER) as idade,
-                conselho_prescritor
-            FROM {tabela_raw} WHERE ano IS NOT NULL AND mes IS NOT NULL
-        ) AS t1
-        LEFT JOIN (
-            -- Subconsulta para de-duplicar a tabela de mapeamento de controlados
-            SELECT * FROM (
-                SELECT *, ROW_NUMBER() OVER(PARTITION BY join_key ORDER BY inclusao_lista DESC) as rn
-                FROM {TABLE_MAPEAMENTO}
-            ) WHERE rn = 1
-        ) m ON t1.join_key = m.join_key
-        LEFT JOIN (
-            -- Subconsulta para de-duplicar a tabela de mapeamento ATC
-            SELECT * FROM (
-                SELECT *, ROW_NUMBER() OVER(PARTITION BY join_key ORDER BY codigo_atc) as rn
-                FROM {TABLE_ATC}
-            ) WHERE rn = 1
-        ) atc ON t1.join_key = atc.join_key
-        LEFT JOIN {TABLE_MUNICIPIOS} mun ON t1.id_municipio = mun.id_municipio;
-        """)
-        print("-> Tabela processada, enriquecida e colunas criadas.")
+                conselho_prescritor,
+                ap.forma_farmaceutica
+            FROM {tabela_raw} r
+            LEFT JOIN {TABLE_DICIONARIO_PA} d ON r.principio_ativo = d.principio_ativo_raw
+            LEFT JOIN {TABLE_APRESENTACOES} ap ON r.descricao_apresentacao = ap.descricao_apresentacao
+            WHERE r.motivo_rejeicao IS NULL
+        )
+    ),
+    -- Vigência avaliada uma vez por par distinto (join_key, data) contra todos os intervalos
+    -- de inclusão/exclusão da substância, com datas já tipadas na tabela de mapeamento.
+    vigencia AS (
+        SELECT
+            k.join_key, k.data,
+            COALESCE(bool_or(k.data >= i.data_inclusao AND k.data <= COALESCE(i.data_exclusao, DATE '9999-12-31')), FALSE) AS periodo_valido_controlado
+        FROM (SELECT DISTINCT join_key, data FROM t1 WHERE join_key IS NOT NULL) k
+        JOIN {TABLE_MAPEAMENTO} i ON k.join_key = i.join_key
+        GROUP BY k.join_key, k.data
+    )
+    SELECT
+        t1.* EXCLUDE (forma_farmaceutica, idade_modificada_flag, quantidade_modificada_flag),
+        COALESCE(mun.nome_municipio, 'Desconhecido') as nome_municipio,
+        COALESCE(atc.codigo_atc, 'Não Classificado') as codigo_atc,
+        CAST(COALESCE(atc.classe_terapeutica, 'Não Classificada') AS {TIPOS_ENUM['classe_terapeutica']}) as classe_terapeutica,
+        CAST(COALESCE(t1.forma_farmaceutica, '{FORMA_NAO_ESPECIFICADA}') AS {TIPOS_ENUM['forma_farmaceutica']}) as forma_farmaceutica,
+        CAST(m.lista AS {TIPOS_ENUM['anvisa_lista']}) AS anvisa_lista,
+        t1.idade_modificada_flag,
+        t1.quantidade_modificada_flag,
+        CAST(CASE
+            WHEN t1.idade IS NULL THEN 'Desconhecida'
+            WHEN t1.idade < 15 THEN 'Criança (0-14)'
+            WHEN t1.idade < 25 THEN 'Jovem Adulto (15-24)'
+            WHEN t1.idade < 60 THEN 'Adulto (25-59)'
+            WHEN t1.idade < 65 THEN 'Idoso (60-64)'
+            ELSE 'Idoso (65+)'
+        END AS {TIPOS_ENUM['faixa_etaria']}) as faixa_etaria,
+        v.periodo_valido_controlado
+    FROM t1
+    LEFT JOIN (
+        -- Subconsulta para de-duplicar a tabela de mapeamento de controlados (inclusão mais recente)
+        SELECT * FROM (
+            SELECT *, ROW_NUMBER() OVER(PARTITION BY join_key ORDER BY data_inclusao DESC NULLS LAST) as rn
+            FROM {TABLE_MAPEAMENTO}
+        ) WHERE rn = 1
+    ) m ON t1.join_key = m.join_key
+    LEFT JOIN vigencia v ON t1.join_key = v.join_key AND t1.data = v.data
+    LEFT JOIN (
+        -- Subconsulta para de-duplicar a tabela de mapeamento ATC
+        SELECT * FROM (
+            SELECT *, ROW_NUMBER() OVER(PARTITION BY join_key ORDER BY codigo_atc) as rn
+            FROM {TABLE_ATC}
+        ) WHERE rn = 1
+    ) atc ON t1.join_key = atc.join_key
+    LEFT JOIN {TABLE_MUNICIPIOS} mun ON t1.id_municipio = mun.id_municipio
+    """
+    if contexto.get('layout', LAYOUT_PADRAO) == 'ordenado':
+        # Na carga incremental os meses afetados entram ordenados em row groups novos no fim da
+        # tabela; os zone maps continuam eficazes. --reprocessar-tudo regrava a tabela inteira em ordem.
+        consulta_final += f"ORDER BY {', '.join(ORDEM_FISICA_PRESCRICOES)}\n"
+    if incremental:
+        # DELETE + INSERT em uma transação: uma falha no meio não deixa os meses afetados vazios
+        conexao.execute("BEGIN TRANSACTION;")
+        try:
+            removidas = conexao.execute(f"DELETE FROM {TABLE_NAME} WHERE TRUE{contexto['filtro_periodo']};").fetchone()[0]
+            conexao.execute(f"INSERT INTO {TABLE_NAME} BY NAME {consulta_final};")
+            conexao.execute("COMMIT;")
+        except Exception:
+            conexao.execute("ROLLBACK;")
+            raise
+        print(f" - {removidas:,} registros dos meses afetados substituídos.")
+    else:
+        conexao.execute(f"CREATE OR REPLACE TABLE {TABLE_NAME} AS {consulta_final};")
+    print("-> Tabela final gravada em uma única passagem, sem UPDATEs posteriores.")
 
-        # ETAPA 4: Tratamento de Outliers e Flags e criação de faixa etária
-        print("\n[ETAPA 4/9] Tratando outliers, flags e criando faixas etárias...")
-        media_idade = conexao.execute(f"SELECT AVG(idade) FROM {TABLE_NAME} WHERE idade BETWEEN 0 AND 110").fetchone()[0]
-        if media_idade is not None:
-            conexao.execute(f"UPDATE {TABLE_NAME} SET idade_modificada_flag = 1, idade = {round(media_idade)} WHERE idade IS NULL OR idade < 0 OR idade > 110;")
-        
-        limite_superior_qtd = conexao.execute(f"SELECT quantile_cont(quantidade_vendida, 0.75) + 1.5 * (quantile_cont(quantidade_vendida, 0.75) - quantile_cont(quantidade_vendida, 0.25)) FROM {TABLE_NAME} WHERE quantidade_vendida IS NOT NULL").fetchone()[0]
-        if limite_superior_qtd is not None:
-            conexao.execute(f"UPDATE {TABLE_NAME} SET quantidade_modificada_flag = 1, quantidade_vendida = abs(quantidade_vendida) WHERE quantidade_vendida < 0;")
-            conexao.execute(f"UPDATE {TABLE_NAME} SET quantidade_modificada_flag = 1, quantidade_vendida = {limite_superior_qtd} WHERE quantidade_vendida > {limite_superior_qtd};")
-            
-        conexao.execute(f"""UPDATE {TABLE_NAME} SET faixa_etaria = CASE
-            WHEN idade IS NULL THEN 'Desconhecida'
-            WHEN idade < 15 THEN 'Criança (0-14)'
-            WHEN idade < 25 THEN 'Jovem Adulto (15-24)'
-            WHEN idade < 60 THEN 'Adulto (25-59)'
-            WHEN idade < 65 THEN 'Idoso (60-64)'
-            ELSE 'Idoso (65+)' END;""")
-        print("-> Outliers e valores ausentes tratados.")
-
-        # ETAPA 5: Atualizar período válido para controlados
-        print("\n[ETAPA 5/9] Atualizando período válido para medicamentos controlados...")
+def _etapa_verificacao_atc(conexao, contexto):
+    count_nulls = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE codigo_atc IS NULL OR classe_terapeutica IS NULL;").fetchone()[0]
+    if count_nulls > 0:
+         print(f"Aviso: {count_nulls} registros ainda sem classificação ATC. Verifique o mapeamento.")
+    print("-> Verificação de dados ATC concluída.")
+
+def _etapa_manifesto(conexao, contexto):
+    estatisticas_carregados = contexto.get('estatisticas_carregados', [])
+    assinaturas = {caminho: tuple(valores) for caminho, valores in contexto.get('assinaturas', {}).items()}
+    atualizar_manifesto(conexao, estatisticas_carregados, assinaturas, contexto.get('removidos', []),
+                        substituir_tudo=not contexto.get('incremental', False))
+    print(f" - Manifesto atualizado com {len(estatisticas_carregados)} arquivo(s).")
+    conexao.execute(f"DROP TABLE IF EXISTS {contexto['tabela_raw']};")
+    print("-> Tabelas temporárias removidas.")
+
+def _etapa_indices(conexao, contexto):
+    layout = contexto.get('layout', LAYOUT_PADRAO)
+    colunas_para_indexar = COLUNAS_INDICES if layout == 'indices' else INDICES_LAYOUT_ORDENADO
+    # Remove os índices que o layout atual não usa (ex.: bancos gerados com o layout antigo)
+    for (indice,) in conexao.execute("SELECT index_name FROM duckdb_indexes() WHERE table_name = ?", [TABLE_NAME]).fetchall():
+        if indice not in {f"idx_{coluna}" for coluna in colunas_para_indexar}:
+            print(f" - Removendo o índice '{indice}'...")
+            conexao.execute(f"DROP INDEX IF EXISTS {indice};")
+    for coluna in colunas_para_indexar:
+        print(f" - Criando índice para a coluna: '{coluna}'...")
+        conexao.execute(f"CREATE INDEX IF NOT EXISTS idx_{coluna} ON {TABLE_NAME} ({coluna});")
+    print(f"-> Índices ajustados para o layout '{layout}' ({len(colunas_para_indexar)} índice(s)).")
+
+def _etapa_agregado(conexao, contexto):
+    # Cubo do dashboard; na carga incremental só os meses afetados são recalculados
+    linhas = materializar_agregado(conexao, contexto.get('filtro_periodo', "") if contexto.get('incremental') else "")
+    print(f"-> Tabela '{TABLE_AGREGADO}' com {linhas:,} grupos (ano, mês, município, princípio ativo, faixa etária, sexo).")
+
+def exportar_prescricoes_parquet(conexao, pasta, filtro_periodo=""):
+    """
+    Materializa 'prescricoes' em Parquet (zstd) particionado por ano/mes/sigla_uf. Sem filtro,
+    o dataset é gerado em uma pasta temporária e trocado pelo anterior ao final; com o
+    filtro da carga incremental, só as pastas dos meses afetados são regravadas.
+    """
+    pasta = Path(pasta)
+    particoes = ", ".join(COLUNAS_PARTICAO_PARQUET)
+    opcoes = f"FORMAT parquet, COMPRESSION zstd, PARTITION_BY ({particoes}), WRITE_PARTITION_COLUMNS true"
+    if filtro_periodo and pasta.exists():
+        for ano, mes in conexao.execute(f"SELECT DISTINCT ano_mes // 100, ano_mes % 100 FROM {TABLE_PERIODOS_AFETADOS}").fetchall():
+            shutil.rmtree(pasta / f"ano={ano}" / f"mes={mes}", ignore_errors=True)
         conexao.execute(f"""
-        UPDATE {TABLE_NAME}
-        SET periodo_valido_controlado = CASE
-            WHEN strptime(CAST(data AS VARCHAR), '%Y-%m-%d') >= strptime(m.inclusao_lista, '%d/%m/%Y')
-            AND (m.exclusao_lista IS NULL OR strptime(CAST(data AS VARCHAR), '%Y-%m-%d') <= strptime(m.exclusao_lista, '%d/%m/%Y'))
-            THEN TRUE ELSE FALSE END
-        FROM {TABLE_MAPEAMENTO} m
-        WHERE {TABLE_NAME}.principio_ativo = m.principio_ativo;
-        """)
-        print("-> Período válido para controlados atualizado.")
-
-        # ETAPA 6: Enriquecimento com Classificação ATC (Etapa simplificada)
-        print(f"\n[ETAPA 6/9] Verificando enriquecimento com a classificação ATC...")
-        count_nulls = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE codigo_atc IS NULL OR classe_terapeutica IS NULL;").fetchone()[0]
-        if count_nulls > 0:
-             print(f"Aviso: {count_nulls} registros ainda sem classificação ATC. Verifique o mapeamento.")
-        print("-> Verificação de dados ATC concluída.")
-
-        # ETAPA 7: Limpeza de Tabelas Temporárias
-        print("\n[ETAPA 7/9] Limpando tabelas temporárias...")
-        conexao.execute(f"DROP TABLE IF EXISTS {tabela_raw};")
-        print("-> Tabelas temporárias removidas.")
-
-        # ETAPA 8: Criar Índices
-        print("\n[ETAPA 8/9] Criando índices na tabela final...")
-        colunas_para_indexar = ['ano', 'nome_municipio', 'principio_ativo', 'data', 'faixa_etaria', 'anvisa_lista', 'sigla_uf', 'codigo_atc', 'classe_terapeutica']
-        for coluna in colunas_para_indexar:
-            print(f" - Criando índice para a coluna: '{coluna}'...")
-            conexao.execute(f"CREATE INDEX IF NOT EXISTS idx_{coluna} ON {TABLE_NAME} ({coluna});")
-        print("-> Índices criados com sucesso.")
-
-        # ETAPA 9: Verificação Final
-        print("\n[ETAPA 9/9] Verificação final da qualidade dos dados...")
-        total_final = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
-        print(f"-> Tabela '{TABLE_NAME}' contém {total_final:,} registros válidos.")
-        resumo = conexao.execute(f"""
-        SELECT
-            COUNT(*) as total,
-            COUNT(DISTINCT principio_ativo) as principios_ativos_unicos,
-            COUNT(DISTINCT nome_municipio) as municipios_unicos,
-            COUNT(DISTINCT sigla_uf) as ufs_unicas
-            COUNT(DISTINCT classe_terapeutica) as classes_terapeuticas_unicas
-            COUNT(DISTINCT codigo_atc) as codigos_atc_unicos
-            COUNT(DISTINCT faixa_etaria) as faixas_etarias_unicas
-            COUNT(DISTINCT anvisa_lista) as listas_anvisa_unicas
-            COUNT(DISTINCT categoria) as categorias_unicas
-        FROM {TABLE_NAME}
-        """).fetchone()
-        print(f"""
-        Resumo Final:
-        - Total de registros: {resumo[0]:,}
-        - Princípios ativos únicos: {resumo[1]:,}
-        - Municípios únicos: {resumo[2]:,}
-        - UFs únicas: {resumo[3]:,}
-        - Tabela final criada com sucesso em: {TABLE_NAME}
-        - Classes terapêuticas únicas: {resumo[4]:,}
-        - Códigos ATC únicos: {resumo[5]:,}
-        - Faixas etárias únicas: {resumo[6]:,}
-        - Listas ANVISA únicas: {resumo[7]:,}
-        - Categorias únicas: {resumo[8]:,}
-        - Verifique os dados e índices criados.
+            COPY (SELECT * FROM {TABLE_NAME} WHERE TRUE{filtro_periodo})
+            TO '{pasta.as_posix()}' ({opcoes}, OVERWRITE_OR_IGNORE true);
         """)
+        return
+    pasta_nova = pasta.with_name(pasta.name + "_novo")
+    shutil.rmtree(pasta_nova, ignore_errors=True)
+    conexao.execute(f"COPY (SELECT * FROM {TABLE_NAME}) TO '{pasta_nova.as_posix()}' ({opcoes});")
+    pasta_antiga = pasta.with_name(pasta.name + "_antigo")
+    if pasta.exists():
+        pasta.rename(pasta_antiga)
+    pasta_nova.rename(pasta)
+    shutil.rmtree(pasta_antiga, ignore_errors=True)
+
+def _etapa_exportacao_parquet(conexao, contexto):
+    pasta = Path(contexto['pasta_parquet'])
+    exportar_prescricoes_parquet(conexao, pasta, contexto.get('filtro_periodo', ""))
+    tamanho_mb = sum(a.stat().st_size for a in pasta.rglob('*.parquet')) / 1024**2
+    print(f"-> Dataset Parquet (zstd, particionado por {'/'.join(COLUNAS_PARTICAO_PARQUET)}) em '{pasta}': {tamanho_mb:,.1f} MB.")
+
+def _etapa_verificacao_final(conexao, contexto):
+    total_final = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+    print(f"-> Tabela '{TABLE_NAME}' contém {total_final:,} registros válidos.")
+    resumo = conexao.execute(f"""
+    SELECT
+        COUNT(*) as total,
+        COUNT(DISTINCT principio_ativo) as principios_ativos_unicos,
+        COUNT(DISTINCT nome_municipio) as municipios_unicos,
+        COUNT(DISTINCT sigla_uf) as ufs_unicas,
+        COUNT(DISTINCT classe_terapeutica) as classes_terapeuticas_unicas,
+        COUNT(DISTINCT codigo_atc) as codigos_atc_unicos,
+        COUNT(DISTINCT faixa_etaria) as faixas_etarias_unicas,
+        COUNT(DISTINCT anvisa_lista) as listas_anvisa_unicas
+    FROM {TABLE_NAME}
+    """).fetchone()
+    print(f"""
+    Resumo Final:
+    - Total de registros: {resumo[0]:,}
+    - Princípios ativos únicos: {resumo[1]:,}
+    - Municípios únicos: {resumo[2]:,}
+    - UFs únicas: {resumo[3]:,}
+    - Tabela final criada com sucesso em: {TABLE_NAME}
+    - Classes terapêuticas únicas: {resumo[4]:,}
+    - Códigos ATC únicos: {resumo[5]:,}
+    - Faixas etárias únicas: {resumo[6]:,}
+    - Listas ANVISA únicas: {resumo[7]:,}
+    - Verifique os dados e índices criados.
+    """)
+
+def _etapa_perfil(conexao, contexto):
+    # Gravado antes da publicação para que a versão publicada já contenha o perfil desta carga
+    auditar_tabela_final(conexao, TABLE_NAME)
+
+# Tabelas grandes gravadas só por etapas do pipeline: na publicação, o registro de etapas diz se mudaram.
+# As de mapeamento também mudam fora do pipeline (atualizar_mapeamentos) e, pequenas, são comparadas pelo hash.
+TABELAS_MARCADAS_PELO_REGISTRO = (TABLE_NAME, TABLE_AGREGADO)
+
+def _marcas_registro(conexao, tabelas=TABELAS_MARCADAS_PELO_REGISTRO):
+    """
+    {tabela: marca} a partir de etl_stages: hash dos fingerprints de entrada das etapas concluídas
+    (ou reaproveitadas) da última execução que gravou a tabela, até a última etapa que a grava.
+    Mesmas entradas em toda a cadeia (CSVs, parâmetros, mapeamentos) => mesmo conteúdo. Tabelas
+    que nenhuma etapa registrada gravou ficam de fora (e são lidas por inteiro na publicação).
+    """
+    marcas = {}
+    for tabela in tabelas:
+        escritoras = [etapa['nome'] for etapa in ETAPAS_PIPELINE if tabela in etapa['saidas']]
+        ultima = conexao.execute(f"""
+            SELECT run_id, MAX(ordem) FROM {TABLE_ETL_STAGES}
+            WHERE status = 'concluida' AND etapa IN (SELECT unnest(?))
+            GROUP BY run_id ORDER BY run_id DESC LIMIT 1
+        """, [escritoras]).fetchone()
+        if ultima is None:
+            continue
+        fingerprints = [fp for (fp,) in conexao.execute(f"""
+            SELECT fingerprint_entrada FROM {TABLE_ETL_STAGES}
+            WHERE run_id = ? AND ordem <= ? AND status IN ('concluida', 'reaproveitada') ORDER BY ordem
+        """, list(ultima)).fetchall()]
+        marcas[tabela] = _fingerprint(fingerprints)
+    return marcas
+
+def _etapa_publicacao(conexao, contexto):
+    # Blue/green: o dashboard continua na versão anterior até o ponteiro ser trocado
+    # O registro de execuções e o perfil das colunas mudam a cada run; sozinhos, não justificam uma nova versão
+    destino = publicar_versao(conexao, contexto['pasta_versoes'], ignorar_na_comparacao=(TABLE_ETL_RUNS, TABLE_ETL_STAGES, TABLE_PERFIL_COLUNAS),
+                              marcas=_marcas_registro(conexao), run_id=contexto.get('run_id'))
+    if destino is None:
+        print("-> Nenhuma tabela mudou desde a versão publicada; nada a publicar.")
+        return
+    print(f" - Nova versão publicada: {destino}")
+    for arquivo in remover_versoes_antigas(contexto['pasta_versoes']):
+        print(f" - Versão antiga removida: {arquivo}")
+    print("-> O dashboard passa a ler a nova versão na próxima consulta, sem reinício.")
+
+# Etapas na ordem de execução. 'entradas' e 'parametros' (chaves do contexto) compõem o
+# fingerprint de entrada; etapas 'sempre' configuram a sessão e rodam em toda execução, e
+# etapas com 'ativa_se' só rodam quando essa chave do contexto está preenchida.
+ETAPAS_PIPELINE = [
+    {'nome': 'extensoes', 'titulo': "Instalando extensões do DuckDB (icu)", 'funcao': _etapa_extensoes,
+     'entradas': [], 'parametros': [], 'saidas': [], 'sempre': True},
+    {'nome': 'carga_raw', 'titulo': f"Carregando dados brutos para a tabela '{TABELA_RAW}'", 'funcao': _etapa_carga_raw,
+     'entradas': [], 'parametros': ['caminho_pasta_entrada', 'modo_ingestao', 'reprocessar_tudo'],
+     'saidas': [TABELA_RAW, TABLE_PERIODOS_AFETADOS], 'sempre': False},
+    {'nome': 'dicionario', 'titulo': "Padronizando nomes de princípios ativos (dicionário de nomes distintos)", 'funcao': _etapa_dicionario,
+     'entradas': [TABELA_RAW], 'parametros': [], 'saidas': [TABLE_DICIONARIO_PA], 'sempre': False},
+    {'nome': 'apresentacoes', 'titulo': "Classificando forma farmacêutica e dosagem por apresentação distinta", 'funcao': _etapa_apresentacoes,
+     'entradas': [TABELA_RAW], 'parametros': [], 'saidas': [TABLE_APRESENTACOES], 'sempre': False},
+    {'nome': 'mapeamentos', 'titulo': "Preparando as tabelas de mapeamento para consistência", 'funcao': _etapa_mapeamentos,
+     'entradas': [TABLE_ATC, TABLE_MAPEAMENTO], 'parametros': [], 'saidas': [TABLE_ATC, TABLE_MAPEAMENTO], 'sempre': False},
+    {'nome': 'parametros', 'titulo': "Calculando parâmetros de tratamento (idade média e limite IQR) na staging", 'funcao': _etapa_parametros,
+     'entradas': [TABELA_RAW], 'parametros': ['incremental'], 'saidas': [TABLE_PARAMETROS], 'sempre': False},
+    {'nome': 'tabela_final', 'titulo': f"Criando tabela final '{TABLE_NAME}' em passagem única (transformações, flags, faixas e enriquecimento)",
+     'funcao': _etapa_tabela_final,
+     'entradas': [TABELA_RAW, TABLE_DICIONARIO_PA, TABLE_APRESENTACOES, TABLE_MAPEAMENTO, TABLE_ATC, TABLE_MUNICIPIOS],
+     'parametros': ['incremental', 'filtro_periodo', 'media_idade', 'limite_superior_qtd', 'layout'], 'saidas': [TABLE_NAME], 'sempre': False},
+    {'nome': 'verificacao_atc', 'titulo': "Verificando enriquecimento com a classificação ATC", 'funcao': _etapa_verificacao_atc,
+     'entradas': [TABLE_NAME], 'parametros': [], 'saidas': [], 'sempre': False},
+    {'nome': 'manifesto', 'titulo': "Registrando manifesto e limpando tabelas temporárias", 'funcao': _etapa_manifesto,
+     'entradas': [TABLE_NAME], 'parametros': ['incremental', 'estatisticas_carregados', 'removidos'],
+     'saidas': [TABLE_MANIFESTO], 'sempre': False},
+    {'nome': 'indices', 'titulo': "Ajustando os índices da tabela final ao layout", 'funcao': _etapa_indices,
+     'entradas': [TABLE_NAME], 'parametros': ['layout'], 'saidas': [TABLE_NAME], 'sempre': False},
+    {'nome': 'agregado', 'titulo': f"Materializando o cubo '{TABLE_AGREGADO}' para as consultas do dashboard", 'funcao': _etapa_agregado,
+     'entradas': [TABLE_NAME], 'parametros': ['incremental', 'filtro_periodo'], 'saidas': [TABLE_AGREGADO], 'sempre': False},
+    {'nome': 'exportacao_parquet', 'titulo': "Exportando a tabela final para Parquet particionado", 'funcao': _etapa_exportacao_parquet,
+     'entradas': [TABLE_NAME], 'parametros': ['pasta_parquet', 'filtro_periodo'], 'saidas': [], 'sempre': False,
+     'ativa_se': 'pasta_parquet'},
+    {'nome': 'verificacao_final', 'titulo': "Verificação final da qualidade dos dados", 'funcao': _etapa_verificacao_final,
+     'entradas': [TABLE_NAME], 'parametros': [], 'saidas': [], 'sempre': False},
+    {'nome': 'perfil', 'titulo': f"Gravando o perfil das colunas de '{TABLE_NAME}' (drift entre cargas)", 'funcao': _etapa_perfil,
+     'entradas': [TABLE_NAME], 'parametros': [], 'saidas': [TABLE_PERFIL_COLUNAS], 'sempre': False},
+    {'nome': 'publicacao', 'titulo': "Publicando uma nova versão validada do banco para o dashboard", 'funcao': _etapa_publicacao,
+     'entradas': [TABLE_NAME], 'parametros': ['pasta_versoes'], 'saidas': [], 'sempre': False,
+     'ativa_se': 'pasta_versoes'},
+]
+NOMES_ETAPAS = [etapa['nome'] for etapa in ETAPAS_PIPELINE]
+
+def executar_pipeline_etl_sql(conexao, caminho_pasta_entrada, modo_ingestao=MODO_INGESTAO_PADRAO, reprocessar_tudo=False,
+                              retomar=False, a_partir_de=None, somente=None, relatorio_dir=RELATORIO_DIR_PADRAO,
+                              pasta_parquet=None, layout=None, pasta_versoes=None):
+    """
+    Executa o pipeline completo de ETL usando uma abordagem híbrida robusta.
+
+    Por padrão a carga é incremental: apenas arquivos novos ou alterados (segundo o
+    manifesto) são lidos, e somente os meses afetados são substituídos em 'prescricoes'.
+    Use reprocessar_tudo=True para reconstruir a tabela a partir de todos os CSVs
+    (necessário, por exemplo, após mudanças nas tabelas de mapeamento).
+
+    Cada etapa é registrada em etl_runs/etl_stages com seu fingerprint de entrada:
+    - retomar=True retoma a última execução não concluída, pulando as etapas já
+      concluídas cujas entradas não mudaram;
+    - a_partir_de='etapa' executa dessa etapa em diante e somente='etapa' executa só ela,
+      ambos reaproveitando o contexto (modo incremental, parâmetros) da última execução.
+    Com pasta_parquet, a tabela final também é exportada em Parquet particionado
+    (ano/mes/sigla_uf), que o dashboard pode ler no lugar do arquivo .duckdb.
+    layout escolhe o layout físico da tabela final ('ordenado' ou 'indices', ver LAYOUTS);
+    sem ele vale o da execução reaproveitada ou LAYOUT_PADRAO.
+    Com pasta_versoes, a última etapa grava um arquivo versionado nessa pasta (cópia da versão
+    publicada com só as tabelas alteradas regravadas; nada, se nenhuma mudou), valida a cópia
+    e troca o ponteiro lido pelo dashboard; uma execução que falha antes disso nunca fica visível.
+
+    As métricas de cada etapa executada (tempo, CPU, linhas, bytes do banco e pico de RSS)
+    são gravadas em relatorio_dir como instrumentacao_etl_run<N>_*.json/.parquet.
+    A conexão não é fechada. Retorna True se a execução terminou sem erros.
+    """
+    for nome in (a_partir_de, somente):
+        if nome is not None and nome not in NOMES_ETAPAS:
+            raise ValueError(f"Etapa desconhecida: {nome}. Etapas válidas: {', '.join(NOMES_ETAPAS)}")
+    print("--- INICIANDO PIPELINE ETL (VERSÃO COM PADRONIZAÇÃO AVANÇADA) ---")
+    garantir_registro_execucoes(conexao)
+
+    contexto = {
+        'tabela_raw': TABELA_RAW,
+        'caminho_pasta_entrada': str(caminho_pasta_entrada),
+        'modo_ingestao': modo_ingestao,
+        'reprocessar_tudo': reprocessar_tudo,
+    }
+    etapas_anteriores = {}
+    if retomar or a_partir_de or somente:
+        anterior = _ultima_execucao(conexao)
+        if anterior is None:
+            log.warning("Nenhuma execução anterior registrada. Executando com um contexto novo.")
+        elif retomar and anterior[1] == 'concluida':
+            print(f"-> A última execução (run {anterior[0]}) foi concluída. Nada a retomar.")
+            return True
+        else:
+            print(f"Reaproveitando o contexto da execução {anterior[0]} ({anterior[1]}).")
+            contexto.update(anterior[2])
+            contexto.pop('nada_a_processar', None)
+            if retomar:
+                etapas_anteriores = anterior[3]
+    if pasta_parquet is not None:
+        contexto['pasta_parquet'] = str(pasta_parquet)
+    if pasta_versoes is not None:
+        contexto['pasta_versoes'] = str(pasta_versoes)
+    if layout is not None and layout not in LAYOUTS:
+        raise ValueError(f"Layout desconhecido: {layout}. Layouts válidos: {', '.join(LAYOUTS)}")
+    contexto['layout'] = layout or contexto.get('layout', LAYOUT_PADRAO)
+
+    run_id = conexao.execute(f"SELECT COALESCE(MAX(run_id), 0) + 1 FROM {TABLE_ETL_RUNS}").fetchone()[0]
+    parametros = {'caminho_pasta_entrada': str(caminho_pasta_entrada), 'modo_ingestao': modo_ingestao,
+                  'reprocessar_tudo': reprocessar_tudo, 'retomar': retomar, 'a_partir_de': a_partir_de, 'somente': somente, 'layout': contexto['layout']}
+    conexao.execute(f"INSERT INTO {TABLE_ETL_RUNS} VALUES (?, current_timestamp, NULL, 'em_execucao', ?, ?)",
+                    [run_id, json.dumps(parametros), json.dumps(contexto, default=str)])
+    contexto['run_id'] = run_id
+    print(f"Execução registrada como run {run_id}.")
+
+    status_execucao = 'falhou'
+    ultima_ordem = len(ETAPAS_PIPELINE) - 1
+    alguma_executada = False
+    registros_instrumentacao = []
+    try:
+        for ordem, etapa in enumerate(ETAPAS_PIPELINE):
+            entradas = _entradas_etapa(conexao, etapa, contexto)
+            if etapa['sempre']:
+                motivo_pular = None
+            elif etapa.get('ativa_se') and not contexto.get(etapa['ativa_se']):
+                motivo_pular = "desativada"
+            elif somente:
+                motivo_pular = None if etapa['nome'] == somente else "fora de --only-stage"
+            elif a_partir_de:
+                motivo_pular = None if ordem >= NOMES_ETAPAS.index(a_partir_de) else "anterior a --from-stage"
+            elif (not alguma_executada and etapa['nome'] in etapas_anteriores
+                  and etapas_anteriores[etapa['nome']][0] in ('concluida', 'reaproveitada')
+                  and _entradas_compativeis(etapas_anteriores[etapa['nome']][1], entradas)):
+                # Só é seguro reaproveitar enquanto nenhuma etapa anterior foi reexecutada nesta retomada
+                motivo_pular = "concluída na execução anterior, entradas inalteradas"
+            else:
+                motivo_pular = None
+
+            if motivo_pular:
+                status_etapa = 'reaproveitada' if etapas_anteriores and motivo_pular != "desativada" else 'pulada'
+                print(f"\n[ETAPA {ordem}/{ultima_ordem}] {etapa['nome']}: {status_etapa} ({motivo_pular}).")
+                _registrar_etapa(conexao, run_id, ordem, etapa, status_etapa, entradas)
+                continue
+
+            print(f"\n[ETAPA {ordem}/{ultima_ordem}] {etapa['titulo']}...")
+            alguma_executada = alguma_executada or not etapa['sempre']
+            inicio = _registrar_etapa(conexao, run_id, ordem, etapa, 'em_execucao', entradas)
+            try:
+                with medir_etapa(conexao, registros_instrumentacao, etapa['nome'], etapa['entradas'], etapa['saidas'],
+                                 run_id=run_id, ordem=ordem, modo_ingestao=contexto['modo_ingestao'],
+                                 versao_normalizacao=VERSAO_NORMALIZACAO) as metricas:
+                    if etapa['nome'] == 'carga_raw':
+                        metricas['bytes_entrada'] = sum(tamanho for _, tamanho, _ in entradas['arquivos'])
+                    etapa['funcao'](conexao, contexto)
+                    metricas.update(contexto.pop('metricas_etapa', {}))
+            except Exception as e:
+                _registrar_etapa(conexao, run_id, ordem, etapa, 'falhou', entradas, inicio, erro=str(e))
+                raise
+            _registrar_etapa(conexao, run_id, ordem, etapa, 'concluida', entradas, inicio)
+            conexao.execute(f"UPDATE {TABLE_ETL_RUNS} SET contexto = ? WHERE run_id = ?", [json.dumps(contexto, default=str), run_id])
+            if contexto.get('nada_a_processar'):
+                break
+        status_execucao = 'concluida'
 
     except FileNotFoundError as e:
         log.error(f"Arquivo não encontrado: {e}")
     except Exception as e:
         log.exception("Erro inesperado durante o ETL")
     finally:
-        if conexao is not None:
-            conexao.close()
-            print("Conexão com DuckDB fechada.")
-    
-    print(f"\n--- PIPELINE ETL CONCLUÍDO ---")
+        conexao.execute(f"UPDATE {TABLE_ETL_RUNS} SET status = ?, finalizado_em = current_timestamp WHERE run_id = ?", [status_execucao, run_id])
+        if registros_instrumentacao and relatorio_dir is not None:
+            caminho_relatorio = salvar_relatorio(registros_instrumentacao, f"etl_run{run_id}", relatorio_dir)
+            print(f"Instrumentação das etapas gravada em: {caminho_relatorio}")
 
-def carregar_mapeamento_para_db():
-    print("--- INICIANDO CARGA DO MAPEAMENTO PARA O BANCO DE DADOS ---")
-    BASE_DIR = Path(__file__).resolve().parent.parent
-    CAMINHO_MAPEAMENTO_CSV = BASE_DIR / "dados" / "mapeamento_Controlados.csv"
-    DUCKDB_FILE_PATH = BASE_DIR / "dados" / "sngpc_analytics.duckdb"
-    NOME_TABELA = "mapeamento_controlados"
-    
-    conexao = None
-    print(f"Conectando ao banco de dados DuckDB em: {DUCKDB_FILE_PATH}")
-    
-    try:
-        conexao = duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=False)
-        print("Conexão estabelecida com sucesso.")
-        
-        if not CAMINHO_MAPEAMENTO_CSV.exists():
-            raise FileNotFoundError(f"Arquivo de mapeamento não encontrado: {CAMINHO_MAPEAMENTO_CSV}")
-        
-        print(f"Lendo arquivo de mapeamento: {CAMINHO_MAPEAMENTO_CSV}")
-        df_mapeamento = pd.read_csv(CAMINHO_MAPEAMENTO_CSV, sep=',')
-        
-        print("Carregando tabela de mapeamento ATC do banco de dados...")
-        tabela_atc = "mapeamento_atc"
-        df_atc = conexao.execute(f"SELECT * FROM {tabela_atc}").fetchdf()
-
-        df_atc['join_key'] = df_atc['principio_ativo'].str.strip().str.upper()
-        print("Tabela de mapeamento ATC carregada e preparada.")
-        
-        print("Padronizando nomes das colunas...")
-        df_mapeamento.columns = [col.lower().strip().replace(' ', '_') for col in df_mapeamento.columns]
-        
-        if 'principio_ativo' in df_mapeamento.columns:
-            print("Padronizando e criando chave de junção sem acentos...")
-            df_mapeamento['principio_ativo_base'] = df_mapeamento['principio_ativo'].str.strip().str.upper()
-            df_mapeamento['join_key'] = df_mapeamento['principio_ativo_base'].apply(lambda x: unidecode(str(x)).upper())
-        
-        print(f"Criando ou substituindo a tabela '{NOME_TABELA}'...")
-        conexao.sql(f"CREATE OR REPLACE TABLE {NOME_TABELA} AS SELECT * FROM df_mapeamento")
-        
-        total_linhas = conexao.execute(f"SELECT COUNT(*) FROM {NOME_TABELA};").fetchone()[0]
-        print(f"Tabela '{NOME_TABELA}' criada/atualizada com sucesso com {total_linhas} registros.")
+    if status_execucao != 'concluida':
+        print(f"\nExecução {run_id} falhou. Corrija o problema e use --resume para continuar da etapa que falhou.")
+    print(f"\n--- PIPELINE ETL CONCLUÍDO ---")
+    return status_execucao == 'concluida'
 
-    except Exception as e:
-        print(f"ERRO na carga do mapeamento: {e}")
-    finally:
-        if conexao is not None:
-            conexao.close()
-            print("Conexão com DuckDB fechada.")
-    
-    print(f"\n--- CARGA DO MAPEAMENTO CONCLUÍDA ---")
+def _argumentos_cli(argv=None):
+    parser = argparse.ArgumentParser(description="ETL das prescrições do SNGPC para o DuckDB.")
+    parser.add_argument('--entrada', default=str(Path.cwd() / "dados" / "dados_Originais"), help="Pasta com os CSVs brutos.")
+    parser.add_argument('--ingestao', choices=['duckdb', 'pandas'], default=MODO_INGESTAO_PADRAO, help="Leitor usado na carga dos CSVs.")
+    parser.add_argument('--reprocessar-tudo', action='store_true', help="Ignora o manifesto e reconstrói a tabela a partir de todos os CSVs.")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument('--resume', action='store_true', help="Retoma a última execução não concluída, reaproveitando as etapas já concluídas.")
+    grupo.add_argument('--from-stage', choices=NOMES_ETAPAS, help="Executa a partir desta etapa.")
+    grupo.add_argument('--only-stage', choices=NOMES_ETAPAS, help="Executa apenas esta etapa.")
+    parser.add_argument('--exportar-parquet', nargs='?', const=str(PARQUET_DIR_PATH), default=None, metavar='PASTA',
+                        help=f"Também exporta 'prescricoes' em Parquet zstd particionado por ano/mes/sigla_uf (padrão: {PARQUET_DIR_PATH}).")
+    parser.add_argument('--layout', choices=LAYOUTS, default=None,
+                        help=f"Layout físico de 'prescricoes': tabela ordenada para zone maps ou índices ART por coluna (padrão: {LAYOUT_PADRAO}).")
+    parser.add_argument('--perfil-recursos', choices=list(PERFIS_RECURSOS_ETL), default=None,
+                        help=f"Perfil de memória/threads do DuckDB (padrão: etl.perfil_recursos do config.yaml ou {PERFIL_RECURSOS_PADRAO}).")
+    parser.add_argument('--sem-publicacao', action='store_true',
+                        help=f"Não publica uma nova versão do banco para o dashboard (padrão: publica em {VERSOES_DIR_PATH}).")
+    parser.add_argument('--sem-mapeamentos', action='store_true',
+                        help="Não recarrega as tabelas de mapeamento a partir dos CSVs de dados/ antes do ETL (só os CSVs alterados são relidos).")
+    parser.add_argument('--sem-auditoria', action='store_true', help="Não executa a auditoria pós-ETL.")
+    parser.add_argument('--relatorio-dir', default=RELATORIO_DIR_PADRAO, help="Pasta dos relatórios de instrumentação e auditoria.")
+    grupo.add_argument('--comparar-instrumentacao', nargs=2, metavar=('RELATORIO_A', 'RELATORIO_B'),
+                       help="Compara dois relatórios de instrumentação (.json/.parquet) etapa a etapa e sai, sem executar o ETL.")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    conexao_etl = get_db_connection_for_etl()
+    args = _argumentos_cli()
+    if args.comparar_instrumentacao:
+        with pd.option_context('display.max_columns', None, 'display.width', 200, 'display.float_format', '{:,.2f}'.format):
+            print(comparar_relatorios(*args.comparar_instrumentacao).to_string(index=False))
+        sys.exit(0)
+
+    config_etl = carregar_config().get('etl') or {}
+    sucesso = False
+    conexao_etl = get_db_connection_for_etl(args.perfil_recursos or config_etl.get('perfil_recursos'), **(config_etl.get('recursos') or {}))
     if conexao_etl:
-        executar_pipeline_etl_sql(
-            caminho_pasta_entrada=Path.cwd() / "dados" / "dados_Originais",
-            conexao=conexao_etl
-        )
-    
-    carregar_mapeamento_para_db()
-    print("\n--- CARGA DO MAPEAMENTO DE PRINCÍPIOS ATIVOS CONCLUÍDA ---")
-    
+        try:
+            if not args.sem_mapeamentos:
+                print("--- ATUALIZANDO TABELAS DE MAPEAMENTO ---")
+                registros_mapeamentos = []
+                try:
+                    atualizar_mapeamentos(conexao_etl, registros=registros_mapeamentos)
+                finally:
+                    if registros_mapeamentos and args.relatorio_dir is not None:
+                        salvar_relatorio(registros_mapeamentos, "mapeamentos", args.relatorio_dir)
+            sucesso = executar_pipeline_etl_sql(
+                conexao=conexao_etl,
+                caminho_pasta_entrada=Path(args.entrada),
+                modo_ingestao=args.ingestao,
+                reprocessar_tudo=args.reprocessar_tudo,
+                retomar=args.resume,
+                a_partir_de=args.from_stage,
+                somente=args.only_stage,
+                relatorio_dir=args.relatorio_dir,
+                pasta_parquet=args.exportar_parquet,
+                layout=args.layout,
+                pasta_versoes=None if args.sem_publicacao else VERSOES_DIR_PATH,
+            )
+        finally:
+            conexao_etl.close()
+            print("Conexão com DuckDB fechada.")
+
     print("\n--- ETL COMPLETO ---")
     print("Verifique os logs para detalhes e possíveis avisos.")
-    
-executar_auditoria_completa = True
-if executar_auditoria_completa:
-    from scripts.auditoria_etl_bd import executar_auditoria_completa
-    executar_auditoria_completa(relatorio_dir="dados/relatorios_etl")
-else:
-    print("Auditoria pós-ETL não executada. Defina 'executar_auditoria_completa' como True para ativar.")
-    print("Você pode executar a auditoria separadamente usando o script 'auditoria_etl_bd.py'.")
\ No newline at end of file
+
+    if not args.sem_auditoria:
+        from scripts.auditoria_etl_bd import executar_auditoria_completa
+        # O perfil de 'prescricoes' (e o diff com a carga anterior) já saiu da etapa 'perfil'
+        executar_auditoria_completa(relatorio_dir=args.relatorio_dir, perfilar_tabela_final=False)
+    else:
+        print("Auditoria pós-ETL não executada. Você pode executá-la separadamente com o script 'auditoria_etl_bd.py'.")
+    sys.exit(0 if sucesso else 1)
@@ -1,4 +1,6 @@
 # Script para identificar princípios ativos não mapeados no banco de dados DuckDB
+# e sugerir, por similaridade de n-gramas, as entradas de mapeamento correspondentes.
+import argparse
 import duckdb
 import pandas as pd
 from pathlib import Path
@@ -8,7 +10,18 @@ import sys
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
-from src.utils.database_utils import DUCKDB_FILE_PATH, TABLE_NAME
+from src.utils.database_utils import DUCKDB_FILE_PATH, TABLE_NAME, TABLE_MAPEAMENTO, TABLE_ATC
+from src.utils.mapeamentos_utils import MAPEAMENTOS, MAPEAMENTOS_DIR_PATH
+from src.utils.normalizacao_utils import expressao_sql_join_key
+from src.utils.similaridade_utils import sugerir_correspondencias, TOP_K_SUGESTOES, SCORE_MINIMO_SUGESTAO
+
+# Mapeamento -> condição que identifica, em 'prescricoes', as linhas sem correspondência nele
+# e colunas da tabela de mapeamento exibidas junto de cada sugestão
+ALVOS_SUGESTAO = {
+    TABLE_MAPEAMENTO: {'nao_mapeado': "anvisa_lista IS NULL", 'colunas': ['lista']},
+    TABLE_ATC: {'nao_mapeado': "codigo_atc = 'Não Classificado'", 'colunas': ['codigo_atc', 'classe_terapeutica']},
+}
+SCORE_ACEITE_PADRAO = 0.85
 
 def extrair_ativos_nao_mapeados():
     """
@@ -16,7 +29,7 @@ def extrair_ativos_nao_mapeados():
     mapeados para uma lista da ANVISA e os salva em um arquivo CSV para revisão.
     """
     print("--- INICIANDO IDENTIFICAÇÃO DE ATIVOS NÃO MAPEADOS ---")
-    
+
     conexao = None
     try:
         # Caminho para o novo arquivo CSV de saída
@@ -24,7 +37,7 @@ def extrair_ativos_nao_mapeados():
 
         conexao = duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=True)
         print(f"Conexão estabelecida com o banco: {DUCKDB_FILE_PATH}")
-        
+
         # Query SQL para encontrar os princípios ativos únicos onde 'anvisa_lista' é nulo ou 'Não Mapeado'
         # Isso captura tanto as falhas de junção quanto os casos explicitamente não mapeados.
         query = f"""
@@ -32,17 +45,17 @@ def extrair_ativos_nao_mapeados():
         FROM {TABLE_NAME}
         WHERE anvisa_lista IS NULL OR anvisa_lista = 'Não Mapeado';
         """
-        
+
         print("Executando query para encontrar ativos não mapeados...")
         df_nao_mapeados = conexao.execute(query).fetchdf()
-        
+
         if df_nao_mapeados.empty:
             print("\nÓtima notícia! Nenhum princípio ativo não mapeado foi encontrado.")
             print("Seu arquivo de mapeamento parece estar completo.")
         else:
             total_encontrado = len(df_nao_mapeados)
             print(f"-> Encontrados {total_encontrado} princípios ativos que precisam de revisão.")
-            
+
             # Salva a lista em um novo arquivo CSV para sua curadoria
             df_nao_mapeados.to_csv(caminho_saida, index=False, sep=';', encoding='utf-8')
             print(f"\nArquivo '{caminho_saida.name}' salvo com sucesso na pasta 'dados/'.")
@@ -55,5 +68,95 @@ def extrair_ativos_nao_mapeados():
             conexao.close()
             print("\nConexão com DuckDB fechada.")
 
+def sugerir_mapeamentos(conexao, top_k=TOP_K_SUGESTOES, score_minimo=SCORE_MINIMO_SUGESTAO):
+    """
+    Para cada mapeamento de ALVOS_SUGESTAO, sugere as entradas mais parecidas (pela join_key)
+    com cada princípio ativo de 'prescricoes' sem correspondência nele. Retorna um DataFrame
+    com mapeamento, principio_ativo, linhas (prescrições afetadas), candidato, score,
+    cobertura, posicao e as colunas informativas do mapeamento.
+    """
+    sugestoes = []
+    for tabela, alvo in ALVOS_SUGESTAO.items():
+        nao_mapeados = f"SELECT principio_ativo FROM {TABLE_NAME} WHERE {alvo['nao_mapeado']}"
+        df = sugerir_correspondencias(conexao, nao_mapeados, f"SELECT join_key FROM {tabela}", top_k, score_minimo)
+        if df.empty:
+            continue
+        linhas = conexao.execute(f"SELECT principio_ativo AS nome, COUNT(*) AS linhas FROM {TABLE_NAME} WHERE {alvo['nao_mapeado']} GROUP BY 1").fetchdf()
+        info = conexao.execute(f"""
+            SELECT join_key AS candidato, {', '.join(f"string_agg(DISTINCT CAST({c} AS VARCHAR), ' | ') AS {c}" for c in alvo['colunas'])}
+            FROM {tabela} GROUP BY join_key
+        """).fetchdf()
+        df = df.merge(linhas, on='nome', how='left').merge(info, on='candidato', how='left')
+        sugestoes.append(df.rename(columns={'nome': 'principio_ativo'}).assign(mapeamento=tabela))
+    if not sugestoes:
+        return pd.DataFrame(columns=['mapeamento', 'principio_ativo', 'linhas', 'candidato', 'score', 'cobertura', 'posicao'])
+    resultado = pd.concat(sugestoes, ignore_index=True)
+    primeiras = ['mapeamento', 'principio_ativo', 'linhas', 'candidato', 'score', 'cobertura', 'posicao']
+    return resultado[primeiras + [c for c in resultado.columns if c not in primeiras]].sort_values(
+        ['mapeamento', 'linhas', 'principio_ativo', 'posicao'], ascending=[True, False, True, True])
+
+def aceitar_sugestoes(sugestoes, score_aceite=SCORE_ACEITE_PADRAO, pasta=MAPEAMENTOS_DIR_PATH):
+    """
+    Acrescenta ao CSV de cada mapeamento uma cópia das linhas do melhor candidato (posição 1,
+    score >= score_aceite) com o nome não mapeado em principio_ativo; uma substância com
+    vários intervalos de vigência tem todos copiados. Nomes já presentes no CSV são ignorados.
+    Retorna {mapeamento: linhas acrescentadas}. A próxima execução do ETL recarrega os CSVs alterados.
+    """
+    aceitas = sugestoes[(sugestoes['posicao'] == 1) & (sugestoes['score'] >= score_aceite)]
+    acrescentadas = {}
+    for tabela, grupo in aceitas.groupby('mapeamento'):
+        caminho = Path(pasta) / MAPEAMENTOS[tabela]['arquivo']
+        df_csv = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+        coluna_pa = next(c for c in df_csv.columns if c.lower().strip().replace(' ', '_') == 'principio_ativo')
+        # join_key de cada linha do CSV, com a mesma normalização do ETL
+        conexao = duckdb.connect()
+        try:
+            nomes = pd.DataFrame({'nome': df_csv[coluna_pa]})
+            chaves = conexao.execute(f"SELECT {expressao_sql_join_key('nome')} FROM nomes").fetchdf().iloc[:, 0]
+        finally:
+            conexao.close()
+        existentes = set(df_csv[coluna_pa].str.strip().str.upper())
+        novas = [
+            df_csv[chaves.values == sugestao.candidato].assign(**{coluna_pa: sugestao.principio_ativo})
+            for sugestao in grupo.itertuples()
+            if sugestao.principio_ativo.strip().upper() not in existentes
+        ]
+        novas = pd.concat(novas, ignore_index=True) if novas else df_csv.iloc[0:0]
+        if not novas.empty:
+            with open(caminho, 'rb') as f:
+                f.seek(-1, 2)
+                termina_com_quebra = f.read(1) in (b'\n', b'\r')
+            with open(caminho, 'a', encoding='utf-8', newline='') as f:
+                if not termina_com_quebra:
+                    f.write('\n')
+                novas.to_csv(f, header=False, index=False)
+        acrescentadas[tabela] = len(novas)
+        print(f"-> {len(novas)} linha(s) acrescentada(s) a {caminho.name} ({len(grupo)} sugestão(ões) com score >= {score_aceite}).")
+    return acrescentadas
+
+def executar_sugestoes(top_k=TOP_K_SUGESTOES, score_minimo=SCORE_MINIMO_SUGESTAO, score_aceite=None):
+    """Gera dados/sugestoes_mapeamento.csv e, com score_aceite, grava as sugestões aceitas nos CSVs de mapeamento."""
+    print("--- SUGERINDO MAPEAMENTOS PARA OS ATIVOS NÃO MAPEADOS ---")
+    caminho_saida = project_root / "dados" / "sugestoes_mapeamento.csv"
+    conexao = duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=True)
+    try:
+        sugestoes = sugerir_mapeamentos(conexao, top_k, score_minimo)
+    finally:
+        conexao.close()
+    sugestoes.to_csv(caminho_saida, index=False, sep=';', encoding='utf-8')
+    print(f"-> {sugestoes['principio_ativo'].nunique()} ativos com sugestões; ranking salvo em '{caminho_saida.name}'.")
+    if score_aceite is not None:
+        aceitar_sugestoes(sugestoes, score_aceite)
+        print("Execute o ETL (ou scripts/atualizar_mapeamentos.py) para recarregar os mapeamentos alterados.")
+    return sugestoes
+
 if __name__ == '__main__':
-    extrair_ativos_nao_mapeados()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Lista os princípios ativos não mapeados e sugere correspondências nos mapeamentos.")
+    parser.add_argument('--top-k', type=int, default=TOP_K_SUGESTOES, help="Sugestões por ativo.")
+    parser.add_argument('--score-minimo', type=float, default=SCORE_MINIMO_SUGESTAO, help="Score mínimo (Dice de trigramas) de uma sugestão.")
+    parser.add_argument('--aceitar-acima', type=float, nargs='?', const=SCORE_ACEITE_PADRAO, default=None, metavar='SCORE',
+                        help=f"Grava nos CSVs de mapeamento as melhores sugestões com score >= SCORE (padrão: {SCORE_ACEITE_PADRAO}).")
+    args = parser.parse_args()
+
+    extrair_ativos_nao_mapeados()
+    executar_sugestoes(args.top_k, args.score_minimo, args.aceitar_acima)
@@ -1,106 +1,156 @@
-# O ETL agora é feito direto no banco DuckDB, sem salvar CSV intermediário.
-# Envio dos dados do CSV para o DuckDB
-# Este script lê um arquivo CSV e o insere em uma tabela DuckDB, criando índices para otimização de consultas.
-# Certifique-se de que o DuckDB está instalado: pip install duckdb
-# O arquivo CSV deve estar no diretório 'dados' com o nome 'dados_processados.csv'.
-# O banco de dados DuckDB será criado no mesmo diretório com o nome 'sngpc_analytics.duckdb'.
-# Este script também verifica se a tabela já existe e permite ao usuário decidir se deseja recriá-la.  
-
-import duckdb
-import pandas as pd # Apenas para inspecionar, se necessário
+# scripts/migrar_csv_DB.py
+# Migração de um CSV processado (ex.: dados/dados_processados.csv, exportação de 'prescricoes')
+# para o DuckDB. O CSV é lido pelo leitor paralelo do DuckDB com o schema declarado da tabela
+# final do ETL (SCHEMA_PRESCRICOES), sem passada de inferência de tipos; uma leitura prévia só
+# das colunas ENUM define os domínios, e a tabela é gravada uma única vez já com os tipos
+# finais. Linhas que não convertem para o tipo declarado não abortam a carga: vão para a
+# tabela TABLE_REJEITADAS_MIGRACAO com arquivo, linha e motivo. O script não é interativo.
+import argparse
+import sys
 from pathlib import Path
 
-# --- Configurações ---
-BASE_DIR = Path(__file__).resolve().parent
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.utils.database_utils import get_db_connection_for_etl, BASE_DIR, DUCKDB_FILE_PATH, TABLE_NAME, PERFIS_RECURSOS_ETL
+from src.utils.instrumentacao_utils import medir_etapa, salvar_relatorio, RELATORIO_DIR_PADRAO
+from scripts.etl import SCHEMA_PRESCRICOES, TIPOS_ENUM, SEXOS, FORMAS_FARMACEUTICAS, FAIXAS_ETARIAS, garantir_tipo_enum
+
 CSV_FILE_PATH = BASE_DIR / "dados" / "dados_processados.csv"
-DUCKDB_FILE_PATH = BASE_DIR / "dados" / "sngpc_analytics.duckdb" # Onde o arquivo do banco será salvo
-TABLE_NAME = "prescricoes"
+TABLE_REJEITADAS_MIGRACAO = "prescricoes_migracao_rejeitadas"
+# Domínios fixos dos ENUMs definidos pelo próprio ETL; os demais vêm dos valores carregados
+VALORES_FIXOS_ENUM = {'sexo': SEXOS, 'classe_terapeutica': ['Não Classificada'], 'forma_farmaceutica': FORMAS_FARMACEUTICAS, 'faixa_etaria': FAIXAS_ETARIAS}
+_REJEITOS_TMP, _VARREDURAS_TMP = "migracao_rejeitos_tmp", "migracao_varreduras_tmp"
 
-def create_duckdb_database():
-    print(f"Conectando/Criando banco de dados DuckDB em: {DUCKDB_FILE_PATH}...")
-    con = duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=False)
+def _colunas_cabecalho(caminho_csv, encoding):
+    """Nomes das colunas do cabeçalho do CSV, padronizados (minúsculas, '_')."""
+    with open(caminho_csv, 'r', encoding=encoding, newline='') as f:
+        cabecalho = f.readline().strip().lstrip('\ufeff')
+    return [c.strip().strip('"').lower().replace(' ', '_') for c in cabecalho.split(',')]
 
-    print(f"Verificando se a tabela '{TABLE_NAME}' já existe...")
-    result = con.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{TABLE_NAME}';").fetchone()
+def _garantir_tabela_rejeitadas(conexao):
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_REJEITADAS_MIGRACAO} (
+        arquivo VARCHAR,
+        linha BIGINT,
+        coluna VARCHAR,
+        tipo_erro VARCHAR,
+        conteudo_linha VARCHAR,
+        mensagem VARCHAR,
+        migrado_em TIMESTAMP
+    );
+    """)
 
-    if result:
-        print(f"A tabela '{TABLE_NAME}' já existe. Deseja recriá-la? (Isso apagará os dados existentes)")
-        user_choice = input("Digite 'sim' para recriar, ou qualquer outra coisa para pular a ingestão: ").strip().lower()
-        if user_choice == 'sim':
-            print(f"Apagando tabela '{TABLE_NAME}' existente...")
-            con.execute(f"DROP TABLE IF EXISTS {TABLE_NAME};")
-        else:
-            print(f"Ingestão pulada pois a tabela '{TABLE_NAME}' já existe e não foi solicitado recriar.")
-            con.close()
-            return
+def migrar_csv(conexao, caminho_csv=CSV_FILE_PATH, tabela=TABLE_NAME, substituir=False, encoding='utf-8', registros=None):
+    """
+    Cria `tabela` com o schema declarado e a carrega com o conteúdo do CSV em uma única
+    gravação (colunas do CSV fora do schema entram como VARCHAR; as do schema que faltarem no
+    CSV ficam nulas). Os tipos ENUM das colunas de TIPOS_ENUM são criados antes da carga, com
+    os valores distintos lidos do CSV, e o leitor já converte essas colunas. Tudo em uma transação.
+    Se a tabela já existe e substituir=False, nada é feito e a função retorna None.
+    Retorna {'linhas': carregadas, 'linhas_rejeitadas': linhas do CSV rejeitadas}.
+    """
+    registros = [] if registros is None else registros
+    caminho_csv = Path(caminho_csv)
+    existe = conexao.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [tabela]).fetchone()[0] > 0
+    if existe and not substituir:
+        print(f"A tabela '{tabela}' já existe. Ingestão pulada (use --substituir para recriá-la).")
+        return None
 
-    print(f"Iniciando a ingestão do arquivo CSV: {CSV_FILE_PATH} para a tabela '{TABLE_NAME}'...")
+    colunas_csv = _colunas_cabecalho(caminho_csv, encoding)
+    extras = [c for c in colunas_csv if c not in SCHEMA_PRESCRICOES]
+    ausentes = [c for c in SCHEMA_PRESCRICOES if c not in colunas_csv]
+    if extras:
+        print(f"Aviso: colunas fora do schema (carregadas como VARCHAR): {', '.join(extras)}")
+    if ausentes:
+        print(f"Aviso: colunas do schema ausentes no CSV (ficarão nulas): {', '.join(ausentes)}")
+    tipos = {**SCHEMA_PRESCRICOES, **{c: 'VARCHAR' for c in extras}}
+    colunas_enum = {c: tipo for c, tipo in TIPOS_ENUM.items() if c in colunas_csv}
+    tipos.update(colunas_enum)
+    colunas_tabela = ", ".join(f'"{c}" {tipo}' for c, tipo in tipos.items())
+    colunas_leitura = ", ".join(f"'{c}': '{tipos[c]}'" for c in colunas_csv)
+    arquivo = caminho_csv.resolve().as_posix().replace("'", "''")
+    opcoes_leitura = f"header = true, delim = ',', quote = '\"', encoding = '{encoding}', parallel = true"
+
+    _garantir_tabela_rejeitadas(conexao)
+    conexao.execute("BEGIN TRANSACTION;")
     try:
-        # DuckDB é muito eficiente para ler CSVs diretamente.
-        # Ele tentará inferir os tipos de dados automaticamente (read_csv_auto).
-        # Se precisar de controle mais fino sobre os tipos, pode usar dtypes na query.
-        # Ex: read_csv_auto('{CSV_FILE_PATH}', dtypes={'coluna1': 'VARCHAR', 'coluna2': 'INTEGER'})
-        # Ou definir a tabela primeiro e depois inserir.
-        
-        # Opção 1: Deixar o DuckDB inferir tudo e criar a tabela
-        con.execute(f"""
-            CREATE TABLE {TABLE_NAME} AS 
-            SELECT * FROM read_csv_auto('{str(CSV_FILE_PATH)}', header=True, sample_size=-1);
-        """)
-        # sample_size=-1 para usar todo o arquivo para inferência de tipo (pode ser mais lento, mas mais preciso)
-        # ou um valor positivo como 204800 para amostrar N linhas.
-        
-        print(f"Dados ingeridos com sucesso na tabela '{TABLE_NAME}'.")
-        
-        total_rows = con.execute(f"SELECT COUNT(*) FROM {TABLE_NAME};").fetchone()[0]
-        print(f"Total de linhas na tabela '{TABLE_NAME}': {total_rows:,}")
+        conexao.execute(f"DROP TABLE IF EXISTS {_REJEITOS_TMP}; DROP TABLE IF EXISTS {_VARREDURAS_TMP};")
+        with medir_etapa(conexao, registros, 'migracao_csv', tabelas_saida=[tabela],
+                         bytes_entrada=caminho_csv.stat().st_size, arquivo=str(caminho_csv)) as metricas:
+            # A tabela antiga sai antes: um ENUM usado por uma coluna não pode ser recriado
+            conexao.execute(f"DROP TABLE IF EXISTS {tabela};")
+            if colunas_enum:
+                # Domínios dos ENUMs: uma leitura só das colunas ENUM, como texto (nada é rejeitado aqui)
+                colunas_texto = ", ".join(f"'{c}': 'VARCHAR'" for c in colunas_csv)
+                distintos = conexao.execute(f"""
+                    SELECT {", ".join(f'list(DISTINCT "{c}" ORDER BY "{c}")' for c in colunas_enum)}
+                    FROM read_csv('{arquivo}', {opcoes_leitura}, columns = {{{colunas_texto}}}, ignore_errors = true);
+                """).fetchone()
+                for (coluna, tipo), valores in zip(colunas_enum.items(), distintos):
+                    garantir_tipo_enum(conexao, tipo, VALORES_FIXOS_ENUM.get(coluna, []) + valores)
+            conexao.execute(f"CREATE TABLE {tabela} ({colunas_tabela});")
+            conexao.execute(f"""
+                INSERT INTO {tabela} BY NAME
+                SELECT * FROM read_csv('{arquivo}', {opcoes_leitura}, columns = {{{colunas_leitura}}},
+                    store_rejects = true, rejects_table = '{_REJEITOS_TMP}', rejects_scan = '{_VARREDURAS_TMP}');
+            """)
 
-        print("Inspecionando o esquema da tabela criada:")
-        schema = con.execute(f"DESCRIBE {TABLE_NAME};").fetchall()
-        for col_name, col_type, _, _, _, _ in schema:
-            print(f"- Coluna: {col_name}, Tipo Inferido: {col_type}")
+            # Os rejeitos do leitor ficam em tabelas temporárias; a cópia persistente substitui a do mesmo arquivo
+            conexao.execute(f"DELETE FROM {TABLE_REJEITADAS_MIGRACAO} WHERE arquivo = ?", [str(caminho_csv)])
+            conexao.execute(f"""
+                INSERT INTO {TABLE_REJEITADAS_MIGRACAO}
+                SELECT ?, e.line, e.column_name, CAST(e.error_type AS VARCHAR), e.csv_line, e.error_message, current_timestamp
+                FROM {_REJEITOS_TMP} e
+                ORDER BY e.line, e.column_idx;
+            """, [str(caminho_csv)])
+            linhas = conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+            rejeitadas = conexao.execute(f"SELECT COUNT(DISTINCT linha) FROM {TABLE_REJEITADAS_MIGRACAO} WHERE arquivo = ?", [str(caminho_csv)]).fetchone()[0]
+            metricas['linhas_rejeitadas'] = rejeitadas
+        conexao.execute(f"DROP TABLE IF EXISTS {_REJEITOS_TMP}; DROP TABLE IF EXISTS {_VARREDURAS_TMP};")
+        conexao.execute("COMMIT;")
+    except Exception:
+        conexao.execute("ROLLBACK;")
+        raise
+    conexao.execute(f"ANALYZE {tabela};")
 
-        # --- Criar Índices (CRUCIAL para performance de consulta) ---
-        # Ajuste os nomes das colunas conforme o seu CSV.
-        # Estes são exemplos baseados nas colunas que temos discutido.
-        colunas_para_indexar = [
-            'ano', 
-            'nome_municipio', 
-            'principio_ativo', 
-            'data', # Se a coluna 'data' for usada em filtros de range
-            'faixa_etaria',
-            'sexo' 
-            # Adicione outras colunas frequentemente usadas em cláusulas WHERE ou JOINs
-        ]
-        
-        print("\nCriando índices...")
-        for coluna in colunas_para_indexar:
-            # Verifica se a coluna existe antes de tentar criar o índice
-            # (DESCRIBE não é padrão SQL para checar coluna, PRAGMA table_info é mais SQLite)
-            # DuckDB não falha ao criar índice em coluna inexistente, mas é bom verificar logicamente.
-            # Para DuckDB, podemos checar na lista de colunas do schema.
-            if any(col_name == coluna for col_name, _, _, _, _, _ in schema):
-                print(f"Criando índice na coluna '{coluna}'...")
-                try:
-                    con.execute(f"CREATE INDEX idx_{coluna} ON {TABLE_NAME} ({coluna});")
-                    print(f"Índice 'idx_{coluna}' criado com sucesso.")
-                except Exception as e_index:
-                    print(f"Falha ao criar índice em '{coluna}': {e_index}")
-            else:
-                print(f"Coluna '{coluna}' não encontrada no schema, pulando criação de índice.")
-        
-        print("\nOtimização do banco de dados (VACUUM e ANALYZE)...")
-        con.execute("VACUUM;") # Opcional, mas pode ajudar a reorganizar o armazenamento
-        con.execute(f"ANALYZE {TABLE_NAME};") # Coleta estatísticas para o otimizador de consultas
+    print(f"-> {linhas:,} linhas carregadas em '{tabela}'.")
+    if rejeitadas:
+        print(f"-> {rejeitadas:,} linha(s) rejeitada(s); detalhes em '{TABLE_REJEITADAS_MIGRACAO}'.")
+    return {'linhas': linhas, 'linhas_rejeitadas': rejeitadas}
 
+def executar_migracao(caminho_csv=CSV_FILE_PATH, caminho_banco=DUCKDB_FILE_PATH, tabela=TABLE_NAME, substituir=False,
+                      encoding='utf-8', perfil_recursos=None, relatorio_dir=RELATORIO_DIR_PADRAO):
+    """Abre a conexão de ETL, migra o CSV e grava a instrumentação. Retorna True em caso de sucesso."""
+    print(f"--- MIGRANDO {caminho_csv} PARA '{tabela}' EM {caminho_banco} ---")
+    if not Path(caminho_csv).exists():
+        print(f"ERRO: arquivo não encontrado: {caminho_csv}")
+        return False
+    conexao = get_db_connection_for_etl(perfil_recursos, caminho=caminho_banco)
+    if conexao is None:
+        return False
+    registros_instrumentacao = []
+    try:
+        migrar_csv(conexao, caminho_csv, tabela, substituir, encoding, registros_instrumentacao)
+        return True
     except Exception as e:
-        print(f"Ocorreu um erro durante a ingestão: {e}")
+        print(f"ERRO durante a migração (a tabela não foi alterada): {e}")
+        return False
     finally:
-        print("Fechando conexão com o banco de dados.")
-        con.close()
+        conexao.close()
+        print("Conexão com DuckDB fechada.")
+        if registros_instrumentacao and relatorio_dir is not None:
+            salvar_relatorio(registros_instrumentacao, "migracao", relatorio_dir)
 
 if __name__ == "__main__":
-    create_duckdb_database()
-    print("\nScript de ingestão concluído.")
-    print(f"Seu banco de dados DuckDB deve estar em: {DUCKDB_FILE_PATH}")
-    print("Lembre-se de adicionar este arquivo .duckdb ao seu .gitignore se estiver usando Git.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carrega um CSV processado de prescrições no DuckDB com o schema da tabela final.")
+    parser.add_argument('--csv', default=str(CSV_FILE_PATH), help="CSV a migrar.")
+    parser.add_argument('--banco', default=str(DUCKDB_FILE_PATH), help="Arquivo .duckdb de destino.")
+    parser.add_argument('--tabela', default=TABLE_NAME, help="Tabela de destino.")
+    parser.add_argument('--substituir', action='store_true', help="Recria a tabela se ela já existir (sem isso, a migração é pulada).")
+    parser.add_argument('--encoding', default='utf-8', help="Codificação do CSV (ex.: latin-1).")
+    parser.add_argument('--perfil-recursos', choices=list(PERFIS_RECURSOS_ETL), default=None, help="Perfil de memória/threads do DuckDB.")
+    parser.add_argument('--relatorio-dir', default=RELATORIO_DIR_PADRAO, help="Pasta dos relatórios de instrumentação.")
+    args = parser.parse_args()
+    sys.exit(0 if executar_migracao(args.csv, args.banco, args.tabela, args.substituir, args.encoding,
+                                    args.perfil_recursos, args.relatorio_dir) else 1)
@@ -1,25 +1,37 @@
-# Script para web scraping e extração de dados de substâncias controladas da ANVISA
-import requests
+# Script para web scraping e extração de dados de substâncias controladas da ANVISA.
+# As normas são baixadas em paralelo (com limite de requisições simultâneas) e guardadas em
+# cache HTTP em disco; com --replay o script roda offline sobre as páginas já salvas.
+import argparse
+import sys
+from pathlib import Path
+
 from bs4 import BeautifulSoup
 import pandas as pd
 import re
-import time
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.utils.http_cache_utils import buscar_varios_html, CACHE_HTTP_DIR, MAX_REQUISICOES_SIMULTANEAS
+
+URL_P344_1998 = "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000344&sgl_tipo=POR&sgl_orgao=SVS/MS&vlr_ano=1998&seq_ato=000&cod_modulo=134&cod_menu=1696"
+MES_ANO_P344 = "05/1998"
+
+RDCS_INFO = [
+    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000337&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "01/2020", "nome": "RDC 337/2020"},
+    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000345&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "03/2020", "nome": "RDC 345/2020"},
+    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000368&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "04/2020", "nome": "RDC 368/2020"},
+    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000404&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "07/2020", "nome": "RDC 404/2020"},
+]
+
+URL_RDC20_2011 = "https://bvsms.saude.gov.br/bvs/saudelegis/anvisa/2011/rdc0020_11_05_2011.html"
+MES_ANO_RDC20 = "05/2011"
+ARQUIVO_SAIDA_PADRAO = 'mapeamento_lista_anvisa.csv'
 
 # --- Funções Auxiliares ---
-def get_soup(url):
-    """Busca e parseia o conteúdo HTML de uma URL."""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding if response.apparent_encoding else 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
-        return soup
-    except requests.exceptions.RequestException as e:
-        print(f"Erro ao buscar URL {url}: {e}")
-        return None
+def soup_de_html(html):
+    """Parseia o HTML (já baixado ou vindo do cache) de uma norma."""
+    return BeautifulSoup(html, 'html.parser') if html else None
 
 def extract_text_from_anvisa_page(soup):
     """Extrai o texto principal de uma página do anvisalegis."""
@@ -75,135 +87,134 @@ def parse_substances_from_text(text, current_list_name, action_type, mes_ano_eve
         substances.append(record)
     return substances
 
-# --- Processamento Principal ---
-medicamentos_controlados = []
-
-# 1. Processar Portaria SVS/MS nº 344/1998 (Texto Original)
-print("Processando Portaria SVS/MS nº 344/1998...")
-url_p344_1998 = "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000344&sgl_tipo=POR&sgl_orgao=SVS/MS&vlr_ano=1998&seq_ato=000&cod_modulo=134&cod_menu=1696"
-soup_p344 = get_soup(url_p344_1998)
-time.sleep(2)
+def _chave_mes_ano(mes_ano):
+    """'MM/AAAA' -> (ano, mes), para comparar datas de inclusão/exclusão."""
+    mes, ano = map(int, mes_ano.split('/'))
+    return ano, mes
 
-if soup_p344:
+class IndiceListas:
+    """
+    Registros de inclusão/exclusão indexados por (principio_ativo, lista). Inclusões,
+    exclusões e a verificação de existência consultam só os registros da mesma chave,
+    em vez de percorrer a lista inteira; registros() devolve tudo na ordem de inserção.
+    """
+    def __init__(self):
+        self._registros = []
+        self._por_chave = {}
+
+    def __len__(self):
+        return len(self._registros)
+
+    def registros(self):
+        return self._registros
+
+    def contem(self, principio_ativo, lista):
+        return (principio_ativo, lista) in self._por_chave
+
+    def incluir(self, registro):
+        self._registros.append(registro)
+        self._por_chave.setdefault((registro['principio_ativo'], registro['lista']), []).append(registro)
+
+    def excluir(self, principio_ativo, lista, mes_ano, nome_norma):
+        """
+        Marca a exclusão no primeiro registro ativo da chave incluído até `mes_ano`. Se não
+        houver, registra a exclusão isolada (inclusão anterior não capturada).
+        """
+        for med_existente in self._por_chave.get((principio_ativo, lista), []):
+            if med_existente['mes_ano_exclusao'] is not None or not med_existente['mes_ano_inclusao']:
+                continue
+            try:
+                if _chave_mes_ano(mes_ano) < _chave_mes_ano(med_existente['mes_ano_inclusao']):
+                    continue
+            except ValueError:
+                print(f"    Aviso: Formato de data inválido ao comparar inclusão/exclusão para {principio_ativo}")
+            med_existente['mes_ano_exclusao'] = mes_ano
+            return True
+        print(f"    Aviso: Substância {principio_ativo} (Lista {lista}) marcada para exclusão pela {nome_norma}, mas não encontrada ativa ou já excluída.")
+        self.incluir({'principio_ativo': principio_ativo, 'lista': lista, 'mes_ano_inclusao': None, 'mes_ano_exclusao': mes_ano})
+        return False
+
+# --- Processamento das normas ---
+def processar_p344(soup_p344, indice):
+    """1. Portaria SVS/MS nº 344/1998 (texto original): inclusões do Anexo I por lista."""
+    print("Processando Portaria SVS/MS nº 344/1998...")
+    if not soup_p344:
+        return
     text_p344 = extract_text_from_anvisa_page(soup_p344)
-    mes_ano_p344 = "05/1998"
 
     anexo_i_match = re.search(r'ANEXO I\s*\n\s*LISTAS DE SUBSTÂNCIAS.*?SUBMETIDAS A CONTROLE ESPECIAL(.*?)(?:ANEXO II|ANEXO III|\Z)', text_p344, re.IGNORECASE | re.DOTALL)
-
-    if anexo_i_match:
-        anexo_i_text = anexo_i_match.group(1)
-        list_patterns = {
-            'A1': r'LISTA\s*["\']A1["\']\s*LISTA DAS SUBSTÂNCIAS ENTORPECENTES(.*?)(?=LISTA\s*["\']A2["\']|LISTA\s*["\']B1["\']|\Z)',
-            'A2': r'LISTA\s*["\']A2["\']\s*LISTA DAS SUBSTÂNCIAS ENTORPECENTES DE USO PERMITIDO SOMENTE EM CONCENTRAÇÕES ESPECIAIS(.*?)(?=LISTA\s*["\']A3["\']|LISTA\s*["\']B1["\']|\Z)',
-            'A3': r'LISTA\s*["\']A3["\']\s*LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS(.*?)(?=LISTA\s*["\']B1["\']|\Z)',
-            'B1': r'LISTA\s*["\']B1["\']\s*LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS(.*?)(?=LISTA\s*["\']B2["\']|\Z)',
-            'B2': r'LISTA\s*["\']B2["\']\s*LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS ANOREXÍGENAS(.*?)(?=LISTA\s*["\']C1["\']|\Z)',
-            'C1': r'LISTA\s*["\']C1["\']\s*LISTA DAS OUTRAS SUBSTÂNCIAS SUJEITAS A CONTROLE ESPECIAL(.*?)(?=LISTA\s*["\']C2["\']|\Z)',
-            'C2': r'LISTA\s*["\']C2["\']\s*LISTA DE SUBSTÂNCIAS RETINÓICAS(.*?)(?=LISTA\s*["\']C3["\']|\Z)',
-            'C3': r'LISTA\s*["\']C3["\']\s*LISTA DE SUBSTÂNCIAS IMUNOSSUPRESSORAS(.*?)(?=LISTA\s*["\']C4["\']|LISTA\s*["\']C5["\']|LISTA\s*["\']D1["\']|\Z)',
-            'C5': r'LISTA\s*["\']C5["\']\s*LISTA DAS SUBSTÂNCIAS ANABOLIZANTES(.*?)(?=LISTA\s*["\']D1["\']|ADENDO|\Z)',
-        }
-
-        for lista_nome, pattern in list_patterns.items():
-            match = re.search(pattern, anexo_i_text, re.IGNORECASE | re.DOTALL)
-            if match:
-                print(f"  Encontrada {lista_nome} na P344/98.")
-                substances_text = match.group(1)
-                # Corrigido para 'INCLUSÃO'
-                parsed_substances = parse_substances_from_text(substances_text, lista_nome, 'INCLUSÃO', mes_ano_p344)
-                medicamentos_controlados.extend(parsed_substances)
-            else:
-                print(f"  {lista_nome} não encontrada no formato esperado na P344/98.")
-        if any(p['principio_ativo'] == 'TALIDOMIDA' for p in medicamentos_controlados if p['lista'] == 'C3'):
-             print("   TALIDOMIDA (C3) processada.")
+    if not anexo_i_match:
+        return
+    anexo_i_text = anexo_i_match.group(1)
+    list_patterns = {
+        'A1': r'LISTA\s*["\']A1["\']\s*LISTA DAS SUBSTÂNCIAS ENTORPECENTES(.*?)(?=LISTA\s*["\']A2["\']|LISTA\s*["\']B1["\']|\Z)',
+        'A2': r'LISTA\s*["\']A2["\']\s*LISTA DAS SUBSTÂNCIAS ENTORPECENTES DE USO PERMITIDO SOMENTE EM CONCENTRAÇÕES ESPECIAIS(.*?)(?=LISTA\s*["\']A3["\']|LISTA\s*["\']B1["\']|\Z)',
+        'A3': r'LISTA\s*["\']A3["\']\s*LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS(.*?)(?=LISTA\s*["\']B1["\']|\Z)',
+        'B1': r'LISTA\s*["\']B1["\']\s*LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS(.*?)(?=LISTA\s*["\']B2["\']|\Z)',
+        'B2': r'LISTA\s*["\']B2["\']\s*LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS ANOREXÍGENAS(.*?)(?=LISTA\s*["\']C1["\']|\Z)',
+        'C1': r'LISTA\s*["\']C1["\']\s*LISTA DAS OUTRAS SUBSTÂNCIAS SUJEITAS A CONTROLE ESPECIAL(.*?)(?=LISTA\s*["\']C2["\']|\Z)',
+        'C2': r'LISTA\s*["\']C2["\']\s*LISTA DE SUBSTÂNCIAS RETINÓICAS(.*?)(?=LISTA\s*["\']C3["\']|\Z)',
+        'C3': r'LISTA\s*["\']C3["\']\s*LISTA DE SUBSTÂNCIAS IMUNOSSUPRESSORAS(.*?)(?=LISTA\s*["\']C4["\']|LISTA\s*["\']C5["\']|LISTA\s*["\']D1["\']|\Z)',
+        'C5': r'LISTA\s*["\']C5["\']\s*LISTA DAS SUBSTÂNCIAS ANABOLIZANTES(.*?)(?=LISTA\s*["\']D1["\']|ADENDO|\Z)',
+    }
+
+    for lista_nome, pattern in list_patterns.items():
+        match = re.search(pattern, anexo_i_text, re.IGNORECASE | re.DOTALL)
+        if match:
+            print(f"  Encontrada {lista_nome} na P344/98.")
+            for registro in parse_substances_from_text(match.group(1), lista_nome, 'INCLUSÃO', MES_ANO_P344):
+                indice.incluir(registro)
         else:
-            if "TALIDOMIDA" in anexo_i_text.upper() and "LISTA \"C3\"" in anexo_i_text:
-                print("   Adicionando TALIDOMIDA (C3) manualmente com base na P344/98.")
-                medicamentos_controlados.append({'principio_ativo': 'TALIDOMIDA', 'lista': 'C3', 'mes_ano_inclusao': mes_ano_p344, 'mes_ano_exclusao': None})
-
-# Corrigido nome da variável de dcs_info para rdcs_info
-rdcs_info = [
-    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000337&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "01/2020", "nome": "RDC 337/2020"},
-    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000345&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "03/2020", "nome": "RDC 345/2020"},
-    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000368&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "04/2020", "nome": "RDC 368/2020"},
-    {"url": "https://anvisalegis.datalegis.net/action/UrlPublicasAction.php?acao=abrirAtoPublico&num_ato=00000404&sgl_tipo=RDC&sgl_orgao=RDC/DC/ANVISA/MS&vlr_ano=2020&seq_ato=000&cod_modulo=310&cod_menu=8542", "mes_ano": "07/2020", "nome": "RDC 404/2020"},
-]
-
-for rdc in rdcs_info: # Agora usa o nome correto da variável
+            print(f"  {lista_nome} não encontrada no formato esperado na P344/98.")
+    if indice.contem('TALIDOMIDA', 'C3'):
+        print("   TALIDOMIDA (C3) processada.")
+    elif "TALIDOMIDA" in anexo_i_text.upper() and "LISTA \"C3\"" in anexo_i_text:
+        print("   Adicionando TALIDOMIDA (C3) manualmente com base na P344/98.")
+        indice.incluir({'principio_ativo': 'TALIDOMIDA', 'lista': 'C3', 'mes_ano_inclusao': MES_ANO_P344, 'mes_ano_exclusao': None})
+
+def processar_rdc(soup_rdc, rdc, indice):
+    """2. RDC de atualização das listas: inclusões e exclusões por lista."""
     print(f"Processando {rdc['nome']} ({rdc['mes_ano']})...")
-    soup_rdc = get_soup(rdc['url'])
-    time.sleep(2)
-
-    if soup_rdc:
-        text_rdc = extract_text_from_anvisa_page(soup_rdc)
-        if not text_rdc:
-            print(f"  Não foi possível extrair texto da {rdc['nome']}.")
-            continue
-
-        alterations = re.finditer(r'(LISTA\s*["\']([A-Z0-9]+)["\'])(.*?)(?=LISTA\s*["\']|Art\.|Parágrafo|\Z)', text_rdc, re.IGNORECASE | re.DOTALL)
-        found_alteration_in_rdc = False
-        for alt_match in alterations:
-            current_list_name_rdc = alt_match.group(2).upper()
-            list_content_text = alt_match.group(3)
-
-            incluir_match = re.search(r'INCLUSÃO:\s*(.*?)(?=EXCLUSÃO:|ADENDO\s*\(ESPECÍFICO\s*PARA\s*A\s*LISTA\)|NOTAS\s*TÉCNICAS|\Z)', list_content_text, re.IGNORECASE | re.DOTALL)
-            if incluir_match:
-                found_alteration_in_rdc = True
-                substances_to_include_text = incluir_match.group(1)
-                # Corrigido para 'INCLUSÃO'
-                novas_substancias = parse_substances_from_text(substances_to_include_text, current_list_name_rdc, 'INCLUSÃO', rdc['mes_ano'])
-                if novas_substancias:
-                    print(f"  {rdc['nome']}: Incluindo {len(novas_substancias)} em {current_list_name_rdc}.")
-                    medicamentos_controlados.extend(novas_substancias)
-
-            excluir_match = re.search(r'EXCLUSÃO:\s*(.*?)(?=INCLUSÃO:|ADENDO\s*\(ESPECÍFICO\s*PARA\s*A\s*LISTA\)|NOTAS\s*TÉCNICAS|\Z)', list_content_text, re.IGNORECASE | re.DOTALL)
-            if excluir_match:
-                found_alteration_in_rdc = True
-                substances_to_exclude_text = excluir_match.group(1)
-                # Corrigido para 'EXCLUSÃO'
-                substancias_excluidas_info = parse_substances_from_text(substances_to_exclude_text, current_list_name_rdc, 'EXCLUSÃO', rdc['mes_ano'])
-
-                if substancias_excluidas_info:
-                    print(f"  {rdc['nome']}: Excluindo {len(substancias_excluidas_info)} de {current_list_name_rdc}.")
-                    for item_excluir in substancias_excluidas_info:
-                        found_to_exclude = False
-                        for med_existente in medicamentos_controlados:
-                            if med_existente['principio_ativo'] == item_excluir['principio_ativo'] and \
-                               med_existente['lista'] == item_excluir['lista'] and \
-                               med_existente['mes_ano_exclusao'] is None:
-                                if med_existente['mes_ano_inclusao'] and rdc['mes_ano']:
-                                    try:
-                                        inc_m, inc_a = map(int, med_existente['mes_ano_inclusao'].split('/'))
-                                        exc_m, exc_a = map(int, rdc['mes_ano'].split('/'))
-                                        if (exc_a, exc_m) >= (inc_a, inc_m):
-                                            med_existente['mes_ano_exclusao'] = rdc['mes_ano']
-                                            found_to_exclude = True
-                                            break
-                                    except ValueError:
-                                        print(f"    Aviso: Formato de data inválido ao comparar inclusão/exclusão para {med_existente['principio_ativo']}")
-                                        med_existente['mes_ano_exclusao'] = rdc['mes_ano']
-                                        found_to_exclude = True
-                                        break
-                        if not found_to_exclude:
-                             print(f"    Aviso: Substância {item_excluir['principio_ativo']} (Lista {item_excluir['lista']}) marcada para exclusão pela {rdc['nome']}, mas não encontrada ativa ou já excluída.")
-                             medicamentos_controlados.append({
-                                 'principio_ativo': item_excluir['principio_ativo'],
-                                 'lista': item_excluir['lista'],
-                                 'mes_ano_inclusao': None,
-                                 'mes_ano_exclusao': rdc['mes_ano']
-                             })
-        if not found_alteration_in_rdc:
-             print(f"  Nenhuma alteração clara de INCLUSÃO/EXCLUSÃO encontrada no formato esperado na {rdc['nome']}.")
-
-# 3. Processar Antimicrobianos (Base: RDC 20/2011)
-print("Processando RDC 20/2011 para Antimicrobianos...")
-url_rdc20_2011 = "https://bvsms.saude.gov.br/bvs/saudelegis/anvisa/2011/rdc0020_11_05_2011.html"
-soup_rdc20 = get_soup(url_rdc20_2011)
-time.sleep(2)
-
-if soup_rdc20:
+    if not soup_rdc:
+        return
+    text_rdc = extract_text_from_anvisa_page(soup_rdc)
+    if not text_rdc:
+        print(f"  Não foi possível extrair texto da {rdc['nome']}.")
+        return
+
+    alterations = re.finditer(r'(LISTA\s*["\']([A-Z0-9]+)["\'])(.*?)(?=LISTA\s*["\']|Art\.|Parágrafo|\Z)', text_rdc, re.IGNORECASE | re.DOTALL)
+    found_alteration_in_rdc = False
+    for alt_match in alterations:
+        current_list_name_rdc = alt_match.group(2).upper()
+        list_content_text = alt_match.group(3)
+
+        incluir_match = re.search(r'INCLUSÃO:\s*(.*?)(?=EXCLUSÃO:|ADENDO\s*\(ESPECÍFICO\s*PARA\s*A\s*LISTA\)|NOTAS\s*TÉCNICAS|\Z)', list_content_text, re.IGNORECASE | re.DOTALL)
+        if incluir_match:
+            found_alteration_in_rdc = True
+            novas_substancias = parse_substances_from_text(incluir_match.group(1), current_list_name_rdc, 'INCLUSÃO', rdc['mes_ano'])
+            if novas_substancias:
+                print(f"  {rdc['nome']}: Incluindo {len(novas_substancias)} em {current_list_name_rdc}.")
+                for registro in novas_substancias:
+                    indice.incluir(registro)
+
+        excluir_match = re.search(r'EXCLUSÃO:\s*(.*?)(?=INCLUSÃO:|ADENDO\s*\(ESPECÍFICO\s*PARA\s*A\s*LISTA\)|NOTAS\s*TÉCNICAS|\Z)', list_content_text, re.IGNORECASE | re.DOTALL)
+        if excluir_match:
+            found_alteration_in_rdc = True
+            substancias_excluidas_info = parse_substances_from_text(excluir_match.group(1), current_list_name_rdc, 'EXCLUSÃO', rdc['mes_ano'])
+            if substancias_excluidas_info:
+                print(f"  {rdc['nome']}: Excluindo {len(substancias_excluidas_info)} de {current_list_name_rdc}.")
+                for item_excluir in substancias_excluidas_info:
+                    indice.excluir(item_excluir['principio_ativo'], item_excluir['lista'], rdc['mes_ano'], rdc['nome'])
+    if not found_alteration_in_rdc:
+        print(f"  Nenhuma alteração clara de INCLUSÃO/EXCLUSÃO encontrada no formato esperado na {rdc['nome']}.")
+
+def processar_antimicrobianos(soup_rdc20, indice):
+    """3. Antimicrobianos (base: RDC 20/2011), Anexos I e II."""
+    print("Processando RDC 20/2011 para Antimicrobianos...")
+    if not soup_rdc20:
+        print("  Não foi possível buscar RDC 20/2011 para antimicrobianos.")
+        return
     text_rdc20 = soup_rdc20.body.get_text(separator='\n', strip=True) if soup_rdc20.body else ""
-    mes_ano_rdc20 = "05/2011"
 
     anexo_i_rdc20_match = re.search(r'ANEXO I\s*\n\s*LISTA DE ANTIMICROBIANOS.*?SUJEITOS AO CONTROLE DA LEI Nº 5\.991/1973(.*?)(?=ANEXO II|\Z)', text_rdc20, re.IGNORECASE | re.DOTALL)
     anexo_ii_rdc20_match = re.search(r'ANEXO II\s*\n\s*LISTA DE ANTIMICROBIANOS DE USO RESTRITO A ESTABELECIMENTOS DE SAÚDE(.*?)(?=\Z)', text_rdc20, re.IGNORECASE | re.DOTALL)
@@ -222,89 +233,108 @@ if soup_rdc20:
         print("  Anexo II da RDC 20/2011 não encontrado no formato esperado.")
 
     for part_text in antimicrobianos_text_parts:
-        lines = part_text.split('\n')
-        for line in lines:
-            principio_ativo = line.strip()
-            principio_ativo = re.sub(r'^\-\s*|^\*\s*', '', principio_ativo).strip()
-            if not principio_ativo or len(principio_ativo) < 3 or principio_ativo.lower().startswith(("lista", "anexo", "observação", "(obs", "item", "substância", "classe terapêutica")): # Adicionado "classe terapêutica"
+        for line in part_text.split('\n'):
+            principio_ativo = re.sub(r'^\-\s*|^\*\s*', '', line.strip()).strip()
+            if not principio_ativo or len(principio_ativo) < 3 or principio_ativo.lower().startswith(("lista", "anexo", "observação", "(obs", "item", "substância", "classe terapêutica")):
                 continue
-            ja_existe = any(m['principio_ativo'] == principio_ativo.upper() and m['lista'] == 'ANTIMICROBIANOS' for m in medicamentos_controlados)
-            if not ja_existe:
-                 medicamentos_controlados.append({
+            if not indice.contem(principio_ativo.upper(), 'ANTIMICROBIANOS'):
+                indice.incluir({
                     'principio_ativo': principio_ativo.upper(),
                     'lista': 'ANTIMICROBIANOS',
-                    'mes_ano_inclusao': mes_ano_rdc20, # Data de inclusão para antimicrobianos
+                    'mes_ano_inclusao': MES_ANO_RDC20, # Data de inclusão para antimicrobianos
                     'mes_ano_exclusao': None
                 })
-    print(f"  Adicionados antimicrobianos da RDC 20/2011. Total agora: {len(medicamentos_controlados)}")
-else:
-    print("  Não foi possível buscar RDC 20/2011 para antimicrobianos.")
+    print(f"  Adicionados antimicrobianos da RDC 20/2011. Total agora: {len(indice)}")
+
+def filtrar_para_csv(medicamentos_controlados):
+    """4. Filtra os registros até 2020 e monta o DataFrame final, ordenado e sem duplicatas."""
+    dados_finais_csv = []
+    for med in medicamentos_controlados:
+        incluir_no_csv = False
+
+        if med.get('mes_ano_inclusao'):
+            try:
+                mes_inc, ano_inc = map(int, med['mes_ano_inclusao'].split('/'))
+                if ano_inc <= 2020:
+                    incluir_no_csv = True
+                else:
+                    continue
+            except (ValueError, AttributeError):
+                if med.get('mes_ano_exclusao'):
+                    incluir_no_csv = True
+                else:
+                    print(f"Aviso: {med['principio_ativo']} (Lista {med['lista']}) com data de inclusão inválida ou ausente: {med.get('mes_ano_inclusao')}. Descartando.")
+                    continue
+        elif med.get('mes_ano_exclusao'): # Se não tem inclusão mas tem exclusão (veio de RDC de exclusão de item não pego na P344)
+            incluir_no_csv = True
+
+        if incluir_no_csv and med.get('mes_ano_exclusao'):
+            try:
+                mes_exc, ano_exc = map(int, med['mes_ano_exclusao'].split('/'))
+                if ano_exc > 2020:
+                    med['mes_ano_exclusao'] = None
+            except (ValueError, AttributeError):
+                print(f"Aviso: {med['principio_ativo']} (Lista {med['lista']}) com data de exclusão inválida: {med.get('mes_ano_exclusao')}. Mantendo como não excluída.")
+                med['mes_ano_exclusao'] = None
+
+        if incluir_no_csv:
+            # Um item sem inclusão mas com exclusão foi excluído por uma RDC e sua inclusão original
+            # (provavelmente pré-2020) não foi capturada; ainda assim a exclusão vai para o CSV.
+            dados_finais_csv.append(med)
 
-print("\nAVISO: O mapeamento para Portaria 344/98 não inclui atualizações entre 06/1998 e 12/2019, exceto as RDCs de 2020 fornecidas.")
-print("AVISO: Para antimicrobianos, a lista é baseada na RDC 20/2011. Atualizações subsequentes até 2020 não foram processadas automaticamente e exigiriam análise de RDCs adicionais.")
+    df = pd.DataFrame(dados_finais_csv, columns=['principio_ativo', 'lista', 'mes_ano_inclusao', 'mes_ano_exclusao'])
+    if not df.empty:
+        df.sort_values(by=['principio_ativo', 'lista', 'mes_ano_inclusao', 'mes_ano_exclusao'], na_position='first', inplace=True) # na_position='first' para Nones em datas virem antes
+        df.drop_duplicates(subset=['principio_ativo', 'lista', 'mes_ano_inclusao', 'mes_ano_exclusao'], keep='first', inplace=True)
+    return df
 
-# 4. Filtrar dados e preparar para CSV
-dados_finais_csv = []
-for med in medicamentos_controlados:
-    incluir_no_csv = False
-    ano_inclusao_val = 9999
-    mes_inclusao_val = 12
+def executar_scraping(modo='rede', pasta_cache=CACHE_HTTP_DIR, max_simultaneas=MAX_REQUISICOES_SIMULTANEAS,
+                      nome_arquivo=ARQUIVO_SAIDA_PADRAO, rdcs=RDCS_INFO):
+    """
+    Baixa todas as normas de uma vez (no máximo `max_simultaneas` em paralelo, revalidando o
+    cache por ETag) e aplica-as em ordem cronológica: P344/98, RDCs e RDC 20/2011.
+    Com modo='replay' as páginas vêm só de `pasta_cache` (fixtures), sem rede.
+    Retorna o DataFrame salvo em `nome_arquivo` (None não salva).
+    """
+    rdcs = sorted(rdcs, key=lambda rdc: _chave_mes_ano(rdc['mes_ano']))
+    urls = [URL_P344_1998] + [rdc['url'] for rdc in rdcs] + [URL_RDC20_2011]
+    print(f"Buscando {len(urls)} normas (modo '{modo}', até {max_simultaneas} em paralelo, cache em {pasta_cache})...")
+    paginas = buscar_varios_html(urls, pasta_cache, modo, max_simultaneas)
 
-    if med.get('mes_ano_inclusao'):
-        try:
-            mes_inc, ano_inc = map(int, med['mes_ano_inclusao'].split('/'))
-            mes_inclusao_val = mes_inc
-            ano_inclusao_val = ano_inc
-            if ano_inc <= 2020:
-                incluir_no_csv = True
-            else:
-                continue
-        except (ValueError, AttributeError):
-            if med['lista'] == 'ANTIMICROBIANOS' and med.get('mes_ano_inclusao') is None:
-                print(f"Aviso: Antimicrobiano {med['principio_ativo']} sem data de inclusão clara, assumindo inclusão válida até 2020.")
-                incluir_no_csv = True
-            elif med.get('mes_ano_exclusao'):
-                 incluir_no_csv = True
-            else:
-                print(f"Aviso: {med['principio_ativo']} (Lista {med['lista']}) com data de inclusão inválida ou ausente: {med.get('mes_ano_inclusao')}. Descartando.")
-                continue
-    elif med.get('mes_ano_exclusao'): # Se não tem inclusão mas tem exclusão (veio de RDC de exclusão de item não pego na P344)
-        incluir_no_csv = True
+    indice = IndiceListas()
+    processar_p344(soup_de_html(paginas[URL_P344_1998]), indice)
+    for rdc in rdcs:
+        processar_rdc(soup_de_html(paginas[rdc['url']]), rdc, indice)
+    processar_antimicrobianos(soup_de_html(paginas[URL_RDC20_2011]), indice)
+
+    print("\nAVISO: O mapeamento para Portaria 344/98 não inclui atualizações entre 06/1998 e 12/2019, exceto as RDCs de 2020 fornecidas.")
+    print("AVISO: Para antimicrobianos, a lista é baseada na RDC 20/2011. Atualizações subsequentes até 2020 não foram processadas automaticamente e exigiriam análise de RDCs adicionais.")
 
+    df = filtrar_para_csv(indice.registros())
 
-    if incluir_no_csv and med.get('mes_ano_exclusao'):
+    # 5. Salvar em CSV
+    if nome_arquivo is not None:
         try:
-            mes_exc, ano_exc = map(int, med['mes_ano_exclusao'].split('/'))
-            if ano_exc > 2020:
-                med['mes_ano_exclusao'] = None
-            # Não precisamos mais da verificação de exclusão antes da inclusão aqui se o registro for mantido
-            # para indicar a exclusão de algo não capturado na base.
-        except (ValueError, AttributeError):
-            print(f"Aviso: {med['principio_ativo']} (Lista {med['lista']}) com data de exclusão inválida: {med.get('mes_ano_exclusao')}. Mantendo como não excluída.")
-            med['mes_ano_exclusao'] = None
-    
-    if incluir_no_csv:
-        # Se mes_ano_inclusao for None mas existe mes_ano_exclusao, significa que é um item
-        # que foi identificado como excluído por uma RDC, mas sua inclusão original
-        # (provavelmente pré-2020 e não nas RDCs de 2020) não foi capturada.
-        # Ainda assim, é válido para o CSV mostrar a exclusão.
-        dados_finais_csv.append(med)
-
-
-# 5. Salvar em CSV
-df = pd.DataFrame(dados_finais_csv)
-if not df.empty:
-    df = df[['principio_ativo', 'lista', 'mes_ano_inclusao', 'mes_ano_exclusao']]
-    df.sort_values(by=['principio_ativo', 'lista', 'mes_ano_inclusao', 'mes_ano_exclusao'], na_position='first', inplace=True) # na_position='first' para Nones em datas virem antes
-    df.drop_duplicates(subset=['principio_ativo', 'lista', 'mes_ano_inclusao', 'mes_ano_exclusao'], keep='first', inplace=True)
-
-nome_arquivo = 'mapeamento_lista_anvisa.csv'
-try:
-    df.to_csv(nome_arquivo, index=False, encoding='utf-8-sig')
-    print(f"\nDados salvos com sucesso em '{nome_arquivo}'")
-    print(f"Total de registros: {len(df)}")
-    if not df.empty:
-        print("\nAmostra dos dados:")
-        print(df.head())
-except Exception as e:
-    print(f"Erro ao salvar o arquivo CSV: {e}")
\ No newline at end of file
+            df.to_csv(nome_arquivo, index=False, encoding='utf-8-sig')
+            print(f"\nDados salvos com sucesso em '{nome_arquivo}'")
+            print(f"Total de registros: {len(df)}")
+            if not df.empty:
+                print("\nAmostra dos dados:")
+                print(df.head())
+        except Exception as e:
+            print(f"Erro ao salvar o arquivo CSV: {e}")
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extrai as listas de substâncias controladas das normas da ANVISA.")
+    parser.add_argument('--replay', nargs='?', const=str(CACHE_HTTP_DIR), default=None, metavar='PASTA',
+                        help="Roda offline sobre as páginas salvas em PASTA (padrão: o cache HTTP), sem acessar a rede.")
+    parser.add_argument('--cache', default=str(CACHE_HTTP_DIR), help="Pasta do cache HTTP.")
+    parser.add_argument('--max-simultaneas', type=int, default=MAX_REQUISICOES_SIMULTANEAS, help="Máximo de requisições em paralelo.")
+    parser.add_argument('--saida', default=ARQUIVO_SAIDA_PADRAO, help="CSV de saída.")
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        executar_scraping('replay', args.replay, args.max_simultaneas, args.saida)
+    else:
+        executar_scraping('rede', args.cache, args.max_simultaneas, args.saida)
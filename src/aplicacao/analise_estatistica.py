@@ -5,19 +5,19 @@ from scipy.stats import f_oneway, kruskal, shapiro
 import streamlit as st
 
 def resumo_estatistico_por_grupo(df, grupo="cluster"):
-    return df.groupby(grupo)["quantidade_vendida"].describe()
+    return df.groupby(grupo, observed=True)["quantidade_vendida"].describe()
 
 def teste_normalidade_shapiro(df, coluna="quantidade_vendida"):
     stat, p = shapiro(df[coluna].dropna())
     return stat, p
 
 def teste_anova(df, grupo="cluster"):
-    grupos = [grupo_df["quantidade_vendida"].dropna() for nome, grupo_df in df.groupby(grupo)]
+    grupos = [grupo_df["quantidade_vendida"].dropna() for nome, grupo_df in df.groupby(grupo, observed=True)]
     stat, p = f_oneway(*grupos)
     return stat, p
 
 def teste_kruskal(df, grupo="cluster"):
-    grupos = [grupo_df["quantidade_vendida"].dropna() for nome, grupo_df in df.groupby(grupo)]
+    grupos = [grupo_df["quantidade_vendida"].dropna() for nome, grupo_df in df.groupby(grupo, observed=True)]
     stat, p = kruskal(*grupos)
     return stat, p
 
@@ -1,46 +1,35 @@
 # src/infra/repositorio_dados.py
 import pandas as pd
 from pathlib import Path
-import duckdb # Adicionar import
 
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-DUCKDB_FILE_PATH = BASE_DIR / "dados" / "sngpc_analytics.duckdb" # Caminho para o arquivo DuckDB
-TABLE_NAME = "prescricoes" # Nome da tabela que você usou no script de ingestão
+from src.utils.database_utils import FONTE_PRESCRICOES, TABLE_NAME, caminho_banco_publicado, obter_cursor
 
 def carregar_dados_processados_sngpc(): # Nome da função mantido para compatibilidade
     """
     Carrega os dados processados (anos 2019 e 2020) do banco de dados DuckDB.
+    Lê a versão publicada pelo ETL (caminho_banco_publicado), nunca o arquivo de trabalho que
+    uma execução em andamento pode estar gravando, por um cursor do pool do dashboard (que
+    também cobre o modo Parquet, SNGPC_FONTE_PRESCRICOES=parquet).
     """
-    if not DUCKDB_FILE_PATH.exists():
-        # Este erro deve idealmente ser uma exceção mais específica ou tratada de forma mais robusta.
-        # Para agora, vamos levantar um FileNotFoundError para ser pego no app.py
+    caminho = caminho_banco_publicado()
+    if FONTE_PRESCRICOES != "parquet" and not Path(caminho).exists():
+        # Para ser pego no app.py
         raise FileNotFoundError(
-            f"Arquivo de banco de dados DuckDB não encontrado em {DUCKDB_FILE_PATH}. "
-            "Execute o script de ingestão (ex: ingest_to_duckdb.py) primeiro."
+            f"Arquivo de banco de dados DuckDB não encontrado em {caminho}. "
+            "Execute o ETL (scripts/etl.py) primeiro."
         )
 
-    print(f"Conectando ao DuckDB em: {DUCKDB_FILE_PATH}")
-    con = None # Inicializa con para garantir que exista no bloco finally
+    print(f"Lendo '{TABLE_NAME}' de: {caminho}")
     try:
-        con = duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=True) # Abrir em modo read-only para consultas
-        
-        # A filtragem por ano agora é feita diretamente na consulta SQL!
+        # A filtragem por ano é feita diretamente na consulta SQL
         query = f"SELECT * FROM {TABLE_NAME} WHERE ano IN (2019, 2020);"
-        
         print(f"Executando consulta: {query}")
-        # df = con.execute(query).fetchdf() # fetchdf() retorna um DataFrame pandas
-        
-        # Para datasets muito grandes, mesmo após o filtro WHERE,
-        # se o resultado ainda for massivo para a memória do Pandas,
-        # pode-se considerar processamento em chunks ou consultas mais agregadas.
-        # Mas para 2 anos de dados (se o total é 21M para vários anos), isso já deve ser bem menor.
-        
-        # Usar .arrow() e depois .to_pandas() pode ser mais eficiente para conversão
-        arrow_table = con.execute(query).fetch_arrow_table()
-        df = arrow_table.to_pandas()
-        
+        # Fora do cache de consultas: o resultado é grande e já fica na sessão (st.session_state)
+        with obter_cursor() as cursor:
+            df = cursor.execute(query).fetchdf()
+
         print(f"Dados carregados do DuckDB e convertidos para DataFrame pandas: {len(df):,} linhas.")
-        
+
         if df.empty:
             # Isso pode acontecer se a tabela não tiver dados para 2019 e 2020.
             print(f"Atenção: Nenhum dado retornado do DuckDB para os anos 2019 e 2020 da tabela '{TABLE_NAME}'.")
@@ -50,11 +39,7 @@ def carregar_dados_processados_sngpc(): # Nome da função mantido para compatib
     except Exception as e:
         print(f"Erro ao carregar dados do DuckDB: {e}")
         # Re-levantar a exceção para que app.py possa tratá-la ou mostrar um erro mais genérico.
-        raise 
-    finally:
-        if con:
-            print("Fechando conexão com DuckDB.")
-            con.close()
+        raise
 
 # A função carregar_dados_brutos_sngpc() pode ser mantida se você ainda a usa para algo,
 # ou removida se não for mais necessária.
@@ -0,0 +1,134 @@
+# src/utils/agregados_utils.py
+# Cubo pré-agregado de 'prescricoes' (TABLE_AGREGADO) no grão ano, mes, nome_municipio,
+# principio_ativo, faixa_etaria e sexo, com a contagem de registros, a soma da quantidade
+# vendida e o histograma de idades de cada grupo. O ETL o materializa logo após a tabela final;
+# as consultas do dashboard montadas com build_where_clause são desviadas para ele sempre que
+# as dimensões e medidas pedidas cabem no cubo (dezenas de milhares de linhas em vez de milhões).
+from string import Formatter
+
+import numpy as np
+
+from .database_utils import TABLE_NAME, TABLE_AGREGADO, build_where_clause
+
+# 'data' é sempre o primeiro dia do mês (ano, mes), então não aumenta o número de grupos
+DIMENSOES_AGREGADO = ('ano', 'mes', 'data', 'nome_municipio', 'principio_ativo', 'faixa_etaria', 'sexo')
+# Medida -> (expressão sobre a tabela detalhada, expressão equivalente sobre o cubo)
+MEDIDAS = {
+    'registros': ("COUNT(*)", "COALESCE(CAST(SUM(total_registros) AS BIGINT), 0)"),
+    'quantidade': ("SUM(quantidade_vendida)", "SUM(soma_quantidade)"),
+}
+
+def _consulta_materializacao(filtro_periodo=""):
+    dimensoes = ", ".join(DIMENSOES_AGREGADO)
+    return f"""
+        SELECT {dimensoes},
+               COUNT(*) AS total_registros,
+               SUM(quantidade_vendida) AS soma_quantidade,
+               histogram(idade) AS contagem_idades
+        FROM {TABLE_NAME}
+        WHERE TRUE{filtro_periodo}
+        GROUP BY {dimensoes}
+        ORDER BY ano, mes, nome_municipio, principio_ativo
+    """
+
+def materializar_agregado(conexao, filtro_periodo=""):
+    """
+    Grava TABLE_AGREGADO a partir de 'prescricoes'. Sem filtro o cubo é recriado; com o filtro
+    de período da carga incremental só os meses afetados são substituídos, em uma transação.
+    Retorna o número de linhas do cubo.
+    """
+    existe = conexao.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [TABLE_AGREGADO]).fetchone()[0] > 0
+    if filtro_periodo and existe:
+        conexao.execute("BEGIN TRANSACTION;")
+        try:
+            conexao.execute(f"DELETE FROM {TABLE_AGREGADO} WHERE TRUE{filtro_periodo};")
+            conexao.execute(f"INSERT INTO {TABLE_AGREGADO} BY NAME {_consulta_materializacao(filtro_periodo)};")
+            conexao.execute("COMMIT;")
+        except Exception:
+            conexao.execute("ROLLBACK;")
+            raise
+    else:
+        conexao.execute(f"CREATE OR REPLACE TABLE {TABLE_AGREGADO} AS {_consulta_materializacao()};")
+    return conexao.execute(f"SELECT COUNT(*) FROM {TABLE_AGREGADO}").fetchone()[0]
+
+def agregado_disponivel(conexao):
+    """True se a conexão enxerga o cubo (bancos gerados antes dele, ou só o Parquet, não o têm)."""
+    return conexao.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [TABLE_AGREGADO]).fetchone()[0] > 0
+
+def consulta_roteada(conexao, modelo, filtros, dimensoes=(), exclude_filters=None, tabela=TABLE_NAME, agregado=None):
+    """
+    Monta uma consulta do dashboard a partir de `modelo`, um SQL com os campos {tabela},
+    {where} (saída de build_where_clause) e as medidas de MEDIDAS ({registros}, {quantidade}).
+    `dimensoes` lista as colunas usadas fora das medidas (agrupamento, condições extras). Se
+    todas pertencem a DIMENSOES_AGREGADO, `tabela` é 'prescricoes' e o cubo existe, a consulta
+    lê TABLE_AGREGADO; senão lê `tabela`. Os filtros de build_where_clause são todos dimensões do cubo.
+    `agregado` é a existência do cubo, se já conhecida (agregado_disponivel); com ela a consulta é
+    montada sem ir ao banco e `conexao` pode ser None. Retorna (sql, params, tabela usada).
+    """
+    campos = {nome for _, nome, _, _ in Formatter().parse(modelo) if nome}
+    desconhecidos = campos - {'tabela', 'where'} - set(MEDIDAS)
+    if desconhecidos:
+        raise KeyError(f"Medida(s) sem definição em MEDIDAS: {', '.join(sorted(desconhecidos))}")
+    where_clause, params = build_where_clause(filtros, exclude_filters)
+    usar_agregado = (tabela == TABLE_NAME and set(dimensoes) <= set(DIMENSOES_AGREGADO)
+                     and (agregado if agregado is not None else agregado_disponivel(conexao)))
+    tabela = TABLE_AGREGADO if usar_agregado else tabela
+    medidas = {nome: expressoes[1 if usar_agregado else 0] for nome, expressoes in MEDIDAS.items()}
+    return modelo.format(tabela=tabela, where=where_clause, **medidas), params, tabela
+
+def consulta_contagem_por_idade(conexao, filtros, tabela=TABLE_NAME, agregado=None):
+    """
+    Consulta (sql, params) do número de prescrições por idade (colunas idade, contagem) com os
+    filtros do dashboard, somando os histogramas do cubo quando ele existe. Base do histograma
+    e das estatísticas de idade. `agregado` como em consulta_roteada.
+    """
+    where_clause, params = build_where_clause(filtros)
+    if tabela == TABLE_NAME and (agregado if agregado is not None else agregado_disponivel(conexao)):
+        query = f"""
+            SELECT e.key AS idade, CAST(SUM(e.value) AS BIGINT) AS contagem
+            FROM (SELECT unnest(map_entries(contagem_idades)) AS e FROM {TABLE_AGREGADO} {where_clause})
+            GROUP BY 1 ORDER BY 1;
+        """
+    else:
+        query = f"SELECT idade, COUNT(*) AS contagem FROM {tabela} {where_clause} AND idade IS NOT NULL GROUP BY 1 ORDER BY 1;"
+    return query, params
+
+def estatisticas_idade(df_idades):
+    """(média, mediana) a partir da contagem por idade; a mediana segue o MEDIAN do DuckDB (média dos dois centrais)."""
+    contagens = df_idades['contagem'].to_numpy()
+    total = int(contagens.sum())
+    if total == 0:
+        return None, None
+    idades = df_idades['idade'].to_numpy(dtype=float)
+    acumulado = np.cumsum(contagens)
+    centrais = idades[np.searchsorted(acumulado, [(total - 1) // 2 + 1, total // 2 + 1])]
+    return float(np.average(idades, weights=contagens)), float(centrais.mean())
+
+def _mascara_grouping(dimensoes, conjunto):
+    # GROUPING(d1, ..., dn) liga o bit de cada dimensão fora do conjunto; d1 é o bit mais alto
+    return sum(1 << (len(dimensoes) - 1 - i) for i, d in enumerate(dimensoes) if d not in conjunto)
+
+def consulta_multimetricas(conexao, conjuntos, medidas, filtros, exclude_filters=None, tabela=TABLE_NAME, agregado=None):
+    """
+    Junta os agrupamentos de vários widgets em uma só varredura com GROUPING SETS.
+    `conjuntos` mapeia o nome de cada widget às dimensões do seu agrupamento (tupla vazia =
+    total geral); `medidas` mapeia alias -> expressão, com os campos de MEDIDAS ({registros},
+    {quantidade}), calculada em todos os conjuntos. A coluna 'conjunto' (GROUPING das dimensões)
+    identifica a que agrupamento cada linha pertence; use separar_conjuntos no resultado.
+    Como consulta_roteada, lê o cubo quando todas as dimensões estão nele. Retorna (sql, params, tabela).
+    """
+    dimensoes = list(dict.fromkeys(d for conjunto in conjuntos.values() for d in conjunto))
+    grupos = ", ".join(f"({', '.join(conjunto)})" for conjunto in dict.fromkeys(tuple(c) for c in conjuntos.values()))
+    selecao = [f"GROUPING({', '.join(dimensoes)}) AS conjunto" if dimensoes else "0 AS conjunto"]
+    selecao += dimensoes + [f"{expressao} AS {alias}" for alias, expressao in medidas.items()]
+    modelo = f"SELECT {', '.join(selecao)} FROM {{tabela}} {{where}} GROUP BY GROUPING SETS ({grupos})"
+    return consulta_roteada(conexao, modelo, filtros, dimensoes, exclude_filters, tabela, agregado)
+
+def separar_conjuntos(df, conjuntos):
+    """{widget: linhas do seu agrupamento (dimensões do conjunto + medidas)} a partir do resultado de consulta_multimetricas."""
+    dimensoes = list(dict.fromkeys(d for conjunto in conjuntos.values() for d in conjunto))
+    medidas = [c for c in df.columns if c != 'conjunto' and c not in dimensoes]
+    return {
+        nome: df.loc[df['conjunto'] == _mascara_grouping(dimensoes, conjunto), list(conjunto) + medidas].reset_index(drop=True)
+        for nome, conjunto in conjuntos.items()
+    }
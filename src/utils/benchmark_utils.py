@@ -0,0 +1,31 @@
+# src/utils/benchmark_utils.py
+# Funções compartilhadas pelos scripts de benchmark (scripts/benchmark_*.py).
+import statistics
+import time
+from pathlib import Path
+
+import duckdb
+
+def tamanho_arquivo_mb(caminho):
+    """Tamanho do arquivo do banco (mais o WAL, se houver) em MB."""
+    return sum(Path(p).stat().st_size for p in (caminho, f"{caminho}.wal") if Path(p).exists()) / 1024 ** 2
+
+def cronometrar_consultas(caminho, consultas, repeticoes=5):
+    """
+    Abre o banco em modo somente leitura e retorna a mediana do tempo (em ms) de cada
+    consulta de `consultas` (nome -> SQL), descartando uma execução de aquecimento.
+    """
+    conexao = duckdb.connect(str(caminho), read_only=True)
+    tempos = {}
+    try:
+        for nome, consulta in consultas.items():
+            conexao.execute(consulta).fetchall()
+            medicoes = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                conexao.execute(consulta).fetchall()
+                medicoes.append((time.perf_counter() - inicio) * 1000)
+            tempos[nome] = statistics.median(medicoes)
+    finally:
+        conexao.close()
+    return tempos
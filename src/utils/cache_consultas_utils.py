@@ -0,0 +1,127 @@
+# src/utils/cache_consultas_utils.py
+# Cache de resultados de consultas do dashboard em Arrow, compartilhado por todas as sessões do
+# processo: chave = SQL normalizado + parâmetros + versão dos dados, descarte LRU pelo tamanho
+# em bytes e, opcionalmente, uma camada em disco (arquivos Arrow IPC) que sobrevive a reinícios.
+# Quando a versão dos dados muda (nova publicação do ETL), as entradas das versões anteriores
+# são descartadas da memória e do disco.
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pyarrow as pa
+
+# Espaços fora de literais ('...') não mudam o resultado; ';' final também não
+_REGEX_NORMALIZACAO = re.compile(r"('(?:[^']|'')*')|\s+")
+
+def normalizar_sql(sql):
+    """SQL com espaços em branco colapsados (exceto dentro de literais) e sem ';' final."""
+    return _REGEX_NORMALIZACAO.sub(lambda m: m.group(1) or ' ', sql).strip().rstrip(';').rstrip()
+
+def chave_consulta(sql, params, versao):
+    """Hash SHA-256 do SQL normalizado, dos parâmetros e da versão dos dados."""
+    conteudo = json.dumps([normalizar_sql(sql), list(params or []), versao], default=str, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+class CacheConsultas:
+    """
+    Cache LRU de tabelas Arrow limitado a `max_bytes` em memória. Com `pasta`, cada resultado
+    também é gravado em `pasta/<versão>/<chave>.arrow` (limitado a `max_bytes_disco`, removendo
+    os arquivos usados há mais tempo), e uma falta em memória é buscada no disco.
+    Seguro para uso simultâneo por várias threads.
+    """
+
+    def __init__(self, max_bytes, pasta=None, max_bytes_disco=None):
+        self.max_bytes = max_bytes
+        self.pasta = Path(pasta) if pasta else None
+        self.max_bytes_disco = max_bytes_disco if max_bytes_disco is not None else 4 * max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._versao = None
+        self._lock = threading.Lock()
+        self.acertos = self.faltas = 0
+
+    def _pasta_versao(self):
+        return self.pasta / hashlib.sha256(str(self._versao).encode('utf-8')).hexdigest()[:16]
+
+    def _definir_versao(self, versao):
+        """Troca a versão corrente, descartando tudo o que pertence às anteriores."""
+        if versao == self._versao:
+            return
+        self._versao = versao
+        self._entradas.clear()
+        self._bytes = 0
+        if self.pasta is not None and self.pasta.exists():
+            atual = self._pasta_versao()
+            for subpasta in self.pasta.iterdir():
+                if subpasta.is_dir() and subpasta != atual:
+                    shutil.rmtree(subpasta, ignore_errors=True)
+
+    def _guardar_memoria(self, chave, tabela):
+        if tabela.nbytes > self.max_bytes:
+            return
+        self._entradas[chave] = tabela
+        self._bytes += tabela.nbytes
+        while self._bytes > self.max_bytes:
+            _, removida = self._entradas.popitem(last=False)
+            self._bytes -= removida.nbytes
+
+    def _ler_disco(self, chave):
+        caminho = self._pasta_versao() / f"{chave}.arrow"
+        try:
+            with pa.OSFile(str(caminho), 'rb') as origem:
+                tabela = pa.ipc.open_file(origem).read_all()
+            os.utime(caminho)
+            return tabela
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+
+    def _gravar_disco(self, chave, tabela):
+        pasta = self._pasta_versao()
+        pasta.mkdir(parents=True, exist_ok=True)
+        temporario = pasta / f"{chave}.{threading.get_ident()}.tmp"
+        with pa.OSFile(str(temporario), 'wb') as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+        os.replace(temporario, pasta / f"{chave}.arrow")
+        arquivos = sorted(pasta.glob("*.arrow"), key=lambda a: a.stat().st_mtime)
+        total = sum(a.stat().st_size for a in arquivos)
+        while arquivos and total > self.max_bytes_disco:
+            antigo = arquivos.pop(0)
+            total -= antigo.stat().st_size
+            antigo.unlink(missing_ok=True)
+
+    def obter(self, chave, versao):
+        """Tabela Arrow da chave na versão dada, ou None."""
+        with self._lock:
+            self._definir_versao(versao)
+            tabela = self._entradas.get(chave)
+            if tabela is not None:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return tabela
+            tabela = self._ler_disco(chave) if self.pasta is not None else None
+            if tabela is not None:
+                self._guardar_memoria(chave, tabela)
+                self.acertos += 1
+                return tabela
+            self.faltas += 1
+            return None
+
+    def guardar(self, chave, versao, tabela):
+        with self._lock:
+            self._definir_versao(versao)
+            # Resultados maiores que o limite em memória não são guardados em nenhuma camada
+            if chave in self._entradas or tabela.nbytes > self.max_bytes:
+                return
+            self._guardar_memoria(chave, tabela)
+            if self.pasta is not None:
+                self._gravar_disco(chave, tabela)
+
+    def estatisticas(self):
+        with self._lock:
+            return {'entradas': len(self._entradas), 'bytes': self._bytes, 'acertos': self.acertos, 'faltas': self.faltas}
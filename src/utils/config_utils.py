@@ -0,0 +1,23 @@
+# src/utils/config_utils.py
+# Leitura do config.yaml da raiz do projeto (configurações do pipeline ETL).
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:  # PyYAML ausente: o config.yaml é ignorado e valem os padrões
+    yaml = None
+
+from .database_utils import BASE_DIR
+
+CONFIG_PATH = BASE_DIR / "config.yaml"
+
+def carregar_config(caminho=CONFIG_PATH):
+    """Retorna o conteúdo do config.yaml como dicionário ({} se o arquivo ou o PyYAML não existirem)."""
+    caminho = Path(caminho)
+    if not caminho.exists():
+        return {}
+    if yaml is None:
+        print(f"Aviso: PyYAML não instalado; '{caminho}' ignorado.")
+        return {}
+    with open(caminho, encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
@@ -0,0 +1,224 @@
+# src/utils/dados_sinteticos_utils.py
+# Gerador determinístico de dados sintéticos do SNGPC: CSVs brutos no layout de prescricoes_raw
+# (latin1, um arquivo por mês) e tabelas de mapeamento compatíveis, para testes e benchmarks offline.
+import json
+import shutil
+from pathlib import Path
+
+import duckdb
+
+from .database_utils import TABLE_MAPEAMENTO, TABLE_ATC, TABLE_MUNICIPIOS
+
+# Tamanhos nomeados usados pelo benchmark do ETL (scripts/benchmark_etl.py)
+TAMANHOS_SINTETICOS = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000, '50m': 50_000_000}
+SEMENTE_PADRAO = 42
+# Meses gerados (um CSV por mês, como os arquivos de dados abertos do SNGPC)
+PERIODO_PADRAO = ((2019, 1), (2020, 12))
+# Identifica as regras abaixo; pastas geradas com outra versão não são reaproveitadas
+VERSAO_GERADOR = 1
+ARQUIVO_DESCRICAO = "gerador.json"
+
+# (código IBGE, capital, peso aproximado pela população)
+UFS = {
+    'SP': (35, 'São Paulo', 22), 'MG': (31, 'Belo Horizonte', 10), 'RJ': (33, 'Rio de Janeiro', 8),
+    'BA': (29, 'Salvador', 7), 'PR': (41, 'Curitiba', 6), 'RS': (43, 'Porto Alegre', 5), 'PE': (26, 'Recife', 5),
+    'CE': (23, 'Fortaleza', 4), 'PA': (15, 'Belém', 4), 'SC': (42, 'Florianópolis', 4), 'GO': (52, 'Goiânia', 3),
+    'MA': (21, 'São Luís', 3), 'AM': (13, 'Manaus', 2), 'ES': (32, 'Vitória', 2), 'PB': (25, 'João Pessoa', 2),
+    'RN': (24, 'Natal', 2), 'MT': (51, 'Cuiabá', 2), 'AL': (27, 'Maceió', 2), 'PI': (22, 'Teresina', 2),
+    'DF': (53, 'Brasília', 2), 'MS': (50, 'Campo Grande', 1), 'SE': (28, 'Aracaju', 1), 'RO': (11, 'Porto Velho', 1),
+    'TO': (17, 'Palmas', 1), 'AC': (12, 'Rio Branco', 1), 'AP': (16, 'Macapá', 1), 'RR': (14, 'Boa Vista', 1),
+}
+MUNICIPIOS_POR_UF = 50
+# Municípios a partir deste índice ficam fora de mapeamento_municipios (viram 'Desconhecido')
+MUNICIPIOS_MAPEADOS_POR_UF = 45
+
+# (nome base, sal ou None, peso, lista da Portaria 344, código ATC, classe terapêutica).
+# Lista None: substância fora de mapeamento_controlados; ATC None: fora de mapeamento_atc.
+PRINCIPIOS = [
+    ('CLONAZEPAM', None, 14, 'B1', 'N03AE01', 'Antiepiléptico'),
+    ('SERTRALINA', 'CLORIDRATO DE', 12, 'C1', 'N06AB06', 'Antidepressivo'),
+    ('ALPRAZOLAM', None, 10, 'B1', 'N05BA12', 'Ansiolítico'),
+    ('ZOLPIDEM', 'HEMITARTARATO DE', 8, 'B1', 'N05CF02', 'Hipnótico'),
+    ('FLUOXETINA', 'CLORIDRATO DE', 8, 'C1', 'N06AB03', 'Antidepressivo'),
+    ('ESCITALOPRAM', 'OXALATO DE', 7, 'C1', 'N06AB10', 'Antidepressivo'),
+    ('AMITRIPTILINA', 'CLORIDRATO DE', 6, 'C1', 'N06AA09', 'Antidepressivo'),
+    ('DIAZEPAM', None, 5, 'B1', 'N05BA01', 'Ansiolítico'),
+    ('QUETIAPINA', 'HEMIFUMARATO DE', 5, 'C1', 'N05AH04', 'Antipsicótico'),
+    ('ÁCIDO VALPRÓICO', None, 4, 'C1', 'N03AG01', 'Antiepiléptico'),
+    ('BROMAZEPAM', None, 4, 'B1', 'N05BA08', 'Ansiolítico'),
+    ('CARBAMAZEPINA', None, 3, 'C1', 'N03AF01', 'Antiepiléptico'),
+    ('METILFENIDATO', 'CLORIDRATO DE', 3, 'A3', 'N06BA04', 'Psicoestimulante'),
+    ('TRAMADOL', 'CLORIDRATO DE', 3, 'A2', 'N02AX02', 'Analgésico Opioide'),
+    ('CODEÍNA + PARACETAMOL', 'FOSFATO DE', 2, 'A2', 'N02AJ06', 'Analgésico Opioide'),
+    ('RISPERIDONA', None, 2, 'C1', 'N05AX08', 'Antipsicótico'),
+    ('PREGABALINA', None, 2, 'C1', 'N03AX16', 'Antiepiléptico'),
+    ('LORAZEPAM', None, 2, 'B1', 'N05BA06', 'Ansiolítico'),
+    ('CARBONATO DE LÍTIO', None, 1, 'C1', 'N05AN01', 'Antipsicótico'),
+    ('FENOBARBITAL', None, 1, 'B1', None, None),
+    ('BUPROPIONA', 'CLORIDRATO DE', 1, 'C1', None, None),
+    ('SIBUTRAMINA', 'CLORIDRATO DE', 1, None, None, None),
+]
+
+# Peças da descrição da apresentação, combinadas e escritas com variações (vírgula/ponto, espaços, ordem)
+DOSES = ['0,5 MG', '0.5MG', '1 MG', '2MG', '2 MG', '0,25 MG', '10 MG', '20MG', '25 MG', '50 MG', '100 MG', '2,5 MG/ML', '200 MG/ML', '5 MG/ML']
+FORMAS_ABREVIADAS = ['COM', 'COMP', 'COM REV', 'COMP REV', 'CAP DURA', 'CAPS', 'SOL OR', 'SOL OR GTS', 'XPE', 'SUSP OR', 'DRG', 'INJ', 'CREM', 'ADES TRANSD']
+EMBALAGENS = ["'CT BL AL PLAS TRANS X ' || {n}", "'FR VD AMB X ' || {n} || ' ML'", "'CX X ' || {n}"]
+CID10 = ['F32', 'F41', 'F41.1', 'G40', 'F20', 'F31', 'F33', 'G47.0', 'F90', 'R52']
+
+def _lista_sql(valores):
+    return "[" + ", ".join("NULL" if v is None else "'" + str(v).replace("'", "''") + "'" for v in valores) + "]"
+
+def _roleta(pesos):
+    """Lista SQL de índices (1-based) repetidos conforme o peso, para sorteio ponderado por hash."""
+    return "[" + ", ".join(str(i) for i, peso in enumerate(pesos, start=1) for _ in range(peso)) + "]"
+
+def _consulta_mes(ano, mes, inicio, fim, semente):
+    """SELECT com as linhas [inicio, fim) do dataset, todas no mês informado."""
+    # Sorteios determinísticos: o mesmo (linha, semente, campo) gera sempre o mesmo número
+    def h(campo):
+        return f"CAST(hash(i, {semente}, '{campo}') >> 1 AS BIGINT)"
+
+    def u(campo):
+        return f"({h(campo)} % 1000000) / 1000000.0"
+
+    ufs, ufs_info = list(UFS), list(UFS.values())
+    pesos_uf, pesos_pa = [p for _, _, p in ufs_info], [p[2] for p in PRINCIPIOS]
+    unidades_embalagem = f"(10 * (1 + {h('n_emb')} % 6))"
+    embalagens = " ".join(f"WHEN {k} THEN {e.format(n=unidades_embalagem)}" for k, e in enumerate(EMBALAGENS))
+    return f"""
+    WITH base AS (
+        SELECT range AS i,
+            {_roleta(pesos_uf)}[1 + {h('uf')} % {sum(pesos_uf)}] AS k_uf,
+            {_roleta(pesos_pa)}[1 + {h('pa')} % {sum(pesos_pa)}] AS k_pa
+        FROM range({inicio}, {fim})
+    ), nomes AS (
+        SELECT *,
+            {_lista_sql(ufs)}[k_uf] AS uf,
+            CASE WHEN {_lista_sql([p[1] for p in PRINCIPIOS])}[k_pa] IS NOT NULL AND {h('sal')} % 10 < 7
+                 THEN {_lista_sql([p[1] for p in PRINCIPIOS])}[k_pa] || ' ' ELSE '' END
+                || {_lista_sql([p[0] for p in PRINCIPIOS])}[k_pa] AS nome,
+            {_lista_sql(DOSES)}[1 + {h('dose')} % {len(DOSES)}] AS dose,
+            {_lista_sql(FORMAS_ABREVIADAS)}[1 + {h('forma')} % {len(FORMAS_ABREVIADAS)}] AS forma,
+            CASE {h('emb')} % {len(EMBALAGENS)} {embalagens} END AS embalagem
+        FROM base
+    )
+    SELECT
+        '{ano}' AS ANO,
+        '{mes}' AS MES,
+        uf AS SIGLA_UF,
+        CASE WHEN {h('mun_nulo')} % 200 = 0 THEN NULL
+             ELSE CAST({_lista_sql([c for c, _, _ in ufs_info])}[k_uf] AS VARCHAR)
+                  || lpad(CAST(CAST(floor({MUNICIPIOS_POR_UF} * pow({u('mun')}, 2)) AS INTEGER) AS VARCHAR), 5, '0') END AS ID_MUNICIPIO,
+        CASE {h('caixa')} % 20
+            WHEN 0 THEN lower(nome)
+            WHEN 1 THEN replace(nome, ' ', '  ')
+            WHEN 2 THEN nome || ' '
+            WHEN 3 THEN strip_accents(nome)
+            WHEN 4 THEN strip_accents(nome)
+            ELSE nome END AS PRINCIPIO_ATIVO,
+        CASE WHEN {h('desc_nula')} % 100 = 0 THEN NULL
+             WHEN {h('desc_caixa')} % 30 = 0 THEN lower(forma || ' ' || dose || ' ' || embalagem)
+             WHEN {h('desc_ordem')} % 4 = 0 THEN forma || '  ' || dose || ' ' || embalagem
+             ELSE dose || ' ' || forma || ' ' || embalagem END AS DESCRICAO_APRESENTACAO,
+        CASE WHEN {h('qtd')} % 200 = 0 THEN 'NA'
+             WHEN {h('qtd')} % 200 = 1 THEN '999'
+             WHEN {h('qtd')} % 100 < 2 THEN '-' || (1 + {h('qtd_n')} % 3)
+             WHEN {h('qtd')} % 100 < 4 THEN (1 + {h('qtd_n')} % 3) || ',5'
+             ELSE CAST(1 + CAST(floor(-ln(1 - {u('qtd_n')}) * 1.2) AS INTEGER) AS VARCHAR) END AS QUANTIDADE_VENDIDA,
+        CASE WHEN forma IN ('SOL OR', 'SOL OR GTS', 'XPE', 'SUSP OR') THEN 'FRASCO' ELSE 'CAIXA' END AS UNIDADE_MEDIDA,
+        ['CRM', 'CRO', 'CRMV', 'RMS'][{_roleta([90, 6, 3, 1])}[1 + {h('conselho')} % 100]] AS CONSELHO_PRESCRITOR,
+        CASE WHEN {h('uf_conselho')} % 20 = 0 THEN {_lista_sql(ufs)}[1 + {h('uf_conselho_k')} % {len(ufs)}] ELSE uf END AS SIGLA_UF_CONSELHO_PRESCRITOR,
+        CAST({_roleta([40, 40, 10, 5, 5])}[1 + {h('receita')} % 100] AS VARCHAR) AS TIPO_RECEITUARIO,
+        CASE WHEN {h('cid')} % 100 < 15 THEN {_lista_sql(CID10)}[1 + {h('cid_k')} % {len(CID10)}] END AS CID10,
+        CASE WHEN {h('sexo')} % 100 < 42 THEN '1' WHEN {h('sexo')} % 100 < 97 THEN '2' END AS SEXO,
+        CASE WHEN {h('idade')} % 200 < 4 THEN NULL
+             WHEN {h('idade')} % 200 = 4 THEN '999'
+             WHEN {h('idade')} % 200 = 5 THEN '-1'
+             WHEN {h('idade_un')} % 100 < 3 THEN CAST(1 + {h('idade_n')} % 11 AS VARCHAR)
+             WHEN {h('idade')} % 100 < 5 THEN CAST({h('idade_n')} % 15 AS VARCHAR)
+             ELSE CAST(15 + CAST(floor(40 * ({u('idade_a')} + {u('idade_b')})) AS INTEGER) AS VARCHAR) END AS IDADE,
+        CASE WHEN {h('idade_un')} % 100 < 3 THEN '2' ELSE '1' END AS UNIDADE_IDADE
+    FROM nomes
+    """
+
+def _meses(periodo):
+    (ano, mes), fim = periodo
+    while (ano, mes) <= fim:
+        yield ano, mes
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+def _converter_para_latin1(origem, destino):
+    """Regrava um CSV UTF-8 em latin1 (o DuckDB só escreve UTF-8), em blocos."""
+    with open(origem, encoding='utf-8', newline='') as entrada, open(destino, 'w', encoding='latin-1', errors='replace', newline='') as saida:
+        shutil.copyfileobj(entrada, saida, 16 * 1024 * 1024)
+
+def descricao_gerada(pasta):
+    """Parâmetros com que a pasta foi gerada (conteúdo de gerador.json), ou None."""
+    try:
+        with open(Path(pasta) / ARQUIVO_DESCRICAO, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def gerar_csvs_sngpc(pasta, linhas, semente=SEMENTE_PADRAO, periodo=PERIODO_PADRAO):
+    """
+    Grava em `pasta` um CSV latin1 por mês do período (EDA_Industrializados_AAAAMM.csv) com
+    `linhas` linhas no total, nas colunas de SCHEMA_PRESCRICOES_RAW. Os valores seguem as
+    distribuições e as imperfeições dos dados reais (nomes com sal, caixa e acentos variados,
+    descrições de apresentação irregulares, idades e quantidades inválidas, campos vazios)
+    e dependem só da semente: a mesma chamada gera sempre os mesmos arquivos.
+    Se a pasta já tiver sido gerada com os mesmos parâmetros, nada é regravado.
+    Retorna a lista de arquivos.
+    """
+    pasta = Path(pasta)
+    descricao = {'linhas': linhas, 'semente': semente, 'periodo': [list(p) for p in periodo], 'versao': VERSAO_GERADOR}
+    meses = list(_meses(periodo))
+    arquivos = [pasta / f"EDA_Industrializados_{ano}{mes:02d}.csv" for ano, mes in meses]
+    if descricao_gerada(pasta) == descricao and all(a.exists() for a in arquivos):
+        print(f"Dados sintéticos já gerados em {pasta} ({linhas:,} linhas, semente {semente}).")
+        return arquivos
+
+    pasta.mkdir(parents=True, exist_ok=True)
+    (pasta / ARQUIVO_DESCRICAO).unlink(missing_ok=True)
+    for antigo in pasta.glob("*.csv"):
+        antigo.unlink()
+    conexao = duckdb.connect()
+    try:
+        conexao.execute("SET preserve_insertion_order = false;")
+        por_mes, resto = divmod(linhas, len(meses))
+        inicio = 0
+        for k, ((ano, mes), arquivo) in enumerate(zip(meses, arquivos)):
+            fim = inicio + por_mes + (1 if k < resto else 0)
+            temporario = arquivo.with_suffix('.utf8.tmp')
+            conexao.execute(f"COPY ({_consulta_mes(ano, mes, inicio, fim, semente)}) TO '{temporario.as_posix()}' (HEADER, DELIMITER ',');")
+            _converter_para_latin1(temporario, arquivo)
+            temporario.unlink()
+            inicio = fim
+        print(f"-> {linhas:,} linhas sintéticas gravadas em {len(arquivos)} arquivo(s) em {pasta}.")
+    finally:
+        conexao.close()
+    with open(pasta / ARQUIVO_DESCRICAO, 'w', encoding='utf-8') as f:
+        json.dump(descricao, f, indent=2)
+    return arquivos
+
+def criar_mapeamentos_sinteticos(conexao):
+    """
+    Cria (substituindo) as tabelas de mapeamento que o ETL espera, coerentes com os dados
+    gerados: listas da Portaria 344, ATC e nomes de municípios. Algumas substâncias e
+    municípios ficam de fora de propósito, como acontece com os mapeamentos reais.
+    """
+    controlados = [(nome, lista, '01/05/1998', None) for nome, _, _, lista, _, _ in PRINCIPIOS if lista]
+    # Uma substância com saída e retorno à lista, para exercitar a vigência
+    controlados = [c if c[0] != 'ZOLPIDEM' else (c[0], c[1], c[2], '01/03/2020') for c in controlados]
+    controlados.append(('ZOLPIDEM', 'B1', '01/07/2020', None))
+    atc = [((f"{sal} {nome}" if sal else nome), codigo, classe) for nome, sal, _, _, codigo, classe in PRINCIPIOS if codigo]
+    municipios = [
+        (f"{codigo}{k:05d}", capital if k == 0 else f"Município {k} ({uf})")
+        for uf, (codigo, capital, _) in UFS.items() for k in range(MUNICIPIOS_MAPEADOS_POR_UF)
+    ]
+    conexao.execute(f"CREATE OR REPLACE TABLE {TABLE_MAPEAMENTO} (principio_ativo VARCHAR, lista VARCHAR, inclusao_lista VARCHAR, exclusao_lista VARCHAR);")
+    conexao.executemany(f"INSERT INTO {TABLE_MAPEAMENTO} VALUES (?, ?, ?, ?)", controlados)
+    conexao.execute(f"CREATE OR REPLACE TABLE {TABLE_ATC} (principio_ativo VARCHAR, codigo_atc VARCHAR, classe_terapeutica VARCHAR);")
+    conexao.executemany(f"INSERT INTO {TABLE_ATC} VALUES (?, ?, ?)", atc)
+    conexao.execute(f"CREATE OR REPLACE TABLE {TABLE_MUNICIPIOS} (id_municipio VARCHAR, nome_municipio VARCHAR);")
+    conexao.executemany(f"INSERT INTO {TABLE_MUNICIPIOS} VALUES (?, ?)", municipios)
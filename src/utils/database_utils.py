@@ -3,6 +3,13 @@ import streamlit as st
 import duckdb
 from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import os
+import json
+import threading
+
+from .cache_consultas_utils import CacheConsultas, chave_consulta
+from .pool_cursores_utils import PoolCursores
 
 # --- Configurações e Constantes Compartilhadas ---
 # BASE_DIR agora é definido a partir da localização deste arquivo em src/utils/
@@ -12,30 +19,198 @@ TABLE_NAME = "prescricoes"
 TABLE_MAPEAMENTO = "mapeamento_controlados"
 TABLE_ATC = "mapeamento_atc"
 TABLE_MUNICIPIOS = "mapeamento_municipios"
+TABLE_DICIONARIO_PA = "dicionario_principio_ativo"
+TABLE_APRESENTACOES = "apresentacoes"
+# Cubo pré-agregado de 'prescricoes' usado pelas consultas do dashboard (ver src/utils/agregados_utils.py)
+TABLE_AGREGADO = "prescricoes_agregado"
+# Hash e data da última carga de cada tabela de mapeamento (ver src/utils/mapeamentos_utils.py)
+TABLE_MANIFESTO_MAPEAMENTOS = "mapeamentos_manifesto"
+
+# Exportação opcional de 'prescricoes' em Parquet particionado (gerada pelo ETL com --exportar-parquet)
+PARQUET_DIR_PATH = BASE_DIR / "dados" / "prescricoes_parquet"
+COLUNAS_PARTICAO_PARQUET = {'ano': 'INTEGER', 'mes': 'INTEGER', 'sigla_uf': 'VARCHAR'}
+# Origem de 'prescricoes' no dashboard: 'duckdb' (tabela do arquivo .duckdb) ou 'parquet' (view sobre PARQUET_DIR_PATH)
+FONTE_PRESCRICOES = os.environ.get("SNGPC_FONTE_PRESCRICOES", "duckdb")
+
+# Perfis de recursos do DuckDB para o ETL (aplicados em get_db_connection_for_etl). Com
+# memory_limit e temp_directory definidos, joins, agregações e ordenações maiores que a
+# memória são despejados em disco em vez de falhar; None mantém o padrão do DuckDB
+# (80% da RAM e todos os núcleos). O perfil pode vir de --perfil-recursos ou do config.yaml.
+PERFIS_RECURSOS_ETL = {
+    'laptop': {'memory_limit': '4GB', 'threads': 4, 'preserve_insertion_order': False},
+    'server': {'memory_limit': None, 'threads': None, 'preserve_insertion_order': False},
+    'ci': {'memory_limit': '1GB', 'threads': 2, 'preserve_insertion_order': False},
+}
+PERFIL_RECURSOS_PADRAO = 'laptop'
+TEMP_DIR_ETL = BASE_DIR / "dados" / "duckdb_tmp"
+
+# Publicação blue/green: o ETL trabalha em DUCKDB_FILE_PATH e, ao final, grava uma cópia
+# validada em VERSOES_DIR_PATH; o ponteiro ARQUIVO_VERSAO_PUBLICADA (JSON trocado de forma
+# atômica) indica a versão que o dashboard lê. Sem publicação, o dashboard lê DUCKDB_FILE_PATH.
+VERSOES_DIR_PATH = BASE_DIR / "dados" / "versoes"
+ARQUIVO_VERSAO_PUBLICADA = "publicado.json"
+
+# Cache de resultados das consultas do dashboard (ver src/utils/cache_consultas_utils.py),
+# compartilhado entre as sessões: limite em memória (MB) e pasta da camada em disco
+# (SNGPC_CACHE_CONSULTAS_DIR vazio desativa o disco). As entradas valem para uma versão dos dados.
+CACHE_CONSULTAS_MB = int(os.environ.get("SNGPC_CACHE_CONSULTAS_MB", "256"))
+CACHE_CONSULTAS_DIR = os.environ.get("SNGPC_CACHE_CONSULTAS_DIR", str(BASE_DIR / "dados" / "cache_consultas"))
+# Cursores simultâneos do dashboard (ver src/utils/pool_cursores_utils.py); por padrão, um por núcleo
+TAMANHO_POOL_CURSORES = int(os.environ.get("SNGPC_POOL_CURSORES", str(os.cpu_count() or 4)))
 
 # --- Funções de Conexão ---
 
-@st.cache_resource(show_spinner="Conectando ao banco de dados...")
-def get_duckdb_connection():
+def criar_view_prescricoes_parquet(conexao, pasta=PARQUET_DIR_PATH, nome_view=TABLE_NAME):
     """
-    Estabelece e retorna uma conexão read-only com o DuckDB para o app Streamlit.
+    Cria uma view temporária com o nome da tabela de prescrições sobre o dataset Parquet
+    particionado por ano/mes/sigla_uf. Filtros nessas colunas descartam arquivos inteiros
+    (partition pruning). Por ser TEMP, a view tem precedência sobre a tabela do arquivo .duckdb.
     """
+    arquivos = (Path(pasta) / "**" / "*.parquet").as_posix().replace("'", "''")
+    tipos = ", ".join(f"'{coluna}': '{tipo}'" for coluna, tipo in COLUNAS_PARTICAO_PARQUET.items())
+    conexao.execute(f"""
+        CREATE OR REPLACE TEMP VIEW {nome_view} AS
+        SELECT * FROM read_parquet('{arquivos}', hive_partitioning = true, hive_types = {{{tipos}}});
+    """)
+
+def ler_versao_publicada(pasta_versoes=VERSOES_DIR_PATH):
+    """Conteúdo do ponteiro da versão publicada (dict), ou None se nada foi publicado ainda."""
     try:
-        return duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=True)
-    except Exception as e:
-        st.exception(f"Erro ao conectar ao DuckDB para o app: {e}")
+        with open(Path(pasta_versoes) / ARQUIVO_VERSAO_PUBLICADA, encoding='utf-8') as f:
+            versao = json.load(f)
+    except (FileNotFoundError, ValueError):
         return None
+    return versao if (Path(pasta_versoes) / versao.get('arquivo', '')).is_file() else None
+
+def caminho_banco_publicado(pasta_versoes=VERSOES_DIR_PATH):
+    """Arquivo .duckdb que o dashboard deve ler: a versão publicada ou, sem publicação, DUCKDB_FILE_PATH."""
+    versao = ler_versao_publicada(pasta_versoes)
+    return Path(pasta_versoes) / versao['arquivo'] if versao else DUCKDB_FILE_PATH
+
+def _preparar_cursor_app(cursor):
+    # Views temporárias valem só para a conexão que as criou: cada cursor do pool recebe a sua
+    if FONTE_PRESCRICOES == "parquet":
+        criar_view_prescricoes_parquet(cursor)
+
+@st.cache_resource(show_spinner="Conectando ao banco de dados...", max_entries=1)
+def _pool_banco_app(caminho):
+    def conectar():
+        if FONTE_PRESCRICOES == "parquet" and not Path(caminho).exists():
+            return duckdb.connect()
+        return duckdb.connect(database=str(caminho), read_only=True)
+    return PoolCursores(conectar, TAMANHO_POOL_CURSORES, preparar=_preparar_cursor_app)
+
+_pool_em_uso = None
+_lock_pool_em_uso = threading.Lock()
+
+def obter_pool():
+    """
+    Pool de cursores read-only do DuckDB para o app Streamlit, compartilhado por todas as sessões.
+    Com FONTE_PRESCRICOES = 'parquet', 'prescricoes' passa a ser lida do dataset Parquet;
+    as demais tabelas continuam vindo do arquivo .duckdb, se ele existir.
+    A cada chamada o ponteiro de publicação é relido: quando o ETL publica uma nova versão,
+    o pool passa a abrir cursores no novo arquivo e o pool anterior é fechado (as consultas em
+    andamento nele terminam antes). Os caches de resultados são indexados por versao_dados()
+    e não precisam ser limpos.
+    """
+    global _pool_em_uso
+    # Sob o lock, o ponteiro é lido em ordem: uma thread atrasada não reinstala o pool antigo
+    with _lock_pool_em_uso:
+        pool = _pool_banco_app(str(caminho_banco_publicado()))
+        anterior, _pool_em_uso = _pool_em_uso, pool
+    if anterior is not None and anterior is not pool:
+        anterior.fechar()
+    return pool
+
+def obter_cursor():
+    """
+    Context manager que empresta um cursor do pool (uma conexão própria, então consultas de
+    sessões diferentes rodam em paralelo) e o devolve ao sair do bloco:
+
+        with obter_cursor() as cursor:
+            cursor.execute(...)
+    """
+    return obter_pool().cursor()
+
+def versao_dados():
+    """
+    Identificador da versão dos dados que o dashboard lê: o arquivo publicado ou, sem
+    publicação, o arquivo .duckdb e sua data de modificação (mais a do Parquet, se for a fonte).
+    """
+    versao = ler_versao_publicada()
+    partes = [versao['arquivo']] if versao else [f"{DUCKDB_FILE_PATH.name}@{DUCKDB_FILE_PATH.stat().st_mtime_ns if DUCKDB_FILE_PATH.exists() else 0}"]
+    if FONTE_PRESCRICOES == "parquet":
+        partes.append(f"parquet@{PARQUET_DIR_PATH.stat().st_mtime_ns if PARQUET_DIR_PATH.exists() else 0}")
+    return "|".join(partes)
+
+@st.cache_resource
+def obter_cache_consultas():
+    """Instância única do cache de consultas no processo (todas as sessões do Streamlit a compartilham)."""
+    return CacheConsultas(CACHE_CONSULTAS_MB * 1024**2, pasta=CACHE_CONSULTAS_DIR or None)
+
+def _arrow_para_pandas(tabela):
+    # Mesmos tipos do fetchdf(): HUGEINT (decimal de 38 dígitos no Arrow) vira float e DATE vira datetime64
+    colunas_decimais = [i for i, campo in enumerate(tabela.schema) if pa.types.is_decimal(campo.type)]
+    for i in colunas_decimais:
+        tabela = tabela.set_column(i, tabela.schema.field(i).name, tabela.column(i).cast(pa.float64()))
+    return tabela.to_pandas(date_as_object=False)
+
+def consultar_df(query, params=None, cache=True):
+    """
+    Executa a consulta em um cursor do pool passando pelo cache de consultas (chave: SQL
+    normalizado, parâmetros e versão dos dados) e retorna um DataFrame; um acerto no cache não
+    ocupa cursor. Uma nova publicação do ETL muda a versão e invalida as entradas anteriores.
+    Use cache=False em consultas não determinísticas (USING SAMPLE): cada execução deve sortear
+    uma nova amostra, e amostras grandes tirariam do cache os agregados pequenos.
+    Erros de SQL e de conexão são propagados.
+    """
+    if not cache:
+        with obter_cursor() as cursor:
+            return _arrow_para_pandas(cursor.execute(query, params or []).to_arrow_table())
+    cache_consultas, versao = obter_cache_consultas(), versao_dados()
+    chave = chave_consulta(query, params, versao)
+    tabela = cache_consultas.obter(chave, versao)
+    if tabela is None:
+        with obter_cursor() as cursor:
+            tabela = cursor.execute(query, params or []).to_arrow_table()
+        cache_consultas.guardar(chave, versao, tabela)
+    return _arrow_para_pandas(tabela)
+
+def configurar_recursos(conexao, perfil=PERFIL_RECURSOS_PADRAO, temp_directory=TEMP_DIR_ETL, **ajustes):
+    """
+    Aplica à conexão um perfil de PERFIS_RECURSOS_ETL (memory_limit, threads,
+    preserve_insertion_order...) e a pasta de despejo em disco. Os `ajustes` sobrepõem as
+    configurações do perfil. Retorna as configurações aplicadas.
+    """
+    if perfil not in PERFIS_RECURSOS_ETL:
+        raise ValueError(f"Perfil de recursos desconhecido: {perfil}. Perfis válidos: {', '.join(PERFIS_RECURSOS_ETL)}")
+    configuracoes = {**PERFIS_RECURSOS_ETL[perfil], 'temp_directory': temp_directory, **ajustes}
+    aplicadas = {}
+    for nome, valor in configuracoes.items():
+        if valor is None:
+            continue
+        if nome == 'temp_directory':
+            Path(valor).mkdir(parents=True, exist_ok=True)
+            valor = Path(valor).as_posix()
+        conexao.execute(f"SET {nome} = ?;", [valor])
+        aplicadas[nome] = valor
+    return aplicadas
 
-def get_db_connection_for_etl():
+def get_db_connection_for_etl(perfil_recursos=None, caminho=DUCKDB_FILE_PATH, **ajustes):
     """
     Cria e retorna uma conexão de LEITURA/ESCRITA com o DuckDB,
     específica para scripts de ETL, sem usar o cache do Streamlit.
+    A conexão sai configurada com o perfil de recursos (ver PERFIS_RECURSOS_ETL).
     """
+    perfil_recursos = perfil_recursos or PERFIL_RECURSOS_PADRAO
     try:
-        return duckdb.connect(database=str(DUCKDB_FILE_PATH), read_only=False)
+        conexao = duckdb.connect(database=str(caminho), read_only=False)
     except Exception as e:
         print(f"FATAL: Erro ao conectar ao DB para ETL: {e}")
         return None
+    aplicadas = configurar_recursos(conexao, perfil_recursos, **ajustes)
+    print(f"Perfil de recursos '{perfil_recursos}': " + ", ".join(f"{nome}={valor}" for nome, valor in aplicadas.items()))
+    return conexao
 
 # --- Funções de Query Compartilhadas ---
 
@@ -81,32 +256,24 @@ def build_where_clause(filtros, exclude_filters=None):
     where_clause = f"WHERE {' AND '.join(conditions)}"
     return where_clause, params
 
-@st.cache_data(show_spinner="Carregando opções de filtro...")
 def carregar_opcoes_filtro_do_db(coluna_filtro, tabela=TABLE_NAME, add_todos=False, placeholder_todos="Todos"):
     """Busca valores distintos de uma coluna no DuckDB para popular filtros."""
-    conn = get_duckdb_connection()
-    if conn is None: return [placeholder_todos] if add_todos else []
-    
     query = f'SELECT DISTINCT "{coluna_filtro}" FROM {tabela} WHERE "{coluna_filtro}" IS NOT NULL AND ano IN (2019, 2020) ORDER BY "{coluna_filtro}" ASC;'
     try:
-        options = conn.execute(query).df()[coluna_filtro].tolist()
+        options = consultar_df(query)[coluna_filtro].tolist()
     except Exception as e:
         st.warning(f"Não foi possível carregar opções para '{coluna_filtro}': {e}")
         options = []
         
     return [placeholder_todos] + sorted(options) if add_todos else sorted(options)
 
-@st.cache_data(show_spinner="Carregando opções de previsão...")
 def carregar_opcoes_previsao(tabela=TABLE_NAME):
     """
     Retorna duas listas: princípios ativos e municípios distintos da tabela.
     """
-    conn = get_duckdb_connection()
-    if conn is None:
-        return [], []
     try:
-        opcoes_pa = conn.execute(f'SELECT DISTINCT principio_ativo FROM {tabela} WHERE principio_ativo IS NOT NULL ORDER BY principio_ativo ASC;').df()['principio_ativo'].tolist()
-        opcoes_mun = conn.execute(f'SELECT DISTINCT nome_municipio FROM {tabela} WHERE nome_municipio IS NOT NULL ORDER BY nome_municipio ASC;').df()['nome_municipio'].tolist()
+        opcoes_pa = consultar_df(f'SELECT DISTINCT principio_ativo FROM {tabela} WHERE principio_ativo IS NOT NULL ORDER BY principio_ativo ASC;')['principio_ativo'].tolist()
+        opcoes_mun = consultar_df(f'SELECT DISTINCT nome_municipio FROM {tabela} WHERE nome_municipio IS NOT NULL ORDER BY nome_municipio ASC;')['nome_municipio'].tolist()
     except Exception as e:
         st.warning(f"Não foi possível carregar opções de previsão: {e}")
         opcoes_pa, opcoes_mun = [], []
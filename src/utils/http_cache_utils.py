@@ -0,0 +1,85 @@
+# src/utils/http_cache_utils.py
+# Busca de páginas HTML com cache em disco (chaveado pela URL e revalidado por ETag/Last-Modified),
+# concorrência limitada e modo de replay offline sobre páginas já salvas (fixtures).
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from .database_utils import BASE_DIR
+
+CACHE_HTTP_DIR = BASE_DIR / "dados" / "cache_http"
+MAX_REQUISICOES_SIMULTANEAS = 4
+TIMEOUT_HTTP_S = 30
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+# 'rede': requisição condicional, usando o cache quando o servidor responde 304;
+# 'replay': só lê o cache/fixtures, sem acessar a rede
+MODOS_BUSCA = ('rede', 'replay')
+
+def _caminhos_cache(pasta, url):
+    """Arquivos (.html e .json de metadados) da URL no cache; o nome é o SHA-256 da URL."""
+    chave = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    pasta = Path(pasta)
+    return pasta / f"{chave}.html", pasta / f"{chave}.json"
+
+def ler_cache(pasta, url):
+    """Retorna (html, metadados) da URL no cache, ou (None, None) se ela não foi salva."""
+    caminho_html, caminho_meta = _caminhos_cache(pasta, url)
+    if not caminho_html.exists() or not caminho_meta.exists():
+        return None, None
+    with open(caminho_meta, 'r', encoding='utf-8') as f:
+        metadados = json.load(f)
+    return caminho_html.read_text(encoding='utf-8'), metadados
+
+def salvar_cache(pasta, url, html, etag=None, last_modified=None):
+    """Grava o HTML (UTF-8) e os metadados de validação da URL no cache."""
+    caminho_html, caminho_meta = _caminhos_cache(pasta, url)
+    caminho_html.parent.mkdir(parents=True, exist_ok=True)
+    caminho_html.write_text(html, encoding='utf-8')
+    with open(caminho_meta, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'etag': etag, 'last_modified': last_modified,
+                   'baixado_em': datetime.now().isoformat(timespec='seconds')}, f, ensure_ascii=False, indent=2)
+
+def buscar_html(url, pasta_cache=CACHE_HTTP_DIR, modo='rede'):
+    """
+    Retorna o HTML da URL (ou None em caso de erro). No modo 'rede', se a URL já está no
+    cache a requisição leva If-None-Match/If-Modified-Since e um 304 reaproveita a cópia
+    salva; uma resposta nova substitui o cache. No modo 'replay' só o cache é consultado.
+    """
+    if modo not in MODOS_BUSCA:
+        raise ValueError(f"Modo de busca inválido: {modo}. Use um de {MODOS_BUSCA}.")
+    html_cache, metadados = ler_cache(pasta_cache, url)
+    if modo == 'replay':
+        if html_cache is None:
+            print(f"Aviso: {url} não está no cache/fixtures ({pasta_cache}).")
+        return html_cache
+
+    headers = {'User-Agent': USER_AGENT}
+    if metadados:
+        if metadados.get('etag'):
+            headers['If-None-Match'] = metadados['etag']
+        if metadados.get('last_modified'):
+            headers['If-Modified-Since'] = metadados['last_modified']
+    try:
+        response = requests.get(url, headers=headers, timeout=TIMEOUT_HTTP_S)
+        if response.status_code == 304 and html_cache is not None:
+            return html_cache
+        response.raise_for_status()
+        response.encoding = response.apparent_encoding if response.apparent_encoding else 'utf-8'
+        salvar_cache(pasta_cache, url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response.text
+    except requests.exceptions.RequestException as e:
+        if html_cache is not None:
+            print(f"Aviso: erro ao buscar URL {url} ({e}); usando a cópia do cache.")
+            return html_cache
+        print(f"Erro ao buscar URL {url}: {e}")
+        return None
+
+def buscar_varios_html(urls, pasta_cache=CACHE_HTTP_DIR, modo='rede', max_simultaneas=MAX_REQUISICOES_SIMULTANEAS):
+    """Busca as URLs com no máximo `max_simultaneas` requisições em paralelo. Retorna {url: html ou None}."""
+    urls = list(dict.fromkeys(urls))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_simultaneas, len(urls) or 1))) as executor:
+        return dict(zip(urls, executor.map(lambda url: buscar_html(url, pasta_cache, modo), urls)))
@@ -0,0 +1,124 @@
+# src/utils/instrumentacao_utils.py
+# Instrumentação das etapas do ETL e das cargas de mapeamento: tempo, CPU, linhas, bytes e memória.
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource  # indisponível no Windows; nesse caso o pico de RSS fica vazio
+except ImportError:
+    resource = None
+
+RELATORIO_DIR_PADRAO = "dados/relatorios_etl"
+PREFIXO_RELATORIO = "instrumentacao"
+
+# Métricas comparadas entre duas execuções (relatorio_a x relatorio_b)
+METRICAS_COMPARADAS = ['tempo_parede_s', 'tempo_cpu_s', 'linhas_entrada', 'linhas_saida', 'delta_bytes_db', 'pico_rss_mb']
+
+def pico_rss_mb():
+    """Pico de memória residente do processo até agora, em MB (None se não disponível)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+def bytes_banco(conexao):
+    """Tamanho em disco do banco DuckDB (arquivo + WAL); em memória, os blocos em uso."""
+    if conexao is None:
+        return None
+    try:
+        caminho = conexao.execute("SELECT path FROM duckdb_databases() WHERE database_name = current_database()").fetchone()[0]
+        if caminho:
+            return sum(Path(p).stat().st_size for p in (caminho, f"{caminho}.wal") if Path(p).exists())
+        return conexao.execute("SELECT used_blocks * block_size FROM pragma_database_size()").fetchone()[0]
+    except Exception:
+        return None
+
+def contar_linhas(conexao, tabelas):
+    """Soma das linhas das tabelas existentes (None se nenhuma existir)."""
+    total = None
+    for tabela in tabelas if conexao is not None else ():
+        existe = conexao.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [tabela]).fetchone()[0]
+        if existe:
+            total = (total or 0) + conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    return total
+
+@contextmanager
+def medir_etapa(conexao, registros, etapa, tabelas_entrada=(), tabelas_saida=(), **extras):
+    """
+    Mede uma etapa e acrescenta um registro estruturado a `registros`. O dicionário
+    entregue pelo `with` pode receber métricas da própria etapa (ex.: linhas_saida
+    quando a saída não é uma tabela). Com conexao=None só tempo e memória são medidos.
+    Se a etapa falhar, o registro é gravado com status 'falhou' e a exceção segue adiante.
+    """
+    registro = {
+        'etapa': etapa,
+        'status': 'concluida',
+        'iniciado_em': datetime.now().isoformat(timespec='seconds'),
+        'linhas_entrada': contar_linhas(conexao, tabelas_entrada),
+        'bytes_db_antes': bytes_banco(conexao),
+        **extras,
+    }
+    inicio_parede, inicio_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield registro
+    except Exception:
+        registro['status'] = 'falhou'
+        raise
+    finally:
+        registro['tempo_parede_s'] = time.perf_counter() - inicio_parede
+        registro['tempo_cpu_s'] = time.process_time() - inicio_cpu
+        if registro['status'] == 'concluida':
+            registro.setdefault('linhas_saida', contar_linhas(conexao, tabelas_saida))
+        registro['bytes_db_depois'] = bytes_banco(conexao)
+        if registro['bytes_db_antes'] is not None and registro['bytes_db_depois'] is not None:
+            registro['delta_bytes_db'] = registro['bytes_db_depois'] - registro['bytes_db_antes']
+        registro['pico_rss_mb'] = pico_rss_mb()
+        registros.append(registro)
+
+def salvar_relatorio(registros, nome, relatorio_dir=RELATORIO_DIR_PADRAO):
+    """
+    Grava os registros em <relatorio_dir>/instrumentacao_<nome>_<AAAAMMDD_HHMMSS>.json e .parquet.
+    Retorna o caminho do JSON.
+    """
+    pasta = Path(relatorio_dir)
+    pasta.mkdir(parents=True, exist_ok=True)
+    base = pasta / f"{PREFIXO_RELATORIO}_{nome}_{datetime.now():%Y%m%d_%H%M%S}"
+    with open(base.with_suffix('.json'), 'w', encoding='utf-8') as f:
+        json.dump(registros, f, ensure_ascii=False, indent=2, default=str)
+    pd.DataFrame(registros).to_parquet(base.with_suffix('.parquet'), index=False)
+    return base.with_suffix('.json')
+
+def carregar_relatorio(caminho):
+    """Lê um relatório de instrumentação (.json ou .parquet) como DataFrame."""
+    caminho = Path(caminho)
+    if caminho.suffix == '.parquet':
+        return pd.read_parquet(caminho)
+    with open(caminho, encoding='utf-8') as f:
+        return pd.DataFrame(json.load(f))
+
+def comparar_relatorios(caminho_a, caminho_b):
+    """
+    Compara duas execuções etapa a etapa. Para cada métrica traz o valor de A, o de B e a
+    variação percentual de B em relação a A; etapas presentes em só uma delas ficam com NaN.
+    """
+    a = carregar_relatorio(caminho_a).drop_duplicates('etapa', keep='last').set_index('etapa')
+    b = carregar_relatorio(caminho_b).drop_duplicates('etapa', keep='last').set_index('etapa')
+    ordem = list(a.index) + [etapa for etapa in b.index if etapa not in a.index]
+    comparacao = pd.DataFrame(index=ordem)
+    comparacao.index.name = 'etapa'
+    for metrica in METRICAS_COMPARADAS:
+        valor_a, valor_b = (
+            pd.to_numeric(df[metrica], errors='coerce').reindex(ordem) if metrica in df.columns else pd.Series(float('nan'), index=ordem)
+            for df in (a, b)
+        )
+        comparacao[f'{metrica}_a'] = valor_a
+        comparacao[f'{metrica}_b'] = valor_b
+        comparacao[f'{metrica}_var_pct'] = (valor_b - valor_a) / valor_a.where(valor_a != 0) * 100
+    return comparacao.reset_index()
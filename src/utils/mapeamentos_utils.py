@@ -0,0 +1,96 @@
+# src/utils/mapeamentos_utils.py
+# Carga das tabelas de mapeamento (controlados, ATC, municípios) a partir dos CSVs de dados/,
+# em uma única transação, pulando os arquivos cujo conteúdo não mudou desde a última carga.
+import hashlib
+from pathlib import Path
+
+from .database_utils import BASE_DIR, TABLE_MAPEAMENTO, TABLE_ATC, TABLE_MUNICIPIOS, TABLE_MANIFESTO_MAPEAMENTOS
+from .normalizacao_utils import aplicar_join_key, aplicar_datas_vigencia, VERSAO_NORMALIZACAO
+from .instrumentacao_utils import medir_etapa
+
+MAPEAMENTOS_DIR_PATH = BASE_DIR / "dados"
+
+# Tabela -> CSV de origem e tratamentos aplicados depois da carga. Todas as colunas são lidas
+# como texto (id_municipio, por exemplo, precisa casar com o texto da staging).
+MAPEAMENTOS = {
+    TABLE_MAPEAMENTO: {'arquivo': "mapeamento_Controlados.csv", 'join_key': True, 'vigencia': True},
+    TABLE_ATC: {'arquivo': "mapeamento_atc.csv", 'join_key': True, 'vigencia': False},
+    TABLE_MUNICIPIOS: {'arquivo': "mapeamento_municipios.csv", 'join_key': False, 'vigencia': False},
+}
+
+def hash_arquivo(caminho, tamanho_bloco=8 * 1024 * 1024):
+    """Calcula o SHA-256 do conteúdo do arquivo, lendo em blocos."""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        while bloco := f.read(tamanho_bloco):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _garantir_manifesto_mapeamentos(conexao):
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_MANIFESTO_MAPEAMENTOS} (
+        tabela VARCHAR PRIMARY KEY,
+        caminho VARCHAR,
+        hash_conteudo VARCHAR,
+        versao_normalizacao VARCHAR,
+        total_linhas BIGINT,
+        carregado_em TIMESTAMP
+    );
+    """)
+
+def _carregar_csv(conexao, tabela, caminho):
+    """Substitui a tabela pelo conteúdo do CSV, com os nomes de coluna padronizados (minúsculas, '_')."""
+    arquivo = caminho.as_posix().replace("'", "''")
+    origem = f"read_csv('{arquivo}', header = true, all_varchar = true)"
+    colunas = [c[0] for c in conexao.execute(f"DESCRIBE SELECT * FROM {origem}").fetchall()]
+    selecao = ", ".join(f'"{c}" AS "{c.lower().strip().replace(" ", "_")}"' for c in colunas)
+    conexao.execute(f"CREATE OR REPLACE TABLE {tabela} AS SELECT {selecao} FROM {origem};")
+
+def atualizar_mapeamentos(conexao, pasta=MAPEAMENTOS_DIR_PATH, tabelas=None, forcar=False, registros=None):
+    """
+    Recarrega as tabelas de MAPEAMENTOS (ou só as de `tabelas`) a partir dos CSVs de `pasta`,
+    tudo em uma transação: se um arquivo falhar, nenhuma tabela é alterada. Arquivos com o
+    mesmo hash e a mesma versão de normalização da última carga são pulados (forcar=True
+    recarrega tudo). A join_key vem do dicionário compartilhado com o ETL (aplicar_join_key).
+    As métricas de cada carga vão para `registros` (ver medir_etapa).
+    Retorna a lista das tabelas recarregadas.
+    """
+    registros = [] if registros is None else registros
+    _garantir_manifesto_mapeamentos(conexao)
+    carregados = {
+        tabela: (hash_conteudo, versao)
+        for tabela, hash_conteudo, versao in conexao.execute(
+            f"SELECT tabela, hash_conteudo, versao_normalizacao FROM {TABLE_MANIFESTO_MAPEAMENTOS}").fetchall()
+    }
+    existentes = {nome for (nome,) in conexao.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    recarregadas = []
+    conexao.execute("BEGIN TRANSACTION;")
+    try:
+        for tabela in tabelas or list(MAPEAMENTOS):
+            config = MAPEAMENTOS[tabela]
+            caminho = Path(pasta) / config['arquivo']
+            if not caminho.exists():
+                print(f"AVISO: {caminho} não encontrado; '{tabela}' mantida como está.")
+                continue
+            hash_conteudo = hash_arquivo(caminho)
+            versao = VERSAO_NORMALIZACAO if config['join_key'] else None
+            if not forcar and tabela in existentes and carregados.get(tabela) == (hash_conteudo, versao):
+                print(f"-> '{tabela}': {caminho.name} inalterado desde a última carga. Pulando.")
+                continue
+            with medir_etapa(conexao, registros, tabela, tabelas_saida=[tabela],
+                             bytes_entrada=caminho.stat().st_size, versao_normalizacao=versao):
+                _carregar_csv(conexao, tabela, caminho)
+                if config['join_key']:
+                    aplicar_join_key(conexao, tabela)
+                if config['vigencia']:
+                    aplicar_datas_vigencia(conexao, tabela)
+            total = conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+            conexao.execute(f"INSERT OR REPLACE INTO {TABLE_MANIFESTO_MAPEAMENTOS} VALUES (?, ?, ?, ?, ?, current_timestamp)",
+                            [tabela, str(caminho), hash_conteudo, versao, total])
+            print(f"-> '{tabela}' recarregada de {caminho.name} com {total:,} registros.")
+            recarregadas.append(tabela)
+        conexao.execute("COMMIT;")
+    except Exception:
+        conexao.execute("ROLLBACK;")
+        raise
+    return recarregadas
@@ -0,0 +1,143 @@
+# src/utils/normalizacao_utils.py
+# Normalização dos nomes de princípios ativos, compartilhada pelo ETL e pelas cargas de mapeamento,
+# e classificação das descrições de apresentação (forma farmacêutica e dosagem).
+import hashlib
+
+from .database_utils import TABLE_DICIONARIO_PA, TABLE_APRESENTACOES
+
+# Sais, hidratações e outros termos removidos do nome do princípio ativo (a ordem importa:
+# as formas com "DE" precisam vir antes das formas curtas).
+TERMOS_REMOVIDOS = [
+    'CLORIDRATO DE', 'BROMIDRATO DE', 'FOSFATO DE', 'ACETATO DE', 'DECANOATO DE', 'NITRATO DE',
+    'HEMISSULFATO DE', 'SUCCINATO DE', 'MALEATO DE', 'MESILATO DE', 'VALERATO DE', 'ESILATO DE',
+    'CIPIONATO DE', 'TRI-HIDRATADO', 'TRIHIDRATADA', 'MONOIDRATADO', 'DI-HIDRATADO', 'ANIDRO', 'OXALATO DE',
+    'SULFATO DE', 'CLORIDRATO', 'BROMIDRATO', 'FOSFATO', 'ACETATO', 'DECANOATO', 'NITRATO', 'SESQUI-HIDRATADO',
+    'UNDECILATO DE', 'DIPROPIONATO DE BETAMETASONA', 'CLORETO DE BENZALCONIO',
+]
+
+def expressao_sql_join_key(coluna):
+    """
+    Retorna a expressão SQL que transforma um nome bruto de princípio ativo na join_key:
+    maiúsculas sem acentos, sem os TERMOS_REMOVIDOS, com ' + ' padronizado e espaços únicos.
+    """
+    expr = f"upper(strip_accents(trim({coluna})))"
+    for termo in TERMOS_REMOVIDOS:
+        expr = f"trim(replace({expr}, '{termo}', ''))"
+    expr = rf"regexp_replace({expr}, '\s*\+\s*', ' + ', 'g')"
+    expr = rf"trim(regexp_replace({expr}, '\s+', ' ', 'g'))"
+    return expr
+
+# Identifica a versão das regras acima; entradas do dicionário de outra versão são recalculadas.
+VERSAO_NORMALIZACAO = hashlib.sha256(expressao_sql_join_key('x').encode('utf-8')).hexdigest()[:12]
+
+def atualizar_dicionario_principios(conexao, consulta_nomes):
+    """
+    Garante que todos os nomes retornados por `consulta_nomes` (um SELECT de uma coluna)
+    estejam no dicionário principio_ativo_raw -> join_key. A normalização roda apenas
+    sobre os nomes distintos ainda ausentes, não sobre as linhas da tabela de origem.
+    Retorna a quantidade de nomes novos.
+    """
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_DICIONARIO_PA} (
+        principio_ativo_raw VARCHAR PRIMARY KEY,
+        join_key VARCHAR,
+        versao VARCHAR
+    );
+    """)
+    conexao.execute(f"DELETE FROM {TABLE_DICIONARIO_PA} WHERE versao IS DISTINCT FROM ?", [VERSAO_NORMALIZACAO])
+    antes = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_DICIONARIO_PA}").fetchone()[0]
+    conexao.execute(f"""
+    INSERT INTO {TABLE_DICIONARIO_PA}
+    SELECT nome, {expressao_sql_join_key('nome')}, ?
+    FROM (SELECT DISTINCT nome FROM ({consulta_nomes}) AS origem(nome) WHERE nome IS NOT NULL)
+    WHERE nome NOT IN (SELECT principio_ativo_raw FROM {TABLE_DICIONARIO_PA});
+    """, [VERSAO_NORMALIZACAO])
+    return conexao.execute(f"SELECT COUNT(*) FROM {TABLE_DICIONARIO_PA}").fetchone()[0] - antes
+
+def aplicar_join_key(conexao, tabela, coluna='principio_ativo'):
+    """Preenche a coluna join_key de uma tabela de mapeamento a partir do dicionário compartilhado."""
+    atualizar_dicionario_principios(conexao, f"SELECT {coluna} FROM {tabela}")
+    conexao.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS join_key VARCHAR;")
+    conexao.execute(f"""
+    UPDATE {tabela} SET join_key = d.join_key
+    FROM {TABLE_DICIONARIO_PA} d
+    WHERE {tabela}.{coluna} = d.principio_ativo_raw;
+    """)
+
+def aplicar_datas_vigencia(conexao, tabela):
+    """
+    Cria as colunas DATE data_inclusao e data_exclusao a partir de inclusao_lista e
+    exclusao_lista (texto 'dd/mm/aaaa' ou 'mm/aaaa'). Cada linha do mapeamento é um
+    intervalo de vigência; uma substância pode ter vários.
+    """
+    colunas = {c[0] for c in conexao.execute(f"DESCRIBE {tabela}").fetchall()}
+    for coluna_texto, coluna_data in (('inclusao_lista', 'data_inclusao'), ('exclusao_lista', 'data_exclusao')):
+        conexao.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS {coluna_data} DATE;")
+        if coluna_texto in colunas:
+            texto = f"trim(CAST({coluna_texto} AS VARCHAR))"
+            conexao.execute(f"""
+            UPDATE {tabela} SET {coluna_data} = CAST(COALESCE(
+                try_strptime({texto}, '%d/%m/%Y'),
+                try_strptime({texto}, '%m/%Y')
+            ) AS DATE);
+            """)
+
+# Regras de forma farmacêutica sobre a descrição em maiúsculas: vale a primeira que casar
+# (a ordem importa: 'COM REV' antes de 'COMP'); sem nenhuma, FORMA_NAO_ESPECIFICADA.
+REGRAS_FORMA_FARMACEUTICA = [
+    ('COM REV|COMP REV', 'Comprimido Revestido'), ('COMP', 'Comprimido'), ('CAPS|CAP', 'Cápsula'),
+    ('SOL OR|SOL', 'Solução Oral'), ('GTS', 'Gotas'), ('XPE', 'Xarope'), ('CREM', 'Creme'),
+    ('POM', 'Pomada'), ('SUSP', 'Suspensão'), ('INJ', 'Injetável'),
+]
+FORMA_NAO_ESPECIFICADA = 'Não Especificada'
+UNIDADES_DOSAGEM = ['MG/ML', 'MG/G', 'MG', 'MCG', 'UI', 'G', 'ML']
+
+def expressao_sql_forma_farmaceutica(coluna):
+    """Retorna a expressão SQL (CASE) que classifica uma descrição de apresentação pela forma farmacêutica."""
+    casos = "\n".join(f"WHEN regexp_matches(upper({coluna}), '{regex}') THEN '{forma}'" for regex, forma in REGRAS_FORMA_FARMACEUTICA)
+    return f"CASE\n{casos}\nELSE '{FORMA_NAO_ESPECIFICADA}'\nEND"
+
+def expressao_sql_dosagem(coluna):
+    """Retorna a expressão SQL que extrai a dosagem ('10 MG', '2.5 MG/ML'...) de uma descrição de apresentação."""
+    return rf"regexp_extract({coluna}, '(\d+\.?\d*\s?(?:{'|'.join(UNIDADES_DOSAGEM)}))', 1)"
+
+# Versão das regras de apresentação; entradas de outra versão são reclassificadas.
+VERSAO_APRESENTACOES = hashlib.sha256(
+    (expressao_sql_forma_farmaceutica('x') + expressao_sql_dosagem('x')).encode('utf-8')
+).hexdigest()[:12]
+
+def atualizar_apresentacoes(conexao, consulta_descricoes):
+    """
+    Garante que todas as descrições retornadas por `consulta_descricoes` (um SELECT de uma
+    coluna) estejam na dimensão de apresentações, com forma farmacêutica, dosagem e dosagem
+    separada em valor e unidade. As expressões regulares rodam só sobre as descrições
+    distintas ainda ausentes. Retorna a quantidade de descrições novas.
+    """
+    conexao.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_APRESENTACOES} (
+        descricao_apresentacao VARCHAR PRIMARY KEY,
+        forma_farmaceutica VARCHAR,
+        dosagem VARCHAR,
+        dosagem_valor DOUBLE,
+        dosagem_unidade VARCHAR,
+        versao VARCHAR
+    );
+    """)
+    conexao.execute(f"DELETE FROM {TABLE_APRESENTACOES} WHERE versao IS DISTINCT FROM ?", [VERSAO_APRESENTACOES])
+    antes = conexao.execute(f"SELECT COUNT(*) FROM {TABLE_APRESENTACOES}").fetchone()[0]
+    conexao.execute(f"""
+    INSERT INTO {TABLE_APRESENTACOES}
+    SELECT
+        descricao,
+        {expressao_sql_forma_farmaceutica('descricao')},
+        dosagem,
+        try_cast(regexp_extract(dosagem, '^[0-9.]+') AS DOUBLE),
+        nullif(trim(regexp_replace(dosagem, '^[0-9.]+', '')), ''),
+        ?
+    FROM (
+        SELECT descricao, {expressao_sql_dosagem('descricao')} AS dosagem
+        FROM (SELECT DISTINCT descricao FROM ({consulta_descricoes}) AS origem(descricao) WHERE descricao IS NOT NULL)
+        WHERE descricao NOT IN (SELECT descricao_apresentacao FROM {TABLE_APRESENTACOES})
+    );
+    """, [VERSAO_APRESENTACOES])
+    return conexao.execute(f"SELECT COUNT(*) FROM {TABLE_APRESENTACOES}").fetchone()[0] - antes
@@ -0,0 +1,127 @@
+# src/utils/pool_cursores_utils.py
+# Pool limitado de cursores DuckDB para o dashboard. Cada cursor (conexao.cursor()) é uma
+# conexão própria sobre o mesmo banco em memória/arquivo: consultas de sessões diferentes do
+# Streamlit rodam em paralelo em vez de se enfileirarem em um único objeto de conexão.
+import queue
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+TIMEOUT_POOL_CURSORES_S = 60
+
+class PoolCursores:
+    """
+    Até `tamanho` cursores criados sob demanda a partir da conexão devolvida por `conectar()`.
+    `preparar(cursor)` roda em cada cursor novo (ex.: views temporárias, que são por conexão).
+    Antes de ser entregue, um cursor reaproveitado passa por um teste de saúde (SELECT 1) e é
+    trocado se falhar; se a própria conexão base caiu, ela é reaberta. Dentro de um bloco
+    `with pool.cursor()`, chamadas aninhadas na mesma thread recebem o mesmo cursor.
+    Depois de fechar(), os cursores ainda emprestados são fechados na devolução.
+    """
+
+    def __init__(self, conectar, tamanho, preparar=None, timeout_s=TIMEOUT_POOL_CURSORES_S):
+        self.tamanho = tamanho
+        self.timeout_s = timeout_s
+        self._conectar = conectar
+        self._preparar = preparar
+        self._conexao = None
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._emprestados = 0
+        self._fechado = False
+        self.cursores_criados = self.cursores_descartados = 0
+
+    def _novo_cursor(self):
+        with self._lock:
+            try:
+                if self._conexao is None:
+                    raise duckdb.ConnectionException("Conexão base ainda não aberta.")
+                cursor = self._conexao.cursor()
+            except duckdb.ConnectionException:
+                self._conexao = self._conectar()
+                cursor = self._conexao.cursor()
+            self.cursores_criados += 1
+        if self._preparar is not None:
+            self._preparar(cursor)
+        return cursor
+
+    @staticmethod
+    def _saudavel(cursor):
+        try:
+            return cursor.execute("SELECT 1").fetchone() == (1,)
+        except duckdb.Error:
+            return False
+
+    def _descartar(self, cursor):
+        self.cursores_descartados += 1
+        try:
+            cursor.close()
+        except duckdb.Error:
+            pass
+
+    def _devolver(self, cursor):
+        with self._lock:
+            self._emprestados -= 1
+            if not self._fechado:
+                self._livres.put(cursor)
+                return
+        self._descartar(cursor)
+        self._fechar_base_se_livre()
+
+    def _fechar_base_se_livre(self):
+        # Fechar a conexão base derruba os cursores dela: só depois que o último for devolvido
+        with self._lock:
+            if self._fechado and self._emprestados == 0 and self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
+
+    @contextmanager
+    def cursor(self):
+        """
+        Empresta um cursor saudável; espera até `timeout_s` por uma vaga e levanta TimeoutError.
+        Levanta RuntimeError se o pool já foi fechado.
+        """
+        if getattr(self._local, 'cursor', None) is not None:
+            yield self._local.cursor
+            return
+        if self._fechado:
+            raise RuntimeError("Pool de cursores já fechado.")
+        if not self._vagas.acquire(timeout=self.timeout_s):
+            raise TimeoutError(f"Nenhum cursor livre no pool ({self.tamanho}) após {self.timeout_s}s.")
+        cursor = None
+        try:
+            try:
+                cursor = self._livres.get_nowait()
+            except queue.Empty:
+                pass
+            if cursor is not None and not self._saudavel(cursor):
+                self._descartar(cursor)
+                cursor = None
+            if cursor is None:
+                cursor = self._novo_cursor()
+            with self._lock:
+                self._emprestados += 1
+            self._local.cursor = cursor
+            yield cursor
+        finally:
+            self._local.cursor = None
+            if cursor is not None:
+                self._devolver(cursor)
+            self._vagas.release()
+
+    def fechar(self):
+        """
+        Fecha os cursores livres e a conexão base. Se há cursores emprestados, a conexão base
+        só é fechada quando o último deles for devolvido.
+        """
+        with self._lock:
+            self._fechado = True
+            livres = []
+            while not self._livres.empty():
+                livres.append(self._livres.get_nowait())
+        for cursor in livres:
+            self._descartar(cursor)
+        self._fechar_base_se_livre()
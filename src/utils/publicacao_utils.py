@@ -0,0 +1,152 @@
+# src/utils/publicacao_utils.py
+# Publicação blue/green do banco: cópia validada em um arquivo versionado + troca atômica do ponteiro.
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+from .database_utils import TABLE_NAME, VERSOES_DIR_PATH, ARQUIVO_VERSAO_PUBLICADA, ler_versao_publicada
+
+PREFIXO_VERSAO = "sngpc_analytics_"
+# Versões mantidas em disco além da publicada (leitores ainda abertos na anterior continuam funcionando)
+VERSOES_ANTERIORES_MANTIDAS = 1
+
+def _tabelas(conexao, banco):
+    return [nome for (nome,) in conexao.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE database_name = ? AND NOT temporary", [banco]
+    ).fetchall()]
+
+def validar_versao(caminho, tabelas_esperadas, tabelas_obrigatorias=(TABLE_NAME,)):
+    """
+    Confere a cópia antes de publicá-la: as tabelas obrigatórias existem e não estão vazias,
+    e cada tabela esperada (nome -> linhas) tem a mesma contagem na cópia. Lança ValueError.
+    """
+    conexao = duckdb.connect(str(caminho), read_only=True)
+    try:
+        tabelas = {nome for (nome,) in conexao.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+        for tabela in tabelas_obrigatorias:
+            if tabela not in tabelas or conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0] == 0:
+                raise ValueError(f"Tabela obrigatória '{tabela}' ausente ou vazia na nova versão.")
+        for tabela, linhas in tabelas_esperadas.items():
+            linhas_copia = conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0] if tabela in tabelas else None
+            if linhas_copia != linhas:
+                raise ValueError(f"Tabela '{tabela}' com {linhas_copia} linhas na nova versão (esperado: {linhas}).")
+    finally:
+        conexao.close()
+
+def trocar_ponteiro(pasta_versoes, arquivo, **metadados):
+    """Aponta a versão publicada para `arquivo`; o JSON é escrito ao lado e trocado com os.replace (atômico)."""
+    ponteiro = Path(pasta_versoes) / ARQUIVO_VERSAO_PUBLICADA
+    temporario = ponteiro.with_suffix('.tmp')
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump({'arquivo': arquivo, 'publicado_em': datetime.now().isoformat(timespec='seconds'), **metadados},
+                  f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temporario, ponteiro)
+
+def remover_versoes_antigas(pasta_versoes, manter=VERSOES_ANTERIORES_MANTIDAS):
+    """Apaga as versões mais antigas, preservando a publicada e as `manter` anteriores a ela."""
+    publicada = (ler_versao_publicada(pasta_versoes) or {}).get('arquivo')
+    versoes = sorted(Path(pasta_versoes).glob(f"{PREFIXO_VERSAO}*.duckdb"), reverse=True)
+    anteriores = [v for v in versoes if v.name != publicada]
+    removidas = []
+    for versao in anteriores[manter:]:
+        try:
+            versao.unlink()
+            Path(f"{versao}.wal").unlink(missing_ok=True)
+            removidas.append(versao.name)
+        except OSError:
+            pass  # ainda aberta por algum leitor (Windows); fica para a próxima publicação
+    return removidas
+
+def assinaturas_tabelas(conexao, banco, marcas=None):
+    """
+    {tabela: [linhas, marca]} de cada tabela do banco; é o que decide o que precisa ser publicado.
+    As tabelas de `marcas` (tabela -> texto que muda sempre que o conteúdo muda, como o fingerprint
+    das etapas do ETL que a gravaram) só têm as linhas contadas. As demais são lidas por inteiro
+    e a marca é a soma dos hashes das linhas.
+    """
+    marcas = marcas or {}
+    assinaturas = {}
+    for tabela in _tabelas(conexao, banco):
+        if tabela in marcas:
+            total = conexao.execute(f"SELECT COUNT(*) FROM {banco}.{tabela}").fetchone()[0]
+            assinaturas[tabela] = [total, f"marca:{marcas[tabela]}"]
+        else:
+            total, soma_hash = conexao.execute(f"SELECT COUNT(*), sum(hash(t)) FROM {banco}.{tabela} t").fetchone()
+            assinaturas[tabela] = [total, str(soma_hash)]
+    return assinaturas
+
+def _copiar_tabelas(conexao, banco, destino, tabelas, removidas):
+    """
+    Regrava em `destino` (já anexado) só as tabelas alteradas, recriadas com o DDL da origem
+    (restrições e ENUMs) e os seus índices, e remove as que deixaram de existir.
+    """
+    conexao.execute(f"USE {destino};")
+    try:
+        for tabela in removidas:
+            conexao.execute(f"DROP TABLE IF EXISTS {tabela};")
+        for tabela in tabelas:
+            ddl = conexao.execute("SELECT sql FROM duckdb_tables() WHERE database_name = ? AND table_name = ?", [banco, tabela]).fetchone()[0]
+            indices = [sql for (sql,) in conexao.execute(
+                "SELECT sql FROM duckdb_indexes() WHERE database_name = ? AND table_name = ? AND sql IS NOT NULL", [banco, tabela]
+            ).fetchall()]
+            conexao.execute(f"DROP TABLE IF EXISTS {tabela};")
+            conexao.execute(ddl)
+            conexao.execute(f"INSERT INTO {destino}.{tabela} SELECT * FROM {banco}.{tabela};")
+            for sql in indices:
+                conexao.execute(sql)
+    finally:
+        conexao.execute(f"USE {banco};")
+    conexao.execute(f"CHECKPOINT {destino};")
+
+def publicar_versao(conexao, pasta_versoes=VERSOES_DIR_PATH, ignorar_na_comparacao=(), marcas=None, **metadados):
+    """
+    Grava um novo arquivo versionado em pasta_versoes com o conteúdo do banco da conexão,
+    valida a cópia e só então troca o ponteiro da versão publicada. Se algo falhar, o arquivo
+    novo é apagado e a versão publicada continua a mesma.
+
+    As assinaturas das tabelas (assinaturas_tabelas) ficam no ponteiro. Se nenhuma tabela mudou
+    desde a versão publicada (as de `ignorar_na_comparacao`, como o registro de execuções, não
+    contam), nada é gravado e o retorno é None. `marcas` evita ler as tabelas grandes
+    (ver assinaturas_tabelas). Senão a nova versão parte de uma cópia do arquivo
+    publicado (cópia de arquivo, sem recodificar) e só as tabelas alteradas são regravadas; sem
+    versão anterior com assinaturas, o banco inteiro é copiado (COPY FROM DATABASE).
+    Retorna o caminho da nova versão.
+    """
+    pasta_versoes = Path(pasta_versoes)
+    pasta_versoes.mkdir(parents=True, exist_ok=True)
+    banco = conexao.execute("SELECT current_database()").fetchone()[0]
+    assinaturas = assinaturas_tabelas(conexao, banco, marcas)
+    publicada = ler_versao_publicada(pasta_versoes)
+    anteriores = (publicada or {}).get('assinaturas')
+    if anteriores is not None:
+        def relevantes(a):
+            return {t: v for t, v in a.items() if t not in ignorar_na_comparacao}
+        if relevantes(anteriores) == relevantes(assinaturas):
+            return None
+    destino = pasta_versoes / f"{PREFIXO_VERSAO}{datetime.now():%Y%m%d_%H%M%S_%f}.duckdb"
+    try:
+        if anteriores is not None:
+            shutil.copyfile(pasta_versoes / publicada['arquivo'], destino)
+            alteradas = [t for t, v in assinaturas.items() if anteriores.get(t) != v]
+            removidas = [t for t in anteriores if t not in assinaturas]
+        else:
+            alteradas, removidas = list(assinaturas), []
+        conexao.execute(f"ATTACH '{destino.as_posix()}' AS versao_nova;")
+        try:
+            if anteriores is not None:
+                _copiar_tabelas(conexao, banco, 'versao_nova', alteradas, removidas)
+            else:
+                conexao.execute(f"COPY FROM DATABASE {banco} TO versao_nova;")
+        finally:
+            conexao.execute("DETACH versao_nova;")
+        validar_versao(destino, {tabela: linhas for tabela, (linhas, _) in assinaturas.items()})
+    except Exception:
+        for arquivo in (destino, Path(f"{destino}.wal")):
+            arquivo.unlink(missing_ok=True)
+        raise
+    trocar_ponteiro(pasta_versoes, destino.name, tabelas_gravadas=alteradas, assinaturas=assinaturas, **metadados)
+    return destino
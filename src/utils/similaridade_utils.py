@@ -0,0 +1,55 @@
+# src/utils/similaridade_utils.py
+# Sugestão de correspondências aproximadas entre nomes (ex.: princípios ativos sem mapeamento x
+# entradas das tabelas de mapeamento) por n-gramas de caracteres, calculada no DuckDB.
+TAMANHO_NGRAMA = 3
+TOP_K_SUGESTOES = 3
+SCORE_MINIMO_SUGESTAO = 0.3
+
+def expressao_sql_ngramas(coluna, n=TAMANHO_NGRAMA):
+    """
+    Expressão SQL com a lista dos n-gramas distintos de caracteres de `coluna`. O texto ganha
+    n-1 espaços no início e um no fim, para que prefixos e sufixos também formem n-gramas.
+    """
+    texto = f"('{' ' * (n - 1)}' || {coluna} || ' ')"
+    return f"list_distinct(list_transform(range(1, length({texto}) - {n - 2}), i -> substr({texto}, i, {n})))"
+
+def sugerir_correspondencias(conexao, consulta_nomes, consulta_candidatos, top_k=TOP_K_SUGESTOES,
+                             score_minimo=SCORE_MINIMO_SUGESTAO, n=TAMANHO_NGRAMA):
+    """
+    Para cada nome de `consulta_nomes` (SELECT de uma coluna), retorna até `top_k` candidatos
+    de `consulta_candidatos` (idem) ordenados pelo coeficiente de Dice entre os conjuntos de
+    n-gramas (2 * comuns / (n-gramas do nome + n-gramas do candidato)), com score >= score_minimo.
+
+    Os candidatos são indexados por n-grama (índice invertido) e só os pares que compartilham
+    pelo menos um n-grama são pontuados, em vez de comparar todos os pares.
+    Retorna um DataFrame com nome, candidato, score, cobertura (fração dos n-gramas do
+    candidato presentes no nome; alta quando o nome só tem um sal ou prefixo a mais) e
+    posicao (1 = melhor).
+    """
+    return conexao.execute(f"""
+    WITH nomes AS (
+        SELECT DISTINCT nome FROM ({consulta_nomes}) AS origem(nome) WHERE nome IS NOT NULL AND trim(nome) <> ''
+    ), candidatos AS (
+        SELECT DISTINCT candidato FROM ({consulta_candidatos}) AS origem(candidato) WHERE candidato IS NOT NULL AND trim(candidato) <> ''
+    ), ngramas_nomes AS (
+        SELECT nome, unnest({expressao_sql_ngramas('nome', n)}) AS ngrama FROM nomes
+    ), indice AS (
+        SELECT candidato, unnest({expressao_sql_ngramas('candidato', n)}) AS ngrama FROM candidatos
+    ), totais_nomes AS (
+        SELECT nome, COUNT(*) AS total FROM ngramas_nomes GROUP BY nome
+    ), totais_candidatos AS (
+        SELECT candidato, COUNT(*) AS total FROM indice GROUP BY candidato
+    ), comuns AS (
+        SELECT nn.nome, i.candidato, COUNT(*) AS comuns
+        FROM ngramas_nomes nn JOIN indice i ON nn.ngrama = i.ngrama
+        GROUP BY nn.nome, i.candidato
+    )
+    SELECT c.nome, c.candidato, 2.0 * c.comuns / (tn.total + tc.total) AS score, c.comuns / tc.total AS cobertura,
+           row_number() OVER (PARTITION BY c.nome ORDER BY 2.0 * c.comuns / (tn.total + tc.total) DESC, c.candidato) AS posicao
+    FROM comuns c
+    JOIN totais_nomes tn ON c.nome = tn.nome
+    JOIN totais_candidatos tc ON c.candidato = tc.candidato
+    WHERE 2.0 * c.comuns / (tn.total + tc.total) >= ?
+    QUALIFY posicao <= ?
+    ORDER BY c.nome, posicao
+    """, [score_minimo, top_k]).fetchdf()
@@ -1,22 +1,474 @@
 import pytest
 import duckdb
+from datetime import date
 from pathlib import Path
 from scripts.etl import executar_pipeline_etl_sql
 from src.utils.database_utils import get_db_connection_for_etl
 
+# Linhas acrescentadas ao segundo CSV do banco_etl: mês inválido, UF e idade inválidas, uma válida e uma sem UF
+LINHAS_VALIDACAO = [
+    "2020,13,SP,3550308,ZOLPIDEM,COMPRIMIDO,1,CAIXA,CRM,SP,1,,1,40,1",
+    "2020,2,XX,3550308,ZOLPIDEM,COMPRIMIDO,1,CAIXA,CRM,SP,1,,1,abc,1",
+    "2020,2,SP,3550308,ZOLPIDEM,COMPRIMIDO,1,CAIXA,CRM,SP,1,,1,40,1",
+    "2020,2, ,3550308,ZOLPIDEM,COMPRIMIDO,1,CAIXA,CRM,SP,1,,1,40,1",
+]
+
+@pytest.fixture(scope="module")
+def banco_etl(tmp_path_factory):
+    """
+    Banco do ETL sobre 600 mil linhas sintéticas (mais LINHAS_VALIDACAO), construído uma vez
+    para o módulo com o perfil de recursos 'ci' (1 GB). Os testes o abrem em modo read-only.
+    """
+    from src.utils.database_utils import configurar_recursos
+    from src.utils.dados_sinteticos_utils import gerar_csvs_sngpc, criar_mapeamentos_sinteticos
+
+    pasta = tmp_path_factory.mktemp("banco_etl")
+    arquivos = gerar_csvs_sngpc(pasta / "dados", linhas=600_000)
+    with open(arquivos[1], encoding='latin-1') as f:
+        registros_arquivo = sum(1 for _ in f) - 1
+    with open(arquivos[1], 'a', encoding='latin-1') as f:
+        f.write("".join(linha + "\n" for linha in LINHAS_VALIDACAO))
+    conexao = duckdb.connect(str(pasta / "teste.duckdb"))
+    try:
+        configurar_recursos(conexao, 'ci', temp_directory=pasta / "duckdb_tmp")
+        memory_limit = conexao.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+        criar_mapeamentos_sinteticos(conexao)
+        assert executar_pipeline_etl_sql(conexao, pasta / "dados", relatorio_dir=pasta / "relatorios")
+    finally:
+        conexao.close()
+    return {'banco': pasta / "teste.duckdb", 'relatorios': pasta / "relatorios", 'memory_limit': memory_limit,
+            'arquivo_validacao': arquivos[1], 'registros_arquivo_validacao': registros_arquivo}
+
 def test_etl_pipeline_runs(tmp_path):
-    # Setup: cria um banco temporário e pasta de dados
+    from src.utils.dados_sinteticos_utils import gerar_csvs_sngpc, criar_mapeamentos_sinteticos
+
+    # Setup: banco temporário e CSVs sintéticos (latin1, um por mês) com os mapeamentos correspondentes
     db_path = tmp_path / "test.duckdb"
     dados_path = tmp_path / "dados"
-    dados_path.mkdir()
-    # (Opcional: copie um CSV de exemplo para dados_path)
+    arquivos = gerar_csvs_sngpc(dados_path, linhas=5_000, semente=7)
+    assert gerar_csvs_sngpc(tmp_path / "dados_2", linhas=5_000, semente=7)[0].read_bytes() == arquivos[0].read_bytes()
+    assert "ÁCIDO VALPRÓICO".encode('latin-1') in b"".join(a.read_bytes() for a in arquivos)
 
     # Executa o pipeline
     conexao = duckdb.connect(str(db_path))
     try:
-        executar_pipeline_etl_sql(conexao, dados_path)
-        # Verifica se a tabela final foi criada
-        tabelas = conexao.execute("SHOW TABLES").fetchall()
-        assert any("prescricoes" in t for t in [x[0] for x in tabelas])
+        criar_mapeamentos_sinteticos(conexao)
+        assert executar_pipeline_etl_sql(conexao, dados_path, relatorio_dir=tmp_path / "relatorios", pasta_versoes=tmp_path / "versoes")
+        # A versão publicada já traz o perfil das colunas desta carga (etapa 'perfil', antes da publicação)
+        with duckdb.connect(str(next((tmp_path / "versoes").glob("*.duckdb"))), read_only=True) as publicado:
+            assert publicado.execute("SELECT COUNT(*) FROM perfil_colunas WHERE versao = 1 AND coluna = 'idade'").fetchone()[0] == 1
+        # As tabelas grandes entram na comparação pela marca do registro de etapas, sem hash das linhas
+        from src.utils.database_utils import ler_versao_publicada
+        assinaturas = ler_versao_publicada(tmp_path / "versoes")['assinaturas']
+        assert assinaturas['prescricoes'][1].startswith("marca:") and assinaturas['prescricoes_agregado'][1].startswith("marca:")
+        assert not assinaturas['mapeamento_controlados'][1].startswith("marca:")
+        # Verifica se a tabela final foi criada com todas as linhas válidas e os mapeamentos aplicados;
+        # as quantidades 'NA' do gerador vão para a quarentena
+        assert conexao.execute("SELECT (SELECT COUNT(*) FROM prescricoes) + (SELECT COUNT(*) FROM prescricoes_rejeitadas)").fetchone()[0] == 5_000
+        assert conexao.execute("SELECT DISTINCT motivo, quantidade_vendida FROM prescricoes_rejeitadas").fetchall() == [('quantidade_nao_numerica', 'NA')]
+        assert conexao.execute("SELECT COUNT(*) FROM prescricoes WHERE principio_ativo = 'SERTRALINA' AND anvisa_lista = 'C1'").fetchone()[0] > 0
+    finally:
+        conexao.close()
+
+def test_comparar_relatorios_instrumentacao(tmp_path):
+    from src.utils.instrumentacao_utils import medir_etapa, salvar_relatorio, comparar_relatorios
+
+    conexao = duckdb.connect()
+    registros_a, registros_b = [], []
+    with medir_etapa(conexao, registros_a, 'carga', tabelas_saida=['t']):
+        conexao.execute("CREATE TABLE t AS SELECT range AS x FROM range(10)")
+    with medir_etapa(conexao, registros_b, 'carga', tabelas_saida=['t']):
+        conexao.execute("INSERT INTO t SELECT range FROM range(10)")
+    conexao.close()
+
+    caminho_a = salvar_relatorio(registros_a, 'a', tmp_path)
+    caminho_b = salvar_relatorio(registros_b, 'b', tmp_path)
+    comparacao = comparar_relatorios(caminho_a, caminho_b.with_suffix('.parquet'))
+    linha = comparacao.set_index('etapa').loc['carga']
+    assert (linha['linhas_saida_a'], linha['linhas_saida_b']) == (10, 20)
+    assert linha['linhas_saida_var_pct'] == 100
+
+
+def test_exportacao_parquet_particionada(tmp_path):
+    from scripts.etl import exportar_prescricoes_parquet
+    from src.utils.database_utils import criar_view_prescricoes_parquet
+
+    conexao = duckdb.connect()
+    conexao.execute("""
+        CREATE TABLE prescricoes AS
+        SELECT 2019 + range % 2 AS ano, 1 + range % 12 AS mes, ['SP', 'RJ'][1 + range % 2] AS sigla_uf, range AS quantidade_vendida
+        FROM range(240)
+    """)
+    exportar_prescricoes_parquet(conexao, tmp_path / "parquet")
+    criar_view_prescricoes_parquet(conexao, tmp_path / "parquet", nome_view="prescricoes_parquet")
+
+    assert (tmp_path / "parquet" / "ano=2019" / "mes=1" / "sigla_uf=SP").is_dir()
+    diferenca = conexao.execute("SELECT COUNT(*) FROM (SELECT * FROM prescricoes EXCEPT ALL SELECT * FROM prescricoes_parquet)").fetchone()[0]
+    assert diferenca == 0
+    plano = conexao.execute("EXPLAIN ANALYZE SELECT COUNT(*) FROM prescricoes_parquet WHERE ano = 2019 AND mes = 3").fetchall()[0][1]
+    assert "Scanning Files: 1/" in plano
+    conexao.close()
+
+
+def test_etapa_indices_segue_layout():
+    from scripts.etl import _etapa_indices, COLUNAS_INDICES, INDICES_LAYOUT_ORDENADO
+
+    conexao = duckdb.connect()
+    conexao.execute(f"CREATE TABLE prescricoes AS SELECT range AS {', range AS '.join(COLUNAS_INDICES)} FROM range(10)")
+    _etapa_indices(conexao, {'layout': 'indices'})
+    assert conexao.execute("SELECT COUNT(*) FROM duckdb_indexes()").fetchone()[0] == len(COLUNAS_INDICES)
+    _etapa_indices(conexao, {'layout': 'ordenado'})
+    assert conexao.execute("SELECT COUNT(*) FROM duckdb_indexes()").fetchone()[0] == len(INDICES_LAYOUT_ORDENADO)
+    conexao.close()
+
+
+def test_apresentacoes_classificadas_uma_vez_por_descricao():
+    from src.utils.normalizacao_utils import atualizar_apresentacoes
+
+    conexao = duckdb.connect()
+    conexao.execute("CREATE TABLE raw AS SELECT * FROM (VALUES ('CLONAZEPAM 2,5 MG/ML SOL OR CT FR GOT'), ('ALPRAZOLAM 0.5 MG COM REV'), ('ALPRAZOLAM 0.5 MG COM REV'), (NULL)) t(d)")
+    assert atualizar_apresentacoes(conexao, "SELECT d FROM raw") == 2
+    assert atualizar_apresentacoes(conexao, "SELECT d FROM raw") == 0
+    linha = conexao.execute("SELECT forma_farmaceutica, dosagem, dosagem_valor, dosagem_unidade FROM apresentacoes WHERE descricao_apresentacao LIKE 'ALPRAZOLAM%'").fetchone()
+    assert linha == ('Comprimido Revestido', '0.5 MG', 0.5, 'MG')
+    conexao.close()
+
+
+def test_etl_completo_com_limite_de_1gb(banco_etl):
+    assert banco_etl['memory_limit'] == '953.6 MiB'
+    with duckdb.connect(str(banco_etl['banco']), read_only=True) as conexao:
+        total = conexao.execute("SELECT (SELECT COUNT(*) FROM prescricoes) + (SELECT COUNT(*) FROM prescricoes_rejeitadas)").fetchone()[0]
+    assert total == 600_000 + len(LINHAS_VALIDACAO)
+
+
+def test_publicacao_blue_green(tmp_path):
+    from src.utils.database_utils import caminho_banco_publicado, ler_versao_publicada
+    from src.utils.publicacao_utils import publicar_versao
+
+    conexao = duckdb.connect()
+    conexao.execute("CREATE TABLE prescricoes AS SELECT range AS x FROM range(5)")
+    primeira = publicar_versao(conexao, tmp_path)
+    assert caminho_banco_publicado(tmp_path) == primeira
+
+    # Uma versão que não passa na validação nunca vira a publicada
+    conexao.execute("DELETE FROM prescricoes")
+    with pytest.raises(ValueError):
+        publicar_versao(conexao, tmp_path)
+    assert caminho_banco_publicado(tmp_path) == primeira
+    assert len(list(tmp_path.glob("*.duckdb"))) == 1
+
+    # Nada mudou: nenhuma versão nova. Mudou uma tabela: só ela é regravada sobre a cópia da anterior
+    conexao.execute("INSERT INTO prescricoes SELECT range FROM range(5)")
+    conexao.execute("CREATE TABLE etl_runs AS SELECT 1 AS run_id")
+    conexao.execute("CREATE TABLE mapeamento AS SELECT 'a' AS chave")
+    conexao.execute("CREATE INDEX idx_x ON prescricoes (x)")
+    segunda = publicar_versao(conexao, tmp_path, ignorar_na_comparacao=('etl_runs',))
+    conexao.execute("INSERT INTO etl_runs VALUES (2)")
+    assert publicar_versao(conexao, tmp_path, ignorar_na_comparacao=('etl_runs',)) is None
+    conexao.execute("INSERT INTO prescricoes VALUES (99)")
+    conexao.execute("DROP TABLE mapeamento")
+    terceira = publicar_versao(conexao, tmp_path, ignorar_na_comparacao=('etl_runs',))
+    assert caminho_banco_publicado(tmp_path) == terceira != segunda
+    assert sorted(ler_versao_publicada(tmp_path)['tabelas_gravadas']) == ['etl_runs', 'prescricoes']
+    with duckdb.connect(str(terceira), read_only=True) as publicado:
+        assert publicado.execute("SELECT COUNT(*), max(x) FROM prescricoes").fetchone() == (6, 99)
+        assert publicado.execute("SELECT max(run_id) FROM etl_runs").fetchone()[0] == 2
+        assert publicado.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'mapeamento'").fetchone()[0] == 0
+        assert publicado.execute("SELECT COUNT(*) FROM duckdb_indexes() WHERE index_name = 'idx_x'").fetchone()[0] == 1
+    conexao.close()
+
+
+def test_perfil_colunas_versionado_com_diff():
+    from scripts.auditoria_etl_bd import perfilar_colunas, salvar_perfil, carregar_perfil, comparar_perfis
+
+    conexao = duckdb.connect()
+    conexao.execute("CREATE TABLE prescricoes AS SELECT range % 10 AS idade, ['SP', 'RJ'][1 + range % 2] AS sigla_uf FROM range(100)")
+    perfil = perfilar_colunas(conexao, 'prescricoes').set_index('coluna')
+    assert perfil.loc['idade', 'preenchidos'] == 100 and perfil.loc['idade', 'maximo'] == '9'
+    assert sorted(perfil.loc['sigla_uf', 'top_valores']) == ['RJ', 'SP']
+    assert salvar_perfil(conexao, 'prescricoes', perfil.reset_index()) == 1
+
+    conexao.execute("UPDATE prescricoes SET idade = NULL WHERE idade < 5")
+    assert salvar_perfil(conexao, 'prescricoes', perfilar_colunas(conexao, 'prescricoes')) == 2
+    diff = comparar_perfis(carregar_perfil(conexao, 'prescricoes', 1), carregar_perfil(conexao, 'prescricoes', 2)).set_index('coluna')
+    assert diff.loc['idade', 'variacao_preenchimento_pp'] == -50
+    assert diff.loc['idade', 'alerta'] and not diff.loc['sigla_uf', 'alerta']
+
+    # Só a faixa (máximo) muda: também é sinalizado
+    conexao.execute("UPDATE prescricoes SET idade = 50 WHERE idade = 9")
+    assert salvar_perfil(conexao, 'prescricoes', perfilar_colunas(conexao, 'prescricoes')) == 3
+    diff = comparar_perfis(carregar_perfil(conexao, 'prescricoes', 2), carregar_perfil(conexao, 'prescricoes', 3)).set_index('coluna')
+    assert diff.loc['idade', 'faixa_alterada'] and diff.loc['idade', 'alerta']
+    assert abs(diff.loc['idade', 'variacao_preenchimento_pp']) == 0 and not diff.loc['sigla_uf', 'alerta']
+    conexao.close()
+
+
+def test_atualizar_mapeamentos_transacional_e_por_hash(tmp_path):
+    from src.utils.mapeamentos_utils import atualizar_mapeamentos
+
+    (tmp_path / "mapeamento_Controlados.csv").write_text("Principio Ativo,lista,inclusao_lista,exclusao_lista\nCloridrato de Sertralina,C1,01/05/1998,\n", encoding='utf-8')
+    (tmp_path / "mapeamento_atc.csv").write_text("principio_ativo,codigo_atc,classe_terapeutica\nCLONAZEPAM,N03AE01,Antiepiléptico\n", encoding='utf-8')
+    (tmp_path / "mapeamento_municipios.csv").write_text("id_municipio,nome_municipio\n3550308,São Paulo\n", encoding='utf-8')
+    conexao = duckdb.connect()
+    assert len(atualizar_mapeamentos(conexao, tmp_path)) == 3
+    assert conexao.execute("SELECT join_key, data_inclusao FROM mapeamento_controlados").fetchone() == ('SERTRALINA', date(1998, 5, 1))
+    assert conexao.execute("SELECT typeof(id_municipio) FROM mapeamento_municipios").fetchone()[0] == 'VARCHAR'
+    assert atualizar_mapeamentos(conexao, tmp_path) == []
+
+    # Um CSV inválido desfaz a carga inteira, inclusive a dos arquivos válidos
+    (tmp_path / "mapeamento_Controlados.csv").write_text("principio_ativo,lista,inclusao_lista,exclusao_lista\nZOLPIDEM,B1,01/05/1998,\n", encoding='utf-8')
+    (tmp_path / "mapeamento_atc.csv").write_text("codigo_atc\nN03AE01\n", encoding='utf-8')
+    with pytest.raises(duckdb.Error):
+        atualizar_mapeamentos(conexao, tmp_path)
+    assert conexao.execute("SELECT join_key FROM mapeamento_controlados").fetchall() == [('SERTRALINA',)]
+    conexao.close()
+
+
+def test_sugestoes_por_ngramas():
+    from src.utils.similaridade_utils import sugerir_correspondencias
+
+    conexao = duckdb.connect()
+    conexao.execute("CREATE TABLE nao_mapeados AS SELECT * FROM (VALUES ('DE SERTRALINA'), ('ZOLPIDEN'), ('XYZ')) t(nome)")
+    conexao.execute("CREATE TABLE mapeamento AS SELECT * FROM (VALUES ('SERTRALINA'), ('ZOLPIDEM'), ('ALPRAZOLAM')) t(join_key)")
+    sugestoes = sugerir_correspondencias(conexao, "SELECT nome FROM nao_mapeados", "SELECT join_key FROM mapeamento")
+    melhores = sugestoes[sugestoes['posicao'] == 1].set_index('nome')
+    assert melhores.loc['DE SERTRALINA', 'candidato'] == 'SERTRALINA' and melhores.loc['ZOLPIDEN', 'candidato'] == 'ZOLPIDEM'
+    assert 'XYZ' not in melhores.index
+    assert (sugestoes['score'].between(0.3, 1)).all()
+    conexao.close()
+
+
+def test_webscrap_replay_e_cache_por_etag(tmp_path):
+    pytest.importorskip("bs4")
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from scripts.webscrap_SNGPC import executar_scraping, URL_P344_1998, URL_RDC20_2011, RDCS_INFO
+    from src.utils.http_cache_utils import salvar_cache, buscar_html
+
+    def pagina(linhas):
+        return "<html><body><div id='texto-norma'>" + "".join(f"<p>{l}</p>" for l in linhas) + "</div></body></html>"
+
+    # Replay offline: P344 (B1), uma RDC que inclui e exclui, e a RDC 20/2011
+    salvar_cache(tmp_path, URL_P344_1998, pagina(["ANEXO I", "LISTAS DE SUBSTÂNCIAS SUBMETIDAS A CONTROLE ESPECIAL",
+                                                  'LISTA "B1"', "LISTA DAS SUBSTÂNCIAS PSICOTRÓPICAS", "1. ALPRAZOLAM", "2. ZOLPIDEM", "ANEXO II"]))
+    salvar_cache(tmp_path, RDCS_INFO[1]['url'], pagina(['LISTA "B1"', "INCLUSÃO:", "1. ESCETAMINA", "EXCLUSÃO:", "1. ZOLPIDEM", "Art. 2º"]))
+    salvar_cache(tmp_path, URL_RDC20_2011, pagina(["ANEXO I", "LISTA DE ANTIMICROBIANOS SUJEITOS AO CONTROLE DA LEI Nº 5.991/1973",
+                                                   "AMOXICILINA", "AMOXICILINA"]))
+    df = executar_scraping('replay', tmp_path, nome_arquivo=None).set_index(['principio_ativo', 'lista'])
+    assert df.loc[('ZOLPIDEM', 'B1'), 'mes_ano_exclusao'] == '03/2020'
+    assert df.loc[('ESCETAMINA', 'B1'), 'mes_ano_inclusao'] == '03/2020'
+    assert len(df.loc[[('AMOXICILINA', 'ANTIMICROBIANOS')]]) == 1
+
+    # Rede: a segunda busca envia o ETag salvo e o 304 reaproveita o cache
+    requisicoes = []
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requisicoes.append(self.headers.get('If-None-Match'))
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            corpo = pagina(["ORIGINAL"]).encode('utf-8')
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{servidor.server_port}/norma"
+        cache = tmp_path / "cache"
+        assert "ORIGINAL" in buscar_html(url, cache)
+        assert "ORIGINAL" in buscar_html(url, cache)
+        assert requisicoes == [None, '"v1"']
+    finally:
+        servidor.shutdown()
+
+
+def test_migracao_csv_tipada_com_rejeitadas(banco_etl, tmp_path):
+    from scripts.migrar_csv_DB import migrar_csv, TABLE_REJEITADAS_MIGRACAO
+
+    # CSV processado exportado de uma execução do ETL, com duas linhas corrompidas no fim
+    csv = tmp_path / "dados_processados.csv"
+    with duckdb.connect(str(banco_etl['banco']), read_only=True) as origem:
+        origem.execute(f"COPY prescricoes TO '{csv.as_posix()}' (HEADER, DELIMITER ',')")
+        schema_etl = origem.execute("DESCRIBE prescricoes").fetchall()
+        total_etl = origem.execute("SELECT COUNT(*) FROM prescricoes").fetchone()[0]
+    with open(csv, encoding='utf-8') as f:
+        f.readline()
+        linha_valida = f.readline().rstrip("\n").split(',')
+    with open(csv, 'a', encoding='utf-8') as f:
+        f.write(",".join(['20x0'] + linha_valida[1:]) + "\n")
+        f.write(",".join(linha_valida[:12] + ['idade?'] + linha_valida[13:]) + "\n")
+
+    conexao = duckdb.connect(str(tmp_path / "migrado.duckdb"))
+    resultado = migrar_csv(conexao, csv)
+    assert resultado == {'linhas': total_etl, 'linhas_rejeitadas': 2}
+    assert [c[:2] for c in conexao.execute("DESCRIBE prescricoes").fetchall()] == [c[:2] for c in schema_etl]
+    assert sorted(conexao.execute(f"SELECT linha, coluna FROM {TABLE_REJEITADAS_MIGRACAO}").fetchall()) == [(total_etl + 2, 'ano'), (total_etl + 3, 'idade')]
+    assert migrar_csv(conexao, csv) is None
+    conexao.close()
+
+
+def test_validacao_na_carga_vai_para_quarentena(banco_etl):
+    from src.utils.instrumentacao_utils import carregar_relatorio
+
+    # LINHAS_VALIDACAO foram acrescentadas depois dos registros gerados no arquivo
+    primeiro = banco_etl['registros_arquivo_validacao'] + 1
+    with duckdb.connect(str(banco_etl['banco']), read_only=True) as conexao:
+        rejeitadas = conexao.execute(
+            "SELECT registro, motivo FROM prescricoes_rejeitadas WHERE arquivo_origem = ? AND quantidade_vendida <> 'NA' ORDER BY registro",
+            [str(banco_etl['arquivo_validacao'].resolve())]).fetchall()
+        assert rejeitadas == [(primeiro, 'periodo_invalido'), (primeiro + 1, 'uf_desconhecida; idade_invalida')]
+        # UF ausente (último registro) não é motivo de rejeição: a linha entra em 'prescricoes' com UF nula
+        assert conexao.execute("SELECT COUNT(*) FROM prescricoes WHERE sigla_uf IS NULL").fetchone()[0] >= 1
+        total_rejeitadas = conexao.execute("SELECT COUNT(*) FROM prescricoes_rejeitadas").fetchone()[0]
+    carga = carregar_relatorio(next(banco_etl['relatorios'].glob("*.json"))).set_index('etapa').loc['carga_raw']
+    assert carga['rejeitadas_periodo_invalido'] == 1 and carga['rejeitadas_uf_desconhecida'] == 1
+    assert carga['linhas_rejeitadas'] == total_rejeitadas
+
+def test_cubo_agregado_equivale_a_tabela_detalhada(banco_etl):
+    from src.utils.agregados_utils import consulta_roteada, consulta_contagem_por_idade, estatisticas_idade
+
+    conexao = duckdb.connect(str(banco_etl['banco']), read_only=True)
+    try:
+        assert conexao.execute("SELECT SUM(total_registros) FROM prescricoes_agregado").fetchone()[0] == \
+            conexao.execute("SELECT COUNT(*) FROM prescricoes").fetchone()[0]
+        principio = conexao.execute("SELECT principio_ativo FROM prescricoes GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+        modelos = [
+            ("SELECT {registros}, {quantidade} FROM {tabela} {where};", []),
+            ("SELECT strftime(data, '%Y-%m-01') AS m, {quantidade} FROM {tabela} {where} GROUP BY m ORDER BY m;", ['data']),
+            ("SELECT ano, faixa_etaria, {registros} FROM {tabela} {where} GROUP BY ALL ORDER BY ALL;", ['ano', 'faixa_etaria']),
+        ]
+        for filtros in ({'ano': ['2019', '2020']}, {'faixa_etaria': ['Adulto (25-59)'], 'principio_ativo': [principio]}):
+            for modelo, dimensoes in modelos:
+                sql_cubo, params, tabela = consulta_roteada(conexao, modelo, filtros, dimensoes)
+                # 'idade' não é dimensão do cubo: a mesma consulta volta para a tabela detalhada
+                sql_base, _, tabela_base = consulta_roteada(conexao, modelo, filtros, dimensoes + ['idade'])
+                assert (tabela, tabela_base) == ('prescricoes_agregado', 'prescricoes')
+                # Com a existência do cubo já conhecida, a consulta é montada sem conexão
+                assert consulta_roteada(None, modelo, filtros, dimensoes, agregado=True) == (sql_cubo, params, tabela)
+                assert consulta_roteada(None, modelo, filtros, dimensoes, agregado=False)[2] == 'prescricoes'
+                cubo, base = conexao.execute(sql_cubo, params).fetchall(), conexao.execute(sql_base, params).fetchall()
+                assert [tuple(round(v, 2) if isinstance(v, float) else v for v in l) for l in cubo] == \
+                       [tuple(round(v, 2) if isinstance(v, float) else v for v in l) for l in base]
+            media, mediana = estatisticas_idade(conexao.execute(*consulta_contagem_por_idade(conexao, filtros)).fetchdf())
+            where_sql, params = consulta_roteada(conexao, "{where}", filtros)[:2]
+            esperado = conexao.execute(f"SELECT AVG(idade), MEDIAN(idade) FROM prescricoes {where_sql} AND idade IS NOT NULL", params).fetchone()
+            assert media == pytest.approx(esperado[0]) and mediana == pytest.approx(esperado[1])
+    finally:
+        conexao.close()
+
+def test_cache_consultas_lru_disco_e_versao(tmp_path):
+    from src.utils.cache_consultas_utils import CacheConsultas, chave_consulta
+
+    conexao = duckdb.connect()
+    conexao.execute("CREATE TABLE t AS SELECT range AS x, 'a  b' AS s FROM range(10000)")
+    assert chave_consulta("SELECT  x\n FROM t;", [1], 'v1') == chave_consulta("SELECT x FROM t", [1], 'v1')
+    assert chave_consulta("SELECT 'a  b'", [], 'v1') != chave_consulta("SELECT 'a b'", [], 'v1')
+    assert chave_consulta("SELECT x FROM t", [1], 'v1') not in (chave_consulta("SELECT x FROM t", [2], 'v1'), chave_consulta("SELECT x FROM t", [1], 'v2'))
+
+    def consultar(cache, sql, versao):
+        # Mesmo fluxo de consultar_df (database_utils), sem o pool do Streamlit
+        chave = chave_consulta(sql, [], versao)
+        tabela = cache.obter(chave, versao)
+        if tabela is None:
+            tabela = conexao.execute(sql).to_arrow_table()
+            cache.guardar(chave, versao, tabela)
+        return tabela
+
+    cache = CacheConsultas(max_bytes=100_000, pasta=tmp_path / "cache")
+    consultas = [f"SELECT x FROM t WHERE x % {n} = 0" for n in (1, 2, 3)]
+    for sql in consultas:
+        consultar(cache, sql, 'v1')
+    assert cache.estatisticas()['bytes'] <= 100_000 and cache.estatisticas()['entradas'] < 3
+    # Outra instância (ex.: após reinício) reaproveita os resultados gravados em disco, sem executar
+    conexao.execute("DELETE FROM t")
+    outro = CacheConsultas(max_bytes=100_000, pasta=tmp_path / "cache")
+    assert consultar(outro, consultas[0], 'v1').num_rows == 10_000
+    assert outro.estatisticas()['acertos'] == 1
+    # Nova versão dos dados: a consulta é refeita e o disco da versão anterior é apagado
+    assert consultar(outro, consultas[0], 'v2').num_rows == 0
+    assert len([p for p in (tmp_path / "cache").iterdir() if p.is_dir()]) == 1
+    conexao.close()
+
+def test_multimetricas_em_uma_consulta_grouping_sets(banco_etl):
+    from src.utils.agregados_utils import consulta_multimetricas, separar_conjuntos
+
+    conexao = duckdb.connect(str(banco_etl['banco']), read_only=True)
+    try:
+        conexao.execute("CREATE TEMP VIEW prescricoes_detalhe AS SELECT * FROM prescricoes")
+        conjuntos = {'geral': (), 'municipio': ('nome_municipio',), 'principio_ano': ('principio_ativo', 'ano'), 'ano': ('ano',), 'anos': ('ano',)}
+        medidas = {'total': "{registros}", 'quantidade': "{quantidade}", 'municipios_unicos': "COUNT(DISTINCT nome_municipio)"}
+        filtros = {'faixa_etaria': ['Adulto (25-59)', 'Idoso (65+)']}
+        for tabela, esperada in (('prescricoes', 'prescricoes_agregado'), ('prescricoes_detalhe', 'prescricoes_detalhe')):
+            sql, params, usada = consulta_multimetricas(conexao, conjuntos, medidas, filtros, tabela=tabela)
+            assert usada == esperada and sql.count("GROUPING SETS") == 1
+            partes = separar_conjuntos(conexao.execute(sql, params).fetchdf(), conjuntos)
+            where = "WHERE ano IN (2019, 2020) AND faixa_etaria IN ('Adulto (25-59)', 'Idoso (65+)')"
+            assert tuple(partes['geral'].iloc[0][['total', 'municipios_unicos']]) == \
+                conexao.execute(f"SELECT COUNT(*), COUNT(DISTINCT nome_municipio) FROM prescricoes {where}").fetchone()
+            assert partes['geral'].iloc[0]['quantidade'] == pytest.approx(conexao.execute(f"SELECT SUM(quantidade_vendida) FROM prescricoes {where}").fetchone()[0])
+            for nome, colunas in (('municipio', "nome_municipio"), ('principio_ano', "principio_ativo, ano"), ('anos', "ano")):
+                obtido = sorted(tuple(l) for l in partes[nome][list(conjuntos[nome]) + ['total']].itertuples(index=False))
+                assert obtido == sorted(conexao.execute(f"SELECT {colunas}, COUNT(*) FROM prescricoes {where} GROUP BY ALL").fetchall())
+            assert partes['ano'].equals(partes['anos'])
+    finally:
+        conexao.close()
+
+def test_pool_cursores_limitado_reentrante_e_com_reconexao(tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.utils.pool_cursores_utils import PoolCursores
+
+    caminho = tmp_path / "pool.duckdb"
+    with duckdb.connect(str(caminho)) as conexao:
+        conexao.execute("CREATE TABLE t AS SELECT range AS x FROM range(100000)")
+    pool = PoolCursores(lambda: duckdb.connect(str(caminho), read_only=True), 2, timeout_s=0.2,
+                        preparar=lambda c: c.execute("CREATE TEMP VIEW pares AS SELECT x FROM t WHERE x % 2 = 0"))
+
+    def soma(resto):
+        with pool.cursor() as cursor:
+            return cursor.execute("SELECT SUM(x) FROM pares WHERE x % 8 = ?", [resto]).fetchone()[0]
+
+    try:
+        # Consultas em paralelo, cada uma no seu cursor; a view temporária existe em todos eles
+        restos = [0, 2, 4, 6] * 3
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            assert list(executor.map(soma, restos)) == [sum(range(r, 100000, 8)) for r in restos]
+        assert pool.cursores_criados <= 2
+        # Pool cheio: outra thread espera timeout_s e desiste; na mesma thread o cursor é reaproveitado
+        ocupado, liberar = threading.Event(), threading.Event()
+        def segurar():
+            with pool.cursor():
+                ocupado.set()
+                liberar.wait()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            segurando = executor.submit(segurar)
+            ocupado.wait()
+            with pool.cursor() as cursor, pool.cursor() as aninhado:
+                assert cursor is aninhado
+                with pytest.raises(TimeoutError):
+                    executor.submit(soma, 0).result()
+            liberar.set()
+            segurando.result()
+        # Cursor que caiu é trocado no empréstimo seguinte; conexão base fechada é reaberta
+        with pool.cursor() as cursor:
+            pass
+        cursor.close()
+        assert soma(0) == sum(range(0, 100000, 8)) and pool.cursores_descartados == 1
+        pool._conexao.close()
+        assert soma(2) == sum(range(2, 100000, 8))
+        # Fechado com um cursor emprestado: a consulta em andamento termina, e o pool não empresta mais
+        with pool.cursor() as cursor:
+            pool.fechar()
+            assert cursor.execute("SELECT COUNT(*) FROM pares").fetchone()[0] == 50000
+        with pytest.raises(RuntimeError):
+            soma(4)
     finally:
-        conexao.close()
\ No newline at end of file
+        pool.fechar()